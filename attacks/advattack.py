@@ -12,6 +12,9 @@ import torchvision
 import numpy as np
 import art.attacks.evasion
 from utils.savepng import save_image
+from evaluations.accuracy import EvaluateAccuracyFromTensor
+from attacks.torchattack import TorchAttack
+from attacks.advstore import AdvStore, SaveAdvSet
 import copy
 import os
 from torch import LongTensor
@@ -32,42 +35,68 @@ class AdvAttack():
         self._whitebox
         self._artmodel
         self._advgenmodel
+        self._torchattack: native torch attack when --attack_engine torch, else None
 
         methods:
         self.__init__()
+        self.refresh(learned_model)
         self.__getartmodel__()
         self.__getadvgenmodel__()
+        self.__gettorchattack__()
+        self.__generateadv__(x_set, y_set)
+        self.generatewarmstart(x_set, y_set, x_init, max_iter)
+        self.generatechunked(exp_result_dir, dataloader, split)
    
     """
     def __init__(self, args, learned_model) -> None:                 
         print('initlize attack classifier')
-        if args.latentattack == False:   
+        self._args = args
+        self.__build__(learned_model)
+
+    def __build__(self, learned_model):
+        if self._args.latentattack == False:   
             print("generate pixel adversarial exampels")
-            self._args = args
             self._targetmodel = learned_model         
             if self._args.whitebox == True:
-                self._model = copy.deepcopy(learned_model)
+                self._model = learned_model if self._args.attack_reference else copy.deepcopy(learned_model)
             elif self._args.blackbox == True:
                 self._model = torchvision.models.resnet34(pretrained=True)
 
             self._lossfunc = self.__getlossfunc__()
             self._optimizer = self.__getoptimizer__()
 
-            self._artmodel = self.__getartmodel__()
-
-            self._advgenmodel = self.__getadvgenmodel__()
+            if self.__usetorchattack__():
+                self._torchattack = self.__gettorchattack__()
+            else:
+                self._torchattack = None
+                self._artmodel = self.__getartmodel__()
+                self._advgenmodel = self.__getadvgenmodel__()
 
-        elif args.latentattack == True:
+        elif self._args.latentattack == True:
             print("generate latent adversarial exampels")
-            self._args = args
             self._targetmodel = learned_model  
             if self._args.whitebox == True:
-                self._model = copy.deepcopy(learned_model)
+                self._model = learned_model if self._args.attack_reference else copy.deepcopy(learned_model)
             elif self._args.blackbox == True:
                 self._model = torchvision.models.resnet34(pretrained=True)
 
             self._attacker = self.__getadvertorchmodel__() 
 
+    def refresh(self, learned_model):
+        """
+        Attack the current weights of learned_model without rebuilding the attacker.
+        The whitebox shadow copy loads the state dict in place, so the art wrapper and the attack object keep pointing at it.
+        With --attack_reference learned_model is attacked directly, only a different model object needs a rebuild.
+        """
+        if self._args.whitebox != True or self._model is learned_model:
+            self._targetmodel = learned_model
+            return
+        if self._args.attack_reference:
+            self.__build__(learned_model)
+            return
+        self._targetmodel = learned_model
+        self._model.load_state_dict(learned_model.state_dict())
+
     def __getadvertorchmodel__(self):  
         if self._args.attack_mode =='pgd':
             print("latent pgd attack")
@@ -147,12 +176,55 @@ class AdvAttack():
 
         return artmodel
 
+    def __usetorchattack__(self):
+        return self._args.attack_engine == 'torch' and self._args.attack_mode in ['fgsm','bim','pgd','cw']
+
+    def __attackparams__(self):
+        """
+        Iterative attack parameters, unset ones take the art defaults (max_iter 10 for cw, 100 for bim / pgd).
+        batch_size is only present if --attack_batch_size is set.
+        """
+        default_max_iter = 10 if self._args.attack_mode == 'cw' else 100
+        params = {
+            'eps_step': self._args.attack_eps_step if self._args.attack_eps_step is not None else 0.1,
+            'max_iter': self._args.attack_max_iter if self._args.attack_max_iter is not None else default_max_iter,
+            'norm': self._args.attack_norm,
+            'num_random_init': self._args.attack_random_init,
+        }
+        if self._args.attack_batch_size is not None:
+            params['batch_size'] = self._args.attack_batch_size
+        return params
+
+    def __batchsize__(self, params):
+        return {'batch_size': params['batch_size']} if 'batch_size' in params else {}
+
+    def __gettorchattack__(self) -> "TorchAttack":
+        if torch.cuda.is_available():
+            self._model.cuda()
+        print(f'Get native torch {self._args.attack_mode} examples generate model')
+        params = self.__attackparams__()
+        if self._args.attack_mode == 'cw':
+            return TorchAttack(self._model, 'cw', self._args.attack_eps, max_iter=params['max_iter'], confidence=self._args.confidence, **self.__batchsize__(params))
+        return TorchAttack(self._model, self._args.attack_mode, self._args.attack_eps, **params)
+
+    def __generateadv__(self, x_set, y_set):
+        """
+        Adversarial examples of a tensor set as cuda tensors: the native torch engine attacks device batches directly,
+        the art engine goes through numpy.
+        """
+        if self._torchattack is not None:
+            return self._torchattack.generate(x_set, y_set), torch.as_tensor(y_set).cuda()
+        x_adv = self._advgenmodel.generate(x = x_set.cpu().numpy(), y = y_set.cpu().numpy())
+        return torch.from_numpy(x_adv).cuda(), y_set.cuda()
+
     def __getadvgenmodel__(self) -> "art.attacks.evasion":
+        params = self.__attackparams__()
+        norm = np.inf if params['norm'] == 'inf' else 2
         
         if self._args.attack_mode == 'fgsm':                              
             print('Get FGSM examples generate model')
             print("self._args.attack_eps:",self._args.attack_eps)
-            advgenmodel = art.attacks.evasion.FastGradientMethod(estimator=self._artmodel, eps=self._args.attack_eps, targeted=False)    
+            advgenmodel = art.attacks.evasion.FastGradientMethod(estimator=self._artmodel, norm=norm, eps=self._args.attack_eps, targeted=False, num_random_init=params['num_random_init'], **self.__batchsize__(params))    
 
         elif self._args.attack_mode =='deepfool':                         
             print('Get DeepFool examples generate model')
@@ -160,14 +232,14 @@ class AdvAttack():
 
         elif self._args.attack_mode =='bim':                              
             print('Get BIM(PGD) examples generate model')
-            advgenmodel = art.attacks.evasion.BasicIterativeMethod(estimator=self._artmodel, eps=self._args.attack_eps, targeted=False)  
+            advgenmodel = art.attacks.evasion.BasicIterativeMethod(estimator=self._artmodel, eps=self._args.attack_eps, eps_step=params['eps_step'], max_iter=params['max_iter'], targeted=False, **self.__batchsize__(params))  
 
         elif self._args.attack_mode =='cw':                               
             print('Get CW examples generate model')
-            advgenmodel = art.attacks.evasion.CarliniL2Method(classifier=self._artmodel, confidence=self._args.confidence, targeted=False)               
+            advgenmodel = art.attacks.evasion.CarliniL2Method(classifier=self._artmodel, confidence=self._args.confidence, targeted=False, max_iter=params['max_iter'], **self.__batchsize__(params))               
         
         elif self._args.attack_mode =='pgd': 
-            advgenmodel = art.attacks.evasion.ProjectedGradientDescent(estimator=self._artmodel, eps=self._args.attack_eps, targeted=False)   
+            advgenmodel = art.attacks.evasion.ProjectedGradientDescent(estimator=self._artmodel, norm=norm, eps=self._args.attack_eps, eps_step=params['eps_step'], max_iter=params['max_iter'], targeted=False, num_random_init=params['num_random_init'], **self.__batchsize__(params))   
 
         elif self._args.attack_mode =='autoattack':   
             advgenmodel = art.attacks.evasion.AutoAttack(estimator=self._artmodel, eps=self._args.attack_eps, estimator_orig=self._artmodel, targeted=False)
@@ -180,6 +252,15 @@ class AdvAttack():
     def getexpresultdir(self):
         return self._exp_result_dir
     
+    def generatewarmstart(self, x_set, y_set, x_init, max_iter):
+        """
+        Adversarial examples of x_set whose bim / pgd iterations start from x_init instead of the clean images,
+        with max_iter steps. Only the native torch engine supports it.
+        """
+        if self._args.latentattack == True or self._torchattack is None or self._args.attack_mode not in ['bim', 'pgd']:
+            raise Exception('warm started attacks need --attack_engine torch and a bim or pgd pixel attack')
+        return self._torchattack.generate(x_set, y_set, x_init, max_iter), torch.as_tensor(y_set).cuda()
+
     def generate(self, exp_result_dir, test_dataloader, train_dataloader = None) -> "Tensor":
         if train_dataloader is not None:
             self._train_dataloader = train_dataloader
@@ -202,18 +283,11 @@ class AdvAttack():
             print("self._x_test.shape:",self._x_test.shape)
             print("self._y_test.shape:",self._y_test.shape)
 
-            self._x_train = self._x_train.cpu().numpy()                            
-            self._y_train = self._y_train.cpu().numpy()
-            self._x_test = self._x_test.cpu().numpy()
-            self._y_test = self._y_test.cpu().numpy()
-
             print('generating trainset adversarial examples...')
-            self._x_train_adv = self._advgenmodel.generate(x = self._x_train, y = self._y_train)
-            self._y_train_adv = self._y_train
+            self._x_train_adv, self._y_train_adv = self.__generateadv__(self._x_train, self._y_train)
             print('finished generate trainset adversarial examples !')
             print('generating testset adversarial examples...')
-            self._x_test_adv = self._advgenmodel.generate(x = self._x_test, y = self._y_test)
-            self._y_test_adv = self._y_test
+            self._x_test_adv, self._y_test_adv = self.__generateadv__(self._x_test, self._y_test)
             print('finished generate testset adversarial examples !')
 
             print("self._x_train_adv.shape:",self._x_train_adv.shape)
@@ -221,15 +295,10 @@ class AdvAttack():
             print("self._x_test_adv.shape:",self._x_test_adv.shape)
             print("self._y_test_adv.shape:",self._y_test_adv.shape)
 
-            self._x_train_adv = torch.from_numpy(self._x_train_adv).cuda()
-            self._y_train_adv = torch.from_numpy(self._y_train_adv).cuda()
-            self._x_test_adv = torch.from_numpy(self._x_test_adv).cuda()
-            self._y_test_adv = torch.from_numpy(self._y_test_adv).cuda()
-
-            self._x_train = torch.from_numpy(self._x_train).cuda()
-            self._y_train = torch.from_numpy(self._y_train).cuda()
-            self._x_test = torch.from_numpy(self._x_test).cuda()
-            self._y_test = torch.from_numpy(self._y_test).cuda()
+            self._x_train = self._x_train.cuda()
+            self._y_train = self._y_train.cuda()
+            self._x_test = self._x_test.cuda()
+            self._y_test = self._y_test.cuda()
 
             self.__saveadvpng__()
 
@@ -244,21 +313,58 @@ class AdvAttack():
 
             self._x_test, self._y_test = self.__getsettensor__(self._test_dataloader)
 
-            self._x_test = self._x_test.cpu().numpy()
-            self._y_test = self._y_test.cpu().numpy()
+            self._x_test_adv, self._y_test_adv = self.__generateadv__(self._x_test, self._y_test)
 
-            self._x_test_adv = self._advgenmodel.generate(x = self._x_test, y = self._y_test)
-            self._y_test_adv = self._y_test
-
-            self._x_test_adv = torch.from_numpy(self._x_test_adv).cuda()
-            self._y_test_adv = torch.from_numpy(self._y_test_adv).cuda()
-
-            self._x_test = torch.from_numpy(self._x_test).cuda()
-            self._y_test = torch.from_numpy(self._y_test).cuda()
+            self._x_test = self._x_test.cuda()
+            self._y_test = self._y_test.cuda()
 
             self.__saveadvpng__()
             return self._x_test_adv, self._y_test_adv    
 
+    def __storemeta__(self, split):
+        params = self.__attackparams__()
+        params.pop('batch_size', None)
+        return {
+            'dataset': self._args.dataset, 'split': split, 'attack_mode': self._args.attack_mode, 'attack_eps': self._args.attack_eps,
+            'confidence': self._args.confidence, 'attack_engine': self._args.attack_engine, 'whitebox': self._args.whitebox,
+            'cla_network_pkl': getattr(self._args, 'cla_network_pkl', None), **params,
+        }
+
+    def generatechunked(self, exp_result_dir, dataloader, split = 'test'):
+        """
+        Attack dataloader.dataset in chunks of --adv_chunk_size samples into an AdvStore under
+        {exp_result_dir}/attack-{dataset}-dataset/samples/{split}. At most one chunk and the model are in memory,
+        every chunk is recorded as done right after it is written, so running again on the same result dir (--resume)
+        skips the finished chunks. Unlike generate() the whole split is attacked, including the imagenetmixed10 trainset.
+        :returns: the store, target model accuracy and loss on the whole adversarial set
+        """
+        self._exp_result_dir = os.path.join(exp_result_dir, f'attack-{self._args.dataset}-dataset')
+        store_dir = os.path.join(self._exp_result_dir, 'samples', split)
+
+        dataset = dataloader.dataset
+        set_num = len(dataset)
+        store = AdvStore(store_dir, set_num, self._args.adv_chunk_size, tuple(dataset[0][0].shape), self._args.adv_shard_size, self.__storemeta__(split), self._args.adv_store_dtype)
+        missing_chunks = store.missingchunks()
+        print(f"{split}set adversarial store {store_dir}: {store.chunknum() - len(missing_chunks)}/{store.chunknum()} chunks already generated")
+
+        for chunk_index in missing_chunks:
+            chunk_range = store.chunkrange(chunk_index)
+            x_chunk = torch.stack([dataset[img_index][0] for img_index in chunk_range])
+            y_chunk = LongTensor([int(dataset[img_index][1]) for img_index in chunk_range])
+            x_chunk_adv, y_chunk_adv = self.__generateadv__(x_chunk.cuda(), y_chunk.cuda())
+            store.writechunk(chunk_index, x_chunk_adv, y_chunk_adv, x_chunk)
+            print(f"generated {split}set adversarial chunk {chunk_index + 1}/{store.chunknum()} ({chunk_range.stop}/{set_num} samples)")
+            del x_chunk, y_chunk, x_chunk_adv, y_chunk_adv
+
+        correct_num = 0.0
+        loss_sum = 0.0
+        for chunk_index in range(store.chunknum()):
+            x_chunk_adv, y_chunk_adv = store.chunk(chunk_index, dataset)
+            chunk_accuracy, chunk_loss = EvaluateAccuracyFromTensor(self._targetmodel, x_chunk_adv, y_chunk_adv, self._args.batch_size)
+            correct_num += chunk_accuracy * len(y_chunk_adv)
+            loss_sum += chunk_loss * len(y_chunk_adv)
+        return store, correct_num / set_num, loss_sum / set_num
+
     def generatelatentadv(self,exp_result_dir, cle_test_dataloader, cle_w_test, cle_y_test, gan_net):
         self._exp_result_dir = exp_result_dir
         self._exp_result_dir = os.path.join(self._exp_result_dir,f'attack-{self._args.dataset}-dataset')
@@ -327,44 +433,23 @@ class AdvAttack():
         return label_names
 
     def __saveadvpng__(self):
-
+        """
+        Save the generated sets as AdvStores (one mmap-able npy per set, labels stored, not parsed from file names),
+        readable with LoadAdvSet() / RMClassifier.getadvset().
+        """
         if self._args.latentattack == False:   
 
-            classification = self.__labelnames__() 
-            print("label_names:",classification)        
-            
-            os.makedirs(f'{self._exp_result_dir}/samples/train/',exist_ok=True)    
-            os.makedirs(f'{self._exp_result_dir}/samples/test/',exist_ok=True)    
-
-            if self._args.dataset != "imagenetmixed10":
+            if self._args.dataset != "imagenetmixed10" and getattr(self, "_x_train_adv", None) is not None:
                 print(f"Saving {self._args.dataset} trainset adversarial examples...")
-                for img_index, _ in enumerate(self._x_train_adv):
-                    save_adv_img = self._x_train_adv[img_index]
-                    img_true_label = self._y_train_adv[img_index]
-                
-                    np.savez(f'{self._exp_result_dir}/samples/train/{img_index:08d}-adv-{img_true_label}-{classification[int(img_true_label)]}.npz', w=save_adv_img.cpu().numpy())      
+                SaveAdvSet(f'{self._exp_result_dir}/samples/train', self._x_train_adv, self._y_train_adv, self._args.adv_store_dtype, self.__storemeta__('train'), self._args.adv_shard_size, self._x_train)
              
             print(f"Saving {self._args.dataset} testset adversarial examples...")            
-            for img_index, _ in enumerate(self._x_test_adv):
-                save_adv_img = self._x_test_adv[img_index]
-                img_true_label = self._y_test_adv[img_index]
-
-                np.savez(f'{self._exp_result_dir}/samples/test/{img_index:08d}-adv-{img_true_label}-{classification[int(img_true_label)]}.npz', w=save_adv_img.cpu().numpy())      
+            SaveAdvSet(f'{self._exp_result_dir}/samples/test', self._x_test_adv, self._y_test_adv, self._args.adv_store_dtype, self.__storemeta__('test'), self._args.adv_shard_size, self._x_test)
 
         elif self._args.latentattack == True: 
-            classification = self.__labelnames__() 
-            print("label_names:",classification)  
-
-            os.makedirs(f'{self._exp_result_dir}/latent-attack-samples/train/',exist_ok=True)    
-            os.makedirs(f'{self._exp_result_dir}/latent-attack-samples/test/',exist_ok=True)    
-
             print(f"Saving {self._args.dataset} trainset adversarial examples...")
-            for img_index, _ in enumerate(self._x_test_adv):
-                save_adv_img = self._x_test_adv[img_index]
-                img_true_label = self._y_test_adv[img_index]
+            SaveAdvSet(f'{self._exp_result_dir}/latent-attack-samples/train', self._x_test_adv, self._y_test_adv, self._args.adv_store_dtype, self.__storemeta__('train'), self._args.adv_shard_size)
 
-                np.savez(f'{self._exp_result_dir}/latent-attack-samples/train/{img_index:08d}-adv-{img_true_label}-{classification[int(img_true_label)]}.npz', w=save_adv_img.cpu().numpy())    
-            
         print("save adversarial examples finished")
 
     def generateadvfromtestsettensor(self, testset_tensor_x, testset_tensor_y, exp_result_dir = None):
@@ -376,68 +461,17 @@ class AdvAttack():
         self._x_test = testset_tensor_x
         self._y_test = testset_tensor_y
 
-        self._x_test = self._x_test.cpu().numpy()
-        self._y_test = self._y_test.cpu().numpy()
-
         print('generating testset adversarial examples...')
-        self._x_test_adv = self._advgenmodel.generate(x = self._x_test, y = self._y_test)
-        self._y_test_adv = self._y_test
+        self._x_test_adv, self._y_test_adv = self.__generateadv__(self._x_test, self._y_test)
         print('finished generate testset adversarial examples !')
 
-        self._x_test_adv = torch.from_numpy(self._x_test_adv).cuda()
-        self._y_test_adv = torch.from_numpy(self._y_test_adv).cuda()
-
-        self._x_test = torch.from_numpy(self._x_test).cuda()
-        self._y_test = torch.from_numpy(self._y_test).cuda()
+        self._x_test = self._x_test.cuda()
+        self._y_test = self._y_test.cuda()
 
         return self._x_test_adv, self._y_test_adv          
 
-    def evaluatefromtensor(self, classifier, x_set:Tensor, y_set:Tensor):
-        classifier.eval()       
-        if torch.cuda.is_available():
-            classifier.cuda()             
-        
-        batch_size = self._args.batch_size
-        testset_total_num = len(x_set)
-        batch_num = int( np.ceil( int(testset_total_num) / float(batch_size) ) )
-        cla_model_name=self._args.cla_model
-        eva_loss = torch.nn.CrossEntropyLoss()
-        epoch_correct_num = 0
-        epoch_total_loss = 0
-
-        for batch_index in range(batch_num):                                               
-            images = x_set[batch_index * batch_size : (batch_index + 1) * batch_size]
-            labels = y_set[batch_index * batch_size : (batch_index + 1) * batch_size]                                                
-
-            imgs = images.cuda()
-            labs = labels.cuda()
-
-            with torch.no_grad():
-
-                if cla_model_name == 'inception_v3':
-                    output, aux = classifier(imgs)
-                
-                elif cla_model_name == 'googlenet':
-                    if self._args.dataset == 'imagenetmixed10' or self._args.dataset == 'kmnist' or self._args.dataset == 'cifar10' or self._args.dataset == 'svhn':  
-                        output = classifier(imgs)
-                    else:
-                        output, aux1, aux2 = classifier(imgs)
-                else:
-                    output = classifier(imgs)         
-                                
-                loss = eva_loss(output,labs)
-                _, predicted_label_index = torch.max(output.data, 1)       
-                
-                batch_same_num = (predicted_label_index == labs).sum().item()
-                epoch_correct_num += batch_same_num
-                epoch_total_loss += loss
-
-
-        test_accuracy = epoch_correct_num / testset_total_num
-        test_loss = epoch_total_loss / batch_num                  
-        classifier.train()
-
-        return test_accuracy, test_loss
+    def evaluatefromtensor(self, classifier, x_set:Tensor, y_set:Tensor, return_logits=False):
+        return EvaluateAccuracyFromTensor(classifier, x_set, y_set, self._args.batch_size, return_logits)
 
     def __getsettensor__(self,dataloader)->"Tensor":
 
@@ -0,0 +1,346 @@
+"""
+Author: maggie
+Date:   2022-06-15
+Place:  Xidian University
+@copyright
+"""
+
+import os
+import json
+import numpy as np
+import torch
+
+def AdvStoreExists(store_dir):
+    return store_dir is not None and os.path.exists(os.path.join(store_dir, 'advstore.json'))
+
+def SaveAdvSet(store_dir, x_set, y_set, x_dtype = 'float32', meta = None, shard_size = None, clean_x_set = None, clean_num = None):
+    """
+    Write a whole adversarial set (float images, hard labels) as one AdvStore chunk.
+    uint8 quantizes over the value range of x_set, int8delta stores x_set - clean_x_set (sample i of x_set attacks clean sample i).
+    """
+    x_range = (min(0.0, float(x_set.min())), max(1.0, float(x_set.max()))) if x_dtype == 'uint8' else (0.0, 1.0)
+    store = AdvStore(store_dir, len(x_set), len(x_set), tuple(x_set.shape[1:]), shard_size, meta, x_dtype, x_range, clean_num or len(x_set))
+    store.writechunk(0, x_set, y_set, clean_x_set)
+    return store
+
+def LoadAdvNpzSet(adv_dataset_path, kind = 'adv'):
+    """
+    Legacy adversarial set of one {index:08d}-{kind}-{label}-{label name}.npz file per sample.
+    """
+    filenames = sorted(name for name in os.listdir(adv_dataset_path) if os.path.splitext(name)[-1] == '.npz' and name.split('-')[1:2] == [kind])
+    if len(filenames) == 0:
+        raise Exception(f'there is no {kind} npz sample in {adv_dataset_path}')
+    x_set = np.stack([np.load(os.path.join(adv_dataset_path, filename))['w'] for filename in filenames])
+    y_set = np.asarray([int(filename.split('-')[2]) for filename in filenames], dtype=np.int64)          #   multi digit labels (cifar100) included
+    return torch.from_numpy(x_set), torch.from_numpy(y_set)
+
+def LoadAdvSet(adv_dataset_path, kind = 'adv', clean_source = None):
+    """
+    (x, y) cpu tensors of an adversarial set dir, an AdvStore or a legacy per-sample npz dir.
+    clean_source (clean x tensor or dataset of the attacked split) is needed for int8delta stores,
+    their x is an AdvStoreView decoded batch by batch when indexed.
+    """
+    if AdvStoreExists(adv_dataset_path):
+        store = AdvStore(adv_dataset_path)
+        if store.x_dtype == 'int8delta':
+            return store.view(clean_source)
+        return store.load()
+    return LoadAdvNpzSet(adv_dataset_path, kind)
+
+def SubsetAdvSet(x_set, index):
+    """
+    x_set[index], an AdvStoreView stays lazy.
+    """
+    if isinstance(x_set, AdvStoreView):
+        return x_set.subset(index)
+    return x_set[index]
+
+def CatAdvSets(x_sets):
+    """
+    torch.cat of adversarial x sets along the samples, AdvStoreViews are joined into one lazy view.
+    """
+    if any(isinstance(x_set, AdvStoreView) for x_set in x_sets):
+        return AdvStoreView.cat(x_sets)
+    return torch.cat(x_sets, dim=0)
+
+class AdvStore:
+    r"""
+        Adversarial set saved as sharded npy arrays under store_dir, written at once or filled chunk by chunk.
+        advstore.json keeps the layout, the attack settings and the finished chunks, it is rewritten after every chunk,
+        so an interrupted generation continues at the first missing chunk. A stored set is read back through np.load mmaps.
+        Images are stored as float32, float16, uint8 (quantized over x_range) or int8delta: the perturbation against
+        the clean image as int8 with a per-sample scale max|delta|/127 plus the clean sample index, rebuilt batch by batch
+        from the clean split on read (error at most scale/2, eps/254 for L-inf attacks). Labels are stored as int64.
+
+        attributes:
+            store_dir, set_num, chunk_size, shard_size, x_shape, x_dtype, x_range
+            clean_num: size of the attacked clean split, int8delta reads check the clean source against it
+            meta: attack settings, a resumed store must have been generated with the same ones
+
+        methods:
+            missingchunks(): indices of the chunks not written yet
+            chunkrange(chunk_index): sample index range of a chunk
+            writechunk(chunk_index, x, y, clean_x): store a chunk of float images and hard labels
+            chunk(chunk_index, clean_source): (x, y) float32 / int64 cpu tensors of a chunk
+            batches(batch_size, clean_source): (x, y) batches of the whole set
+            load(clean_source): the whole set as (x, y) cpu tensors
+            view(clean_source): the whole set as (AdvStoreView, y), nothing is decoded until indexed
+    """
+    def __init__(self, store_dir, set_num = None, chunk_size = None, x_shape = None, shard_size = None, meta = None,
+                 x_dtype = 'float32', x_range = (0.0, 1.0), clean_num = None) -> None:
+
+        self._store_dir = store_dir
+        self._meta_path = os.path.join(store_dir, 'advstore.json')
+
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path) as f:
+                layout = json.load(f)
+            if set_num is not None and (layout['set_num'] != set_num or layout['chunk_size'] != chunk_size or layout['meta'] != meta or layout['x_dtype'] != x_dtype):
+                raise Exception(f'the adversarial store in {store_dir} was generated with other settings, please use another result dir')
+            mode = 'r+' if set_num is not None else 'c'                                                 #   readers get copy on write mmaps
+        else:
+            if set_num is None or chunk_size is None or x_shape is None:
+                raise Exception(f'there is no adversarial store in {store_dir}, please generate it first')
+            if x_dtype not in ['float32', 'float16', 'uint8', 'int8delta']:
+                raise Exception('please input valid adversarial store dtype: float32, float16, uint8 or int8delta')
+            layout = {'set_num': set_num, 'chunk_size': chunk_size, 'shard_size': shard_size or set_num, 'x_shape': list(x_shape),
+                      'x_dtype': x_dtype, 'x_range': list(x_range), 'clean_num': clean_num or set_num, 'meta': meta, 'done': []}
+            mode = 'w+'
+
+        self.set_num = layout['set_num']
+        self.chunk_size = layout['chunk_size']
+        self.shard_size = layout['shard_size']
+        self.x_shape = tuple(layout['x_shape'])
+        self.x_dtype = layout['x_dtype']
+        self.x_range = tuple(layout['x_range'])
+        self.clean_num = layout.get('clean_num', self.set_num)
+        self.meta = layout['meta']
+        self._done = set(layout['done'])
+
+        fields = {'x': (np.int8 if self.x_dtype == 'int8delta' else np.dtype(self.x_dtype), self.x_shape), 'y': (np.int64, ())}
+        if self.x_dtype == 'int8delta':
+            fields['scale'] = (np.float32, ())
+            fields['index'] = (np.int64, ())
+
+        self._shards = {field: [] for field in fields}
+        for shard_index, shard_start in enumerate(range(0, self.set_num, self.shard_size)):
+            shard_len = min(self.shard_size, self.set_num - shard_start)
+            for field, (dtype, shape) in fields.items():
+                path = os.path.join(store_dir, f'{shard_index:08d}-adv-{field}.npy')
+                if mode == 'w+':
+                    os.makedirs(store_dir, exist_ok=True)
+                    shard = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(shard_len,) + shape)
+                else:
+                    shard = np.load(path, mmap_mode=mode)
+                self._shards[field].append(shard)
+
+        if mode == 'w+':
+            self.__savelayout__()
+
+    def __len__(self):
+        return self.set_num
+
+    def chunknum(self):
+        return (self.set_num + self.chunk_size - 1) // self.chunk_size
+
+    def chunkrange(self, chunk_index):
+        return range(chunk_index * self.chunk_size, min((chunk_index + 1) * self.chunk_size, self.set_num))
+
+    def missingchunks(self):
+        return [chunk_index for chunk_index in range(self.chunknum()) if chunk_index not in self._done]
+
+    def __savelayout__(self):
+        layout = {'set_num': self.set_num, 'chunk_size': self.chunk_size, 'shard_size': self.shard_size, 'x_shape': list(self.x_shape),
+                  'x_dtype': self.x_dtype, 'x_range': list(self.x_range), 'clean_num': self.clean_num, 'meta': self.meta, 'done': sorted(self._done)}
+        tmp_path = self._meta_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(layout, f)
+        os.replace(tmp_path, self._meta_path)                                                          #   a crash never leaves a half written progress file
+
+    def __encode__(self, x, clean_x = None):
+        x = x.detach().cpu().float()
+        if self.x_dtype == 'int8delta':
+            if clean_x is None:
+                raise Exception('int8delta adversarial storage needs the clean images of the attacked samples')
+            delta = x - clean_x.detach().cpu().float()
+            scale = (delta.flatten(1).abs().amax(dim=1) / 127).clamp(min=1e-12)
+            delta = (delta / scale.view(-1, *([1] * (delta.dim() - 1)))).round().clamp(-127, 127).to(torch.int8)
+            return {'x': delta.numpy(), 'scale': scale.numpy()}
+        if self.x_dtype == 'uint8':
+            x_min, x_max = self.x_range
+            return {'x': ((x - x_min) / (x_max - x_min) * 255).round().clamp(0, 255).to(torch.uint8).numpy()}
+        return {'x': x.to(getattr(torch, self.x_dtype)).numpy()}
+
+    def __checkclean__(self, clean_source):
+        if clean_source is None:
+            raise Exception(f'the adversarial store in {self._store_dir} holds int8 deltas, please pass the clean images of the attacked split')
+        if len(clean_source) != self.clean_num:
+            raise Exception(f'the adversarial store in {self._store_dir} was generated from a split of {self.clean_num} samples, the clean source has {len(clean_source)}')
+
+    def __checkdone__(self):
+        if len(self.missingchunks()) > 0:
+            raise Exception(f'the adversarial store in {self._store_dir} is incomplete, please finish generating it first')
+
+    def __cleanbatch__(self, clean_source, index):
+        self.__checkclean__(clean_source)
+        if torch.is_tensor(clean_source):
+            return clean_source[torch.from_numpy(index).to(clean_source.device)].cpu().float()
+        return torch.stack([clean_source[int(clean_index)][0] for clean_index in index]).float()
+
+    def __decode__(self, arrays, clean_source = None):
+        x = torch.from_numpy(arrays['x'])
+        if self.x_dtype == 'int8delta':
+            scale = torch.from_numpy(arrays['scale']).view(-1, *([1] * (x.dim() - 1)))
+            return (self.__cleanbatch__(clean_source, arrays['index']) + x.float() * scale).clamp(*self.x_range)     #   the rounded delta may leave the image range
+        if self.x_dtype == 'uint8':
+            x_min, x_max = self.x_range
+            return x.float() / 255 * (x_max - x_min) + x_min
+        return x.float()
+
+    def __read__(self, index):
+        """
+        Fields of the samples at index, in the order of index (which may be unsorted and span shards).
+        """
+        shard_of = index // self.shard_size
+        arrays = {field: np.empty((len(index),) + shards[0].shape[1:], dtype=shards[0].dtype) for field, shards in self._shards.items()}
+        for shard_index in np.unique(shard_of):
+            select = shard_of == shard_index
+            rows = index[select] % self.shard_size
+            for field, shards in self._shards.items():
+                arrays[field][select] = shards[shard_index][rows]
+        return arrays
+
+    def writechunk(self, chunk_index, x, y, clean_x = None, clean_index = None):
+        """
+        clean_index: positions of the attacked samples in the clean split, default the chunk range
+        """
+        index = np.asarray(self.chunkrange(chunk_index))
+        arrays = self.__encode__(x, clean_x)
+        arrays['y'] = y.detach().cpu().long().numpy()
+        if self.x_dtype == 'int8delta':
+            arrays['index'] = np.asarray(clean_index if clean_index is not None else index, dtype=np.int64)
+        for shard_index in np.unique(index // self.shard_size):
+            select = (index // self.shard_size) == shard_index
+            rows = index[select] % self.shard_size
+            for field, values in arrays.items():
+                self._shards[field][shard_index][rows] = values[select]
+                self._shards[field][shard_index].flush()
+        self._done.add(chunk_index)
+        self.__savelayout__()
+
+    def chunk(self, chunk_index, clean_source = None):
+        arrays = self.__read__(np.asarray(self.chunkrange(chunk_index)))
+        return self.__decode__(arrays, clean_source), torch.from_numpy(arrays['y'])
+
+    def batches(self, batch_size, clean_source = None):
+        for batch_start in range(0, self.set_num, batch_size):
+            arrays = self.__read__(np.arange(batch_start, min(batch_start + batch_size, self.set_num)))
+            yield self.__decode__(arrays, clean_source), torch.from_numpy(arrays['y'])
+
+    def load(self, clean_source = None, batch_size = 1024):
+        """
+        The whole set, a single float32 shard is returned as a view of its mmap without a copy,
+        int8delta sets are rebuilt batch by batch into one float tensor.
+        """
+        self.__checkdone__()
+        if self.x_dtype == 'int8delta':
+            x = torch.empty((self.set_num,) + self.x_shape)
+            for batch_start in range(0, self.set_num, batch_size):
+                arrays = self.__read__(np.arange(batch_start, min(batch_start + batch_size, self.set_num)))
+                x[batch_start : batch_start + len(arrays['y'])] = self.__decode__(arrays, clean_source)
+            return x, torch.from_numpy(np.concatenate(self._shards['y']))
+        if len(self._shards['x']) == 1:
+            return self.__decode__({'x': self._shards['x'][0]}), torch.from_numpy(self._shards['y'][0])
+        x = self.__decode__({'x': np.concatenate(self._shards['x'])})
+        y = torch.from_numpy(np.concatenate(self._shards['y']))
+        return x, y
+
+    def view(self, clean_source = None):
+        """
+        (AdvStoreView, y): the images stay in the store and are decoded only for the indexed samples.
+        """
+        self.__checkdone__()
+        if self.x_dtype == 'int8delta':
+            self.__checkclean__(clean_source)
+        return AdvStoreView([(self, clean_source, np.arange(self.set_num))]), torch.from_numpy(np.concatenate(self._shards['y']))
+
+class AdvStoreView:
+    r"""
+        Float32 cpu x set of one or more AdvStores that is never materialized: indexing it with an int, a slice or an
+        index tensor / array reads only the selected samples from the store mmaps (and the clean source of int8delta
+        stores) and returns them as a tensor, so the training and evaluation loops can use it in place of an x tensor set.
+
+        attributes:
+            shape, dtype, device: those of the float set the view stands for
+            parts: (store, clean_source, store sample indices) the view is made of, one after another
+
+        methods:
+            subset(index): view of the selected samples, nothing is decoded
+            cat(x_sets): view of several views one after another
+            cuda(): the whole set decoded batch by batch into one device tensor
+    """
+    def __init__(self, parts) -> None:
+        if len(parts) == 0:
+            raise Exception('please input at least one adversarial store')
+        x_shapes = set(store.x_shape for store, _, _ in parts)
+        if len(x_shapes) > 1:
+            raise Exception(f'adversarial stores of different image shapes {sorted(x_shapes)} can not be joined')
+        self.parts = parts
+        self._offsets = np.cumsum([0] + [len(store_index) for _, _, store_index in parts])
+        self.shape = torch.Size((int(self._offsets[-1]),) + parts[0][0].x_shape)
+        self.dtype = torch.float32
+        self.device = torch.device('cpu')
+
+    def __len__(self):
+        return self.shape[0]
+
+    def numel(self):
+        return int(np.prod(self.shape))
+
+    def element_size(self):
+        return 4
+
+    def __positions__(self, index):
+        if isinstance(index, slice):
+            return np.arange(*index.indices(len(self)))
+        if torch.is_tensor(index):
+            index = index.cpu().numpy()
+        index = np.asarray(index)
+        if index.dtype == bool:
+            return np.nonzero(index)[0]
+        return np.where(index < 0, index + len(self), index).astype(np.int64)
+
+    def __getitem__(self, index):
+        positions = self.__positions__(index)
+        x = torch.empty((positions.size,) + self.shape[1:])
+        part_of = np.searchsorted(self._offsets, positions.reshape(-1), side='right') - 1
+        for part_index in np.unique(part_of):
+            store, clean_source, store_index = self.parts[part_index]
+            select = part_of == part_index
+            arrays = store.__read__(store_index[positions.reshape(-1)[select] - self._offsets[part_index]])
+            x[torch.from_numpy(select)] = store.__decode__(arrays, clean_source)
+        return x.view(positions.shape + self.shape[1:])
+
+    def subset(self, index):
+        positions = self.__positions__(index).reshape(-1)
+        part_of = np.searchsorted(self._offsets, positions, side='right') - 1
+        parts = []
+        run_starts = np.flatnonzero(np.diff(part_of, prepend=-1))                                       #   runs of positions in one part keep their order
+        for run_start, run_end in zip(run_starts, list(run_starts[1:]) + [len(positions)]):
+            store, clean_source, store_index = self.parts[part_of[run_start]]
+            parts.append((store, clean_source, store_index[positions[run_start : run_end] - self._offsets[part_of[run_start]]]))
+        if len(parts) == 0:
+            parts.append((self.parts[0][0], self.parts[0][1], np.arange(0)))
+        return AdvStoreView(parts)
+
+    @staticmethod
+    def cat(x_sets):
+        if not all(isinstance(x_set, AdvStoreView) for x_set in x_sets):
+            raise Exception('lazy adversarial sets can only be joined with other lazy adversarial sets')
+        return AdvStoreView([part for x_set in x_sets for part in x_set.parts])
+
+    def cuda(self, batch_size = 1024):
+        x = torch.empty(self.shape, device='cuda')
+        for batch_start in range(0, len(self), batch_size):
+            x[batch_start : batch_start + batch_size] = self[batch_start : batch_start + batch_size].cuda()
+        return x
@@ -0,0 +1,127 @@
+"""
+Author: maggie
+Date:   2022-06-15
+Place:  Xidian University
+@copyright
+"""
+
+import time
+import click
+import numpy as np
+import torch
+import art.attacks.evasion
+from art.estimators.classification import PyTorchClassifier
+from attacks.torchattack import TorchAttack
+
+#----------------------------------------------------------------------------
+
+def SmallConvNet(n_classes):
+    return torch.nn.Sequential(
+        torch.nn.Conv2d(3, 16, 3, padding=1), torch.nn.ReLU(), torch.nn.MaxPool2d(2),
+        torch.nn.Conv2d(16, 32, 3, padding=1), torch.nn.ReLU(), torch.nn.MaxPool2d(2),
+        torch.nn.Flatten(), torch.nn.Linear(32 * 8 * 8, n_classes),
+    )
+
+def ARTAttack(model, attack_mode, eps, eps_step, max_iter, norm, confidence, batch_size, n_classes):
+    artmodel = PyTorchClassifier(
+        model=model,
+        clip_values=(0.0, 1.0),
+        loss=torch.nn.CrossEntropyLoss(),
+        optimizer=torch.optim.SGD(model.parameters(), lr=0.01),
+        input_shape=(3, 32, 32),
+        nb_classes=n_classes,
+    )
+    art_norm = np.inf if norm == 'inf' else 2
+    if attack_mode == 'fgsm':
+        return art.attacks.evasion.FastGradientMethod(estimator=artmodel, norm=art_norm, eps=eps, targeted=False, batch_size=batch_size)
+    elif attack_mode == 'bim':
+        return art.attacks.evasion.BasicIterativeMethod(estimator=artmodel, eps=eps, eps_step=eps_step, max_iter=max_iter, targeted=False, batch_size=batch_size)
+    elif attack_mode == 'pgd':
+        return art.attacks.evasion.ProjectedGradientDescent(estimator=artmodel, norm=art_norm, eps=eps, eps_step=eps_step, max_iter=max_iter, targeted=False, num_random_init=0, batch_size=batch_size)
+    elif attack_mode == 'cw':
+        return art.attacks.evasion.CarliniL2Method(classifier=artmodel, confidence=confidence, max_iter=max_iter, targeted=False, batch_size=batch_size)
+    raise Exception('please input valid attack mode: fgsm, bim, pgd or cw')
+
+def AttackSummary(model, x_set, y_set, x_adv):
+    """
+    :returns: success rate on the correctly classified samples, mean L2 distortion of the successful ones
+    """
+    with torch.no_grad():
+        clean_correct = model(x_set).argmax(dim=1) == y_set
+        adv_wrong = model(x_adv).argmax(dim=1) != y_set
+    success = clean_correct & adv_wrong
+    success_rate = success.sum().item() / max(1, clean_correct.sum().item())
+    l2 = (x_adv - x_set).flatten(1).norm(dim=1)
+    mean_l2 = l2[success].mean().item() if success.any() else 0.0
+    return success_rate, mean_l2
+
+#----------------------------------------------------------------------------
+
+@click.command()
+@click.option('--samples', help='Random test images', type=int, default=256, show_default=True)
+@click.option('--n_classes', type=int, default=10, show_default=True)
+@click.option('--eps', type=float, default=0.03, show_default=True)
+@click.option('--eps_step', type=float, default=0.01, show_default=True)
+@click.option('--max_iter', help='Iterations of bim / pgd / cw', type=int, default=10, show_default=True)
+@click.option('--confidence', type=float, default=0.0, show_default=True)
+@click.option('--batch_size', type=int, default=64, show_default=True)
+@click.option('--tol', help='Allowed max abs difference of the gradient attacks', type=float, default=1e-4, show_default=True)
+@click.option('--seed', type=int, default=0, show_default=True)
+def check_attacks(samples, n_classes, eps, eps_step, max_iter, confidence, batch_size, tol, seed):
+    """Cross-check the native torch attack engine against ART on a small random model.
+
+    FGSM, BIM and PGD (L-inf and L2, no random start) must agree element-wise within --tol,
+    CW-L2 is an independent implementation and is compared by success rate and mean L2 distortion.
+
+    Example:
+
+    \b
+    python -m attacks.attackcheck --samples=512 --max_iter=20
+    """
+    torch.manual_seed(seed)
+    np.random.seed(seed)
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    model = SmallConvNet(n_classes).to(device).eval()
+    x_set = torch.rand(samples, 3, 32, 32, device=device)
+    with torch.no_grad():
+        y_set = model(x_set).argmax(dim=1)                                                              #   every sample starts correctly classified
+
+    failed = []
+    for attack_mode, norm in [('fgsm', 'inf'), ('fgsm', '2'), ('bim', 'inf'), ('pgd', 'inf'), ('pgd', '2'), ('cw', '2')]:
+        attack_eps = eps if norm == 'inf' else eps * 10
+        attack_eps_step = eps_step if norm == 'inf' else eps_step * 10
+
+        art_start = time.perf_counter()
+        artattack = ARTAttack(model, attack_mode, attack_eps, attack_eps_step, max_iter, norm, confidence, batch_size, n_classes)
+        art_adv = torch.from_numpy(artattack.generate(x=x_set.cpu().numpy(), y=y_set.cpu().numpy())).to(device)
+        art_seconds = time.perf_counter() - art_start
+
+        torch_start = time.perf_counter()
+        torchattack = TorchAttack(model, attack_mode, attack_eps, eps_step=attack_eps_step, max_iter=max_iter, norm=norm, confidence=confidence, batch_size=batch_size)
+        torch_adv = torchattack.generate(x_set, y_set)
+        if device == 'cuda':
+            torch.cuda.synchronize()
+        torch_seconds = time.perf_counter() - torch_start
+
+        art_success, art_l2 = AttackSummary(model, x_set, y_set, art_adv)
+        torch_success, torch_l2 = AttackSummary(model, x_set, y_set, torch_adv)
+        print(f'{attack_mode:4s} L{norm:3s} art: {art_seconds:7.2f}s success {art_success * 100:6.2f}% l2 {art_l2:.4f} | '
+              f'torch: {torch_seconds:7.2f}s success {torch_success * 100:6.2f}% l2 {torch_l2:.4f}', end='')
+        if attack_mode == 'cw':
+            print()
+            continue
+        max_diff = (art_adv - torch_adv).abs().max().item()
+        print(f' | max abs difference {max_diff:.2e}')
+        if max_diff > tol:
+            failed.append(f'{attack_mode} L{norm}')
+
+    if len(failed) > 0:
+        raise Exception(f'torch attack engine differs from art: {", ".join(failed)}')
+    print('torch attack engine matches art')
+
+#----------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    check_attacks() # pylint: disable=no-value-for-parameter
+
+#----------------------------------------------------------------------------
@@ -8,6 +8,8 @@ import os
 import torch
 import numpy as np
 from utils.savepng import save_image
+from attacks.advstore import SaveAdvSet
+from evaluations.accuracy import EvaluateAccuracyFromTensor
 from torch import LongTensor
 
 Tensor = torch.Tensor
@@ -147,15 +149,9 @@ class PerAttack():
 
     def __saveperpng__(self):
         if self._args.latentattack == False:      
-            classification = self.__labelnames__() 
-            os.makedirs(f'{self._exp_result_dir}/samples/test/',exist_ok=True)    
             print(f"Saving {self._args.dataset} testset perceptual attack examples...")
-            for img_index, _ in enumerate(self._x_test_per):
-                save_per_img = self._x_test_per[img_index]
-                save_cle_img = self._x_test[img_index]
-                img_true_label = self._y_test_per[img_index]
-                np.savez(f'{self._exp_result_dir}/samples/test/{img_index:08d}-per-{img_true_label}-{classification[int(img_true_label)]}.npz', w=save_per_img.cpu().detach().numpy())      
-                 
+            meta = {'dataset': self._args.dataset, 'split': 'test', 'attack_mode': self._args.attack_mode, 'cla_network_pkl': getattr(self._args, 'cla_network_pkl', None)}
+            SaveAdvSet(f'{self._exp_result_dir}/samples/test', self._x_test_per, self._y_test_per, self._args.adv_store_dtype, meta, self._args.adv_shard_size, self._x_test)
 
     def __getsettensor__(self,dataloader)->"Tensor":
 
@@ -241,53 +237,8 @@ class PerAttack():
             yset_tensor = LongTensor(yset_tensor)                       
         return yset_tensor.cuda()       
 
-    def evaluatefromtensor(self, classifier, x_set:Tensor, y_set:Tensor):
-        classifier.eval()  
-        if torch.cuda.is_available():
-            classifier.cuda()             
-        
-        batch_size = self._args.batch_size
-        testset_total_num = len(x_set)
-        batch_num = int( np.ceil( int(testset_total_num) / float(batch_size) ) )
-        cla_model_name=self._args.cla_model
-
-        eva_loss = torch.nn.CrossEntropyLoss()
-        epoch_correct_num = 0
-        epoch_total_loss = 0
-
-        for batch_index in range(batch_num):                                               
-            images = x_set[batch_index * batch_size : (batch_index + 1) * batch_size]
-            labels = y_set[batch_index * batch_size : (batch_index + 1) * batch_size]                                                
-
-            imgs = images.cuda()
-            labs = labels.cuda()
-
-            with torch.no_grad():
-
-                if cla_model_name == 'inception_v3':
-                    output, aux = classifier(imgs)
-                
-                elif cla_model_name == 'googlenet':
-                    if self._args.dataset == 'imagenetmixed10' or self._args.dataset == 'svhn' or self._args.dataset == 'kmnist' or self._args.dataset == 'cifar10':              
-                        output = classifier(imgs)
-                    else:
-                        output, aux1, aux2 = classifier(imgs)
-                else:
-                    output = classifier(imgs)         
-                                
-                loss = eva_loss(output,labs)
-                _, predicted_label_index = torch.max(output.data, 1)  
-                
-                batch_same_num = (predicted_label_index == labs).sum().item()
-                epoch_correct_num += batch_same_num
-                epoch_total_loss += loss
-
-
-        test_accuracy = epoch_correct_num / testset_total_num
-        test_loss = epoch_total_loss / batch_num                  
-        classifier.train()
-
-        return test_accuracy, test_loss
+    def evaluatefromtensor(self, classifier, x_set:Tensor, y_set:Tensor, return_logits=False):
+        return EvaluateAccuracyFromTensor(classifier, x_set, y_set, self._args.batch_size, return_logits)
 
     def getexpresultdir(self):
         return self._exp_result_dir
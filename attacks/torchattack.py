@@ -0,0 +1,191 @@
+"""
+Author: maggie
+Date:   2022-06-15
+Place:  Xidian University
+@copyright
+"""
+
+import math
+import torch
+
+class TorchAttack:
+    r"""
+        Untargeted FGSM, BIM / PGD (L-inf or L2, random start) and CW-L2 on device tensors, without the numpy
+        round trips of ART. FGSM and PGD with num_random_init > 0 start from random points of the eps ball and keep,
+        per sample, the first restart that fools the model. Gradients are taken with torch.autograd.grad with respect to the input batch only,
+        every update and projection runs under torch.no_grad. The update, projection and clipping order of the
+        gradient attacks follow ART's FastGradientMethod / ProjectedGradientDescentPyTorch, so for the same parameters
+        and no random start both engines give the same examples (see attacks/attackcheck.py).
+
+        attributes:
+            model: attacked module, returns logits
+            attack_mode: 'fgsm', 'bim', 'pgd' or 'cw'
+            eps, eps_step, max_iter, norm ('inf' or '2'), num_random_init: gradient attacks, bim is pgd with norm 'inf' and no random start
+            confidence, learning_rate, binary_search_steps, initial_const: cw
+            clip_min, clip_max: valid input range
+            batch_size: samples per attack batch
+
+        methods:
+            generate(x_set, y_set, x_init, max_iter): adversarial examples of x_set (cpu or device tensor) on the device of the model,
+                bim / pgd start from x_init (e.g. the examples of an earlier model) and run max_iter steps if given
+    """
+    def __init__(self, model, attack_mode, eps, eps_step = 0.1, max_iter = 100, norm = 'inf', num_random_init = 0,
+                 confidence = 0.0, learning_rate = 0.01, binary_search_steps = 10, initial_const = 0.01,
+                 clip_min = 0.0, clip_max = 1.0, batch_size = 256) -> None:
+        if attack_mode not in ['fgsm', 'bim', 'pgd', 'cw']:
+            raise Exception('please input valid torch attack mode: fgsm, bim, pgd or cw')
+        if norm not in ['inf', '2']:
+            raise Exception('please input valid attack norm: inf or 2')
+        self.model = model
+        self.attack_mode = attack_mode
+        self.eps = eps
+        self.eps_step = eps_step
+        self.max_iter = max_iter
+        self.norm = 'inf' if attack_mode == 'bim' else norm
+        self.num_random_init = 0 if attack_mode == 'bim' else num_random_init
+        self.confidence = confidence
+        self.learning_rate = learning_rate
+        self.binary_search_steps = binary_search_steps
+        self.initial_const = initial_const
+        self.clip_min = clip_min
+        self.clip_max = clip_max
+        self.batch_size = batch_size
+        self._tol = 10e-8                                                                               #   same tolerance as art
+
+    def generate(self, x_set, y_set, x_init = None, max_iter = None):
+        if x_init is not None and self.attack_mode not in ['bim', 'pgd']:
+            raise Exception('only bim and pgd attacks can start from given examples')
+        device = next(self.model.parameters()).device
+        y_set = torch.as_tensor(y_set)
+        if y_set.dim() > 1:                                                                             #   one hot / soft labels
+            y_set = y_set.argmax(dim=1)
+
+        was_training = self.model.training
+        self.model.eval()
+        x_adv = []
+        for batch_start in range(0, len(x_set), self.batch_size):
+            x = x_set[batch_start : batch_start + self.batch_size].to(device, non_blocking=True).float()
+            y = y_set[batch_start : batch_start + self.batch_size].to(device, non_blocking=True).long()
+            if x_init is not None:
+                start = x_init[batch_start : batch_start + self.batch_size].to(device, non_blocking=True).float()
+                x_adv.append(self.__pgd__(x, y, start, max_iter))
+            elif self.attack_mode == 'cw':
+                x_adv.append(self.__cw__(x, y))
+            elif self.attack_mode == 'fgsm':
+                x_adv.append(self.__fgsm__(x, y))
+            else:
+                x_adv.append(self.__pgd__(x, y, max_iter=max_iter))
+        self.model.train(was_training)
+        return torch.cat(x_adv)
+
+    def __lossgradient__(self, x_adv, y):
+        x_adv = x_adv.detach().requires_grad_(True)
+        loss = torch.nn.functional.cross_entropy(self.model(x_adv), y)
+        grad, = torch.autograd.grad(loss, x_adv)                                                        #   no parameter gradients are accumulated
+        return torch.nan_to_num(grad)
+
+    def __samplenorm__(self, tensor):
+        return tensor.flatten(1).norm(dim=1).view(-1, *([1] * (tensor.dim() - 1)))
+
+    def __normalize__(self, grad):
+        if self.norm == 'inf':
+            return grad.sign()
+        return grad / (self.__samplenorm__(grad) + self._tol)
+
+    def __project__(self, perturbation):
+        if self.norm == 'inf':
+            return perturbation.clamp(-self.eps, self.eps)
+        return perturbation * torch.clamp(self.eps / (self.__samplenorm__(perturbation) + self._tol), max=1.0)
+
+    def __randominit__(self, x):
+        if self.norm == 'inf':
+            noise = torch.empty_like(x).uniform_(-self.eps, self.eps)
+        else:                                                                                           #   uniform in the L2 ball
+            direction = torch.randn_like(x)
+            direction = direction / (self.__samplenorm__(direction) + self._tol)
+            radius = torch.rand(len(x), device=x.device).pow(1.0 / x[0].numel()).view(-1, *([1] * (x.dim() - 1)))
+            noise = direction * radius * self.eps
+        return (x + noise).clamp(self.clip_min, self.clip_max)
+
+    def __restarts__(self, x, y, attack, num_random_init):
+        """
+        attack(x_start) from the clean x, or once per random start in the eps ball, keeping the first restart that fools each sample.
+        """
+        if num_random_init <= 1:
+            return attack(self.__randominit__(x) if num_random_init > 0 else x.clone())
+        best_adv = x.clone()
+        best_fooled = torch.zeros(len(x), dtype=torch.bool, device=x.device)
+        for init_index in range(num_random_init):
+            x_adv = attack(self.__randominit__(x))
+            with torch.no_grad():
+                fooled = self.model(x_adv).argmax(dim=1) != y
+                take = fooled & ~best_fooled if init_index > 0 else torch.ones_like(fooled)
+                best_adv[take] = x_adv[take]
+                best_fooled |= fooled
+        return best_adv
+
+    def __step__(self, x, y, x_adv, step):
+        grad = self.__normalize__(self.__lossgradient__(x_adv, y))
+        with torch.no_grad():
+            x_adv = (x_adv + step * grad).clamp(self.clip_min, self.clip_max)
+            return x + self.__project__(x_adv - x)
+
+    def __fgsm__(self, x, y):
+        return self.__restarts__(x, y, lambda x_start: self.__step__(x, y, x_start, self.eps).detach(), self.num_random_init)
+
+    def __pgd__(self, x, y, start = None, max_iter = None):
+        max_iter = self.max_iter if max_iter is None else max_iter
+
+        def attack(x_adv):
+            for _ in range(max_iter):
+                x_adv = self.__step__(x, y, x_adv, self.eps_step)
+            return x_adv.detach()
+
+        if start is not None:                                                                           #   warm start, projected into the eps ball of x
+            return attack(x + self.__project__(start.clamp(self.clip_min, self.clip_max) - x))
+        return self.__restarts__(x, y, attack, self.num_random_init)
+
+    def __cw__(self, x, y):
+        """
+        Carlini & Wagner L2: Adam in tanh space on ||x' - x||^2 + c * max(z_y - max_{i!=y} z_i + confidence, 0),
+        binary search over c per sample, the smallest successful perturbation is kept (x itself if none succeeds).
+        """
+        batch_num = len(x)
+        lower = torch.zeros(batch_num, device=x.device)
+        upper = torch.full((batch_num,), 1e10, device=x.device)
+        const = torch.full((batch_num,), self.initial_const, device=x.device)
+        best_l2 = torch.full((batch_num,), math.inf, device=x.device)
+        best_adv = x.clone()
+        with torch.no_grad():
+            onehot = torch.nn.functional.one_hot(y, self.model(x[:1]).size(1)).float()
+
+        x_unit = ((x - self.clip_min) / (self.clip_max - self.clip_min)).clamp(0, 1)
+        w_init = torch.atanh((x_unit * 2 - 1) * 0.999999)
+
+        for _ in range(self.binary_search_steps):
+            w = w_init.clone().requires_grad_(True)
+            optimizer = torch.optim.Adam([w], lr=self.learning_rate)
+            succeeded = torch.zeros(batch_num, dtype=torch.bool, device=x.device)
+            for _ in range(self.max_iter):
+                x_new = (torch.tanh(w) + 1) / 2 * (self.clip_max - self.clip_min) + self.clip_min
+                logits = self.model(x_new)
+                l2 = (x_new - x).flatten(1).pow(2).sum(dim=1)
+                real = (logits * onehot).sum(dim=1)
+                other = (logits - onehot * 1e4).max(dim=1).values
+                margin = real - other + self.confidence
+                loss = (l2 + const * margin.clamp(min=0)).sum()
+                w.grad, = torch.autograd.grad(loss, w)
+                optimizer.step()
+
+                with torch.no_grad():
+                    success = (margin <= 0) & (logits.argmax(dim=1) != y)
+                    improved = success & (l2 < best_l2)
+                    best_l2 = torch.where(improved, l2.detach(), best_l2)
+                    best_adv[improved] = x_new.detach()[improved]
+                    succeeded |= success
+
+            with torch.no_grad():
+                upper = torch.where(succeeded, torch.minimum(upper, const), upper)
+                lower = torch.where(succeeded, lower, torch.maximum(lower, const))
+                const = torch.where(upper < 1e9, (lower + upper) / 2, const * 10)
+        return best_adv
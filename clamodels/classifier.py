@@ -11,7 +11,8 @@ from torch.functional import Tensor
 from torch.nn.modules.loss import CrossEntropyLoss
 import torchvision
 import torch
-from evaluations.accuracy import EvaluateAccuracy
+from evaluations.accuracy import EvaluateAccuracy, EvaluateAccuracyFromTensor
+from evaluations.robustschedule import RobustEvalScheduler, WarmStartTracker, WilsonInterval
 from utils.saveplt import SaveAccuracyCurve
 from utils.saveplt import SaveLossCurve
 from art.estimators.classification import PyTorchClassifier
@@ -21,87 +22,16 @@ import os
 import math
 import random
 import copy
+import time
 from attacks.advattack import AdvAttack
+from attacks.advstore import LoadAdvSet, AdvStoreView
 from clamodels import comparemodels
 
-from tensorboardX import SummaryWriter
-from genmodels.mixgenerate import MixGenerate
-from torch.autograd import Variable
-from utils import puzzle
-
-def mixup_box(out, y, lam, index):
-    '''CutMix'''
-    input1=out
-    input2=out[index]
-    target1=y
-    target2=y[index]
-
-    batch_size, _, height, width = input1.shape
-    ratio = np.zeros([batch_size])
-
-    rx = np.random.uniform(0, height)
-    ry = np.random.uniform(0, width)
-    rh = np.sqrt(1 - lam) * height
-    rw = np.sqrt(1 - lam) * width
-
-    x1 = int(np.clip(rx - rh / 2, a_min=0., a_max=height))
-    x2 = int(np.clip(rx + rh / 2, a_min=0., a_max=height))
-    y1 = int(np.clip(ry - rw / 2, a_min=0., a_max=width))
-    y2 = int(np.clip(ry + rw / 2, a_min=0., a_max=width))
-
-    input1[:, :, x1:x2, y1:y2] = input2[:, :, x1:x2, y1:y2]
-    ratio += 1 - (x2 - x1) * (y2 - y1) / (width * height)
-    ratio = torch.tensor(ratio, dtype=torch.float32)
-    ratio = ratio.cuda()
-
-    mixed_x = input1
-    mixed_y = ratio.unsqueeze(-1) * target1 + (1 - ratio.unsqueeze(-1)) * target2
-
-    return mixed_x, mixed_y
-
-def cut_mixup_data(out, y, beta_alpha):
-    alpha=beta_alpha
-    lam = np.random.beta(alpha, alpha)                              
-    batch_size = out.size()[0]
-    index = torch.randperm(batch_size).cuda()                      
-    mix_x_train, mix_y_train = mixup_box(out, y, lam=lam, index=index)
-
-    return mix_x_train, mix_y_train
-
-def puzzle_mixup_data(out, y, beta_alpha, grad):
-    alpha=beta_alpha
-    lam = np.random.beta(alpha, alpha)                              
-    batch_size = out.size()[0]
-    index = torch.randperm(batch_size).cuda()                       
-    block_num = 2**np.random.randint(1, 5)                          
-    out, mixed_y = puzzle.mixup_graph(out=out, y=y, grad=grad, alpha=alpha, lam=lam, index=index, block_num=block_num, transport=True, std=1, mean=0)
-
-    return out, mixed_y
-
-
-def mixup_data(args, exp_result_dir, stylegan2ada_config_kwargs, inputs, targets):
-    if args.gen_network_pkl != None:     
-
-        generate_model = MixGenerate(args, exp_result_dir, stylegan2ada_config_kwargs)
-        generate_model.cle_w_train = inputs
-        generate_model.cle_y_train = targets
-        mix_w_train, mix_y_train = generate_model.interpolate()                                                        
-        generate_model.mix_w_train = mix_w_train    
-        generate_model.mix_y_train = mix_y_train
-        mix_x_train, mix_y_train = generate_model.generate()
-
-    else:
-        raise Exception("There is no gen_network_pkl, please load generative model first!")   
-    
-    return mix_x_train, mix_y_train
-
-def input_mixup_data(args, raw_img_batch, raw_lab_batch):
-    lam = np.random.beta(args.beta_alpha, args.beta_alpha)
-    batch_size = raw_img_batch.size()[0]
-    index = torch.randperm(batch_size).cuda()   
-    mixed_img_batch = lam * raw_img_batch + (1 - lam) * raw_img_batch[index, :]
-    mixed_lab_batch = lam * raw_lab_batch + (1 - lam) * raw_lab_batch[index, :]
-    return mixed_img_batch,mixed_lab_batch 
+from utils.metricsink import MetricSink
+from utils.checkpoint import CheckpointManager, GetRNGState, SetRNGState
+from clamodels.defensepolicy import mixup_data, input_mixup_data, cut_mixup_data, puzzle_mixup_data
+from datas.deviceloader import DeviceTensorLoader, FitsOnDevice
+from clamodels.defensepolicy import LatentMixupPolicy, InputMixupPolicy, AdversarialPolicy, ManifoldMixupPolicy, PuzzleMixupPolicy, CutMixupPolicy
 
 def smooth_step(a,b,c,d,epoch_index):
     if epoch_index <= a:        #   <=10
@@ -282,10 +212,25 @@ class RMClassifier:
         
         # initilize the optimizer
         self._optimizer = self.__getoptimizer__()
+
+        self._metrics = None
+        self._checkpoints = None
+        self._scaler = None
+        self._attacker = None
     
     def model(self) -> "torchvision.models or CustomNet":
         return self._model
 
+    def attacker(self) -> "AdvAttack":
+        """
+        Attacker of the current model, built once per classifier and refreshed with the current weights on later calls.
+        """
+        if self._attacker is None:
+            self._attacker = AdvAttack(self._args, self._model)
+        else:
+            self._attacker.refresh(self._model)
+        return self._attacker
+
     def __getmodel__(self) -> "torchvision.models or CustomNet":
         model_name = self._args.cla_model
         torchvisionmodel_dict = ['resnet34','resnet50','densenet169','inception_v3','resnet18','googlenet'] 
@@ -425,58 +370,62 @@ class RMClassifier:
         global_train_acc, global_test_acc, global_train_loss, global_test_loss = self.__trainloop__()
         
         if train_mode == "std-train":
-            torch.save(self._model,f'{self._exp_result_dir}/standard-trained-classifier-{self._args.cla_model}-on-clean-{self._args.dataset}-finished.pkl')
+            self.__getcheckpoints__().save(f'standard-trained-classifier-{self._args.cla_model}-on-clean-{self._args.dataset}-finished.pkl', self._model, self._optimizer, managed=False)
             accuracy_png_name = f'standard trained classifier {self._args.cla_model} accuracy on clean {self._args.dataset}'
             loss_png_name = f'standard trained classifier {self._args.cla_model} loss on clean {self._args.dataset}'
         
         elif train_mode == "adv-train":     
-            torch.save(self._model,f'{self._exp_result_dir}/adversarial-trained-classifier-{self._args.cla_model}-on-adv-{self._args.dataset}-finished.pkl')
+            self.__getcheckpoints__().save(f'adversarial-trained-classifier-{self._args.cla_model}-on-adv-{self._args.dataset}-finished.pkl', self._model, self._optimizer, managed=False)
             accuracy_png_name = f'adversarial trained classifier {self._args.cla_model} accuracy on adversarial {self._args.dataset}'
             loss_png_name = f'adversarial trained classifier {self._args.cla_model} loss on adversarial {self._args.dataset}'
 
         SaveAccuracyCurve(self._args.cla_model, self._args.dataset, self._exp_result_dir, global_train_acc, global_test_acc, accuracy_png_name)
         SaveLossCurve(self._args.cla_model, self._args.dataset, self._exp_result_dir, global_train_loss, global_test_loss, loss_png_name)
+        self.__getcheckpoints__().flush()
 
         return self._model
 
     def __trainloop__(self):
 
-        global_train_acc = []
-        global_test_acc = []
-        global_train_loss = []
-        global_test_loss = []
+        resume = self.__loadresume__()
+        global_train_acc = self.__resumevalue__(resume, 'global_train_acc', [])
+        global_test_acc = self.__resumevalue__(resume, 'global_test_acc', [])
+        global_train_loss = self.__resumevalue__(resume, 'global_train_loss', [])
+        global_test_loss = self.__resumevalue__(resume, 'global_test_loss', [])
 
-        for epoch_index in range(self._args.epochs):
+        for epoch_index in range(resume['epoch'] if resume is not None else 0, self._args.epochs):
+            epoch_start = self.__epochstart__(epoch_index, resume, None)
             
             self.__adjustlearningrate__(epoch_index)     
-            epoch_correct_num = 0
-            epoch_total_loss = 0
+            epoch_correct_num = self.__resumevalue__(resume, 'epoch_correct_num', 0, epoch_index)
+            epoch_total_loss = self.__resumevalue__(resume, 'epoch_total_loss', 0, epoch_index)
 
-            for batch_index, (images, labels) in enumerate(self._train_dataloader):
+            for batch_index, (images, labels) in self.__resumebatches__(self._train_dataloader, epoch_index, resume):
                 batch_imgs = images.cuda()
                 batch_labs = labels.cuda()
-                self._optimizer.zero_grad()
 
                 self._model.train()    
-                if self._args.cla_model == 'inception_v3':
-                    output, aux = self._model(batch_imgs)
-                elif self._args.cla_model == 'googlenet':
-                    output, aux1, aux2 = self._model(batch_imgs)
-                else:
-                    if self._args.dataset == "imagenetmixed10" and self._args.train_mode == "cla-train":
-                        output = self._model(batch_imgs, imagenetmixed10=True)
+                with self.__autocast__():
+                    if self._args.cla_model == 'inception_v3':
+                        output, aux = self._model(batch_imgs)
+                    elif self._args.cla_model == 'googlenet':
+                        output, aux1, aux2 = self._model(batch_imgs)
                     else:
-                        output = self._model(batch_imgs)
+                        if self._args.dataset == "imagenetmixed10" and self._args.train_mode == "cla-train":
+                            output = self._model(batch_imgs, imagenetmixed10=True)
+                        else:
+                            output = self._model(batch_imgs)
 
-                batch_loss = self._lossfunc(output,batch_labs)
-                batch_loss.backward()
-                self._optimizer.step()
+                    batch_loss = self._lossfunc(output,batch_labs)
+                self.__optimizerstep__(batch_loss)
                 _, predicted_label_index = torch.max(output.data, 1)   
 
                 batch_correct_num = (predicted_label_index == batch_labs).sum().item()     
                 epoch_correct_num += batch_correct_num                                     
-                epoch_total_loss += batch_loss
-                print("[Epoch %d/%d] [Batch %d/%d] [Batch classify loss: %f] " % (epoch_index+1, self._args.epochs, batch_index+1, len(self._train_dataloader), batch_loss.item()))
+                epoch_total_loss += batch_loss.detach()
+                if (batch_index + 1) % self._args.train_print_interval == 0:
+                    print("[Epoch %d/%d] [Batch %d/%d] [Batch classify loss: %f] " % (epoch_index+1, self._args.epochs, batch_index+1, len(self._train_dataloader), batch_loss.item()))
+                self.__stepresume__(epoch_index, batch_index, epoch_start, global_train_acc=global_train_acc, global_test_acc=global_test_acc, global_train_loss=global_train_loss, global_test_loss=global_test_loss, epoch_correct_num=epoch_correct_num, epoch_total_loss=epoch_total_loss)
 
             epoch_train_accuarcy = epoch_correct_num / len(self._train_dataloader.dataset)     
             epoch_train_loss = epoch_total_loss / len(self._train_dataloader)                  
@@ -492,39 +441,118 @@ class RMClassifier:
             print(f'{epoch_index+1:04d} epoch classifier loss on the entire testing examples:{epoch_test_loss:.4f}' )  
             
             if (epoch_index+1)  >= 9:
-                torch.save(self._model,f'{self._exp_result_dir}/standard-trained-classifier-{self._args.cla_model}-on-clean-{self._args.dataset}-epoch-{epoch_index+1:04d}.pkl')
+                self.__getcheckpoints__().save(f'standard-trained-classifier-{self._args.cla_model}-on-clean-{self._args.dataset}-epoch-{epoch_index+1:04d}.pkl', self._model, self._optimizer, epoch=epoch_index + 1, metric=epoch_test_accuracy)
             
-            tensorboard_log_acc_dir = os.path.join(self._exp_result_dir,f'tensorboard-log-run-acc')
-            os.makedirs(tensorboard_log_acc_dir,exist_ok=True)    
-            writer_acc = SummaryWriter(log_dir = tensorboard_log_acc_dir, comment= '-'+'testacc')
-            writer_acc.add_scalar(tag = "epoch_test_acc", scalar_value = epoch_test_accuracy, global_step = epoch_index + 1 )
-            writer_acc.close()
-
-            tensorboard_log_loss_dir = os.path.join(self._exp_result_dir,f'tensorboard-log-run-loss')
-            os.makedirs(tensorboard_log_loss_dir,exist_ok=True)    
-
-            writer_loss = SummaryWriter(log_dir = tensorboard_log_loss_dir, comment= '-'+'testloss')
-            writer_loss.add_scalar(tag = "epoch_test_loss", scalar_value = epoch_test_loss, global_step = epoch_index + 1 )
-            writer_loss.close()
-
-            tensorboard_log_train_acc_dir = os.path.join(self._exp_result_dir,f'tensorboard-log-run-train-acc')
-            os.makedirs(tensorboard_log_train_acc_dir,exist_ok=True)    
-
-            writer_train_acc = SummaryWriter(log_dir = tensorboard_log_train_acc_dir, comment= '-'+'trainacc')
-            writer_train_acc.add_scalar(tag = "epoch_train_acc", scalar_value = epoch_train_accuarcy, global_step = epoch_index + 1 )
-            writer_train_acc.close()
-           
-            tensorboard_log_train_loss_dir = os.path.join(self._exp_result_dir,f'tensorboard-log-run-train-loss')
-            os.makedirs(tensorboard_log_train_loss_dir,exist_ok=True)    
-
-            writer_train_loss = SummaryWriter(log_dir = tensorboard_log_train_loss_dir, comment= '-'+'trainloss')
-            writer_train_loss.add_scalar(tag = "epoch_train_loss", scalar_value = epoch_train_loss, global_step = epoch_index + 1 )
-            writer_train_loss.close()
+            self.__getmetrics__().scalar("epoch_test_acc", epoch_test_accuracy, epoch_index + 1)
+            self.__getmetrics__().scalar("epoch_test_loss", epoch_test_loss, epoch_index + 1)
+            self.__getmetrics__().scalar("epoch_train_acc", epoch_train_accuarcy, epoch_index + 1)
+            self.__getmetrics__().scalar("epoch_train_loss", epoch_train_loss, epoch_index + 1)
+            self.__epochresume__(epoch_index, None, global_train_acc=global_train_acc, global_test_acc=global_test_acc, global_train_loss=global_train_loss, global_test_loss=global_test_loss)
             
 
 
         return global_train_acc, global_test_acc, global_train_loss, global_test_loss
     
+    def __getmetrics__(self) -> "MetricSink":
+        """
+        One MetricSink per experiment result dir, replaced when a training method switches self._exp_result_dir.
+        """
+        if self._metrics is None or self._metrics_dir != self._exp_result_dir:
+            if self._metrics is not None:
+                self._metrics.close()
+            self._metrics = MetricSink(self._exp_result_dir, file_format=self._args.metrics_format, flush_interval=self._args.metrics_flush_interval)
+            self._metrics_dir = self._exp_result_dir
+        return self._metrics
+
+    def __getcheckpoints__(self) -> "CheckpointManager":
+        if self._checkpoints is None or self._checkpoints_dir != self._exp_result_dir:
+            if self._checkpoints is not None:
+                self._checkpoints.close()
+            self._checkpoints = CheckpointManager(self._exp_result_dir, keep_last=self._args.ckpt_keep_last, keep_best=self._args.ckpt_keep_best)
+            self._checkpoints_dir = self._exp_result_dir
+        return self._checkpoints
+
+    def __loadresume__(self):
+        """
+        With --resume, load <exp_result_dir>/resume-checkpoint.pkl into the model and the optimizer.
+        :returns: the resume checkpoint (epoch, batch, rng states, shuffle_index, loop state) or None
+        """
+        if not self._args.resume:
+            return None
+        resume_path = os.path.join(self._exp_result_dir, 'resume-checkpoint.pkl')
+        if not os.path.exists(resume_path):
+            print(f"there is no resume checkpoint in {self._exp_result_dir}, training from epoch 0")
+            return None
+
+        resume = torch.load(resume_path, map_location='cpu')
+        self._model.load_state_dict(resume['model'])
+        self._optimizer.load_state_dict(resume['optimizer'])
+        if resume.get('scaler'):
+            self.__getscaler__().load_state_dict(resume['scaler'])
+        print(f"resuming from epoch {resume['epoch']+1} batch {resume['batch']} of {resume_path}")
+        return resume
+
+    def __resumevalue__(self, resume, key, default, epoch_index=None):
+        """
+        Loop state saved by __saveresume__, epoch_index restricts per epoch accumulators to the interrupted epoch.
+        """
+        if resume is None or key not in resume['state']:
+            return default
+        if epoch_index is not None and resume['epoch'] != epoch_index:
+            return default
+        return resume['state'][key]
+
+    def __epochstart__(self, epoch_index, resume, shuffle_index=None):
+        """
+        Capture the rng states and the shuffle_index permutation at the start of epoch_index,
+        after restoring them first when epoch_index is the epoch the run is resumed in.
+        """
+        sampler_generator = getattr(getattr(getattr(self, '_train_dataloader', None), 'sampler', None), 'generator', None)
+        if resume is not None and resume['epoch'] == epoch_index:
+            SetRNGState(resume['epoch_rng'])
+            if sampler_generator is not None and resume['sampler_rng'] is not None:
+                sampler_generator.set_state(resume['sampler_rng'])
+            if shuffle_index is not None:
+                shuffle_index.copy_(resume['shuffle_index'])
+
+        return {
+            'epoch_rng': GetRNGState(),
+            'sampler_rng': sampler_generator.get_state() if sampler_generator is not None else None,
+            'shuffle_index': shuffle_index.clone() if shuffle_index is not None else None,
+        }
+
+    def __resumebatches__(self, batches, epoch_index, resume):
+        """
+        enumerate(batches), skipping the batches the interrupted run already trained on in the resumed epoch.
+        The rng states of the interrupted run are restored right before its next batch.
+        """
+        if resume is None or resume['epoch'] != epoch_index or resume['batch'] == 0:
+            yield from enumerate(batches)
+            return
+
+        for batch_index, batch in enumerate(batches):
+            if batch_index < resume['batch']:
+                continue
+            if batch_index == resume['batch']:
+                SetRNGState(resume['rng'])
+            yield batch_index, batch
+
+    def __saveresume__(self, epoch_index, batch_num, epoch_start, **state):
+        """
+        Overwrite the resume checkpoint: batch_num batches of epoch_index are done, state holds the loop accumulators and curves.
+        """
+        state = {key: [float(value) for value in values] if isinstance(values, list) else float(values) for key, values in state.items()}
+        extra = dict(epoch_start, batch=batch_num, state=state, scaler=self.__getscaler__().state_dict())
+        self.__getcheckpoints__().save('resume-checkpoint.pkl', self._model, self._optimizer, epoch=epoch_index, managed=False, extra=extra)
+
+    def __stepresume__(self, epoch_index, batch_index, epoch_start, **state):
+        step_interval = self._args.ckpt_step_interval
+        if step_interval > 0 and (batch_index + 1) % step_interval == 0:
+            self.__saveresume__(epoch_index, batch_index + 1, epoch_start, **state)
+
+    def __epochresume__(self, epoch_index, shuffle_index=None, **state):
+        self.__saveresume__(epoch_index + 1, 0, self.__epochstart__(epoch_index + 1, None, shuffle_index), **state)
+
     def evaluatefromdataloader(self,model,test_dataloader) -> None:
         if torch.cuda.is_available():
             self._lossfunc.cuda()
@@ -559,56 +587,8 @@ class RMClassifier:
         )             
         return artmodel
 
-    def evaluatefromtensor(self, classifier, x_set:Tensor, y_set:Tensor):
-        classifier.eval()   
-        if torch.cuda.is_available():
-            classifier.cuda()             
-        
-        batch_size = self._args.batch_size
-        testset_total_num = len(x_set)
-        batch_num = int( np.ceil( int(testset_total_num) / float(batch_size) ) )
-        cla_model_name=self._args.cla_model
-
-        eva_loss = torch.nn.CrossEntropyLoss()
-        epoch_correct_num = 0
-        epoch_total_loss = 0
-
-        for batch_index in range(batch_num):                                             
-            right_index = min((batch_index + 1) * batch_size, testset_total_num)
-            images = x_set[batch_index * batch_size : right_index]
-            labels = y_set[batch_index * batch_size : right_index]                                                
-
-            imgs = images.cuda()
-            labs = labels.cuda()
-            eva_loss = eva_loss.cuda()
-
-            
-            with torch.no_grad():
-
-                if cla_model_name == 'inception_v3':
-                    output, aux = classifier(imgs)
-                
-                elif cla_model_name == 'googlenet':
-                    if self._args.dataset == 'imagenetmixed10' or self._args.dataset == 'svhn' or self._args.dataset == 'kmnist' or self._args.dataset == 'cifar10': 
-                        output = classifier(imgs)
-                    else:
-                        output, aux1, aux2 = classifier(imgs)
-                else:
-                    output = classifier(imgs)         
-                                
-                loss = eva_loss(output,labs)
-                _, predicted_label_index = torch.max(output.data, 1)    
-                
-                assert len(predicted_label_index) == len(labs)
-                batch_same_num = predicted_label_index.cpu().eq(labs.cpu()).sum()
-
-                epoch_correct_num += batch_same_num
-                epoch_total_loss += loss
-
-        test_accuracy = epoch_correct_num / testset_total_num
-        test_loss = epoch_total_loss / batch_num                  
-        classifier.train()
-        return test_accuracy, test_loss
+    def evaluatefromtensor(self, classifier, x_set:Tensor, y_set:Tensor, return_logits=False):
+        return EvaluateAccuracyFromTensor(classifier, x_set, y_set, self._args.batch_size, return_logits)
 
     def getrawset(self,dataloader)->"Tensor":
         xset_tensor, yset_tensor = self.__getrawsettensor__(dataloader)
@@ -622,6 +602,9 @@ class RMClassifier:
         return xset_tensor, yset_tensor
     
     def __getxsettensor__(self,dataloader)->"Tensor":
+        if isinstance(dataloader, DeviceTensorLoader):                                                  #   already materialized by --device_dataset
+            return dataloader.x_set.cpu()
+
         if self._args.dataset == 'cifar10':
             xset_tensor = []
             for img_index in range(len(dataloader.dataset)):
@@ -675,6 +658,8 @@ class RMClassifier:
         return xset_tensor.cpu()
 
     def __getysettensor__(self,dataloader)->"Tensor":
+        if isinstance(dataloader, DeviceTensorLoader):
+            return dataloader.y_set.cpu()
 
         if self._args.dataset == 'cifar10':
             yset_tensor = []
@@ -728,61 +713,13 @@ class RMClassifier:
 
         return yset_tensor.cpu()       
 
-    def getadvset(self,adv_dataset_path):
-        adv_xset_tensor, adv_yset_tensor = self.__getadvsettensor__(adv_dataset_path)
+    def getadvset(self,adv_dataset_path, clean_source = None):
+        adv_xset_tensor, adv_yset_tensor = self.__getadvsettensor__(adv_dataset_path, clean_source)
         return adv_xset_tensor, adv_yset_tensor     
         
-    def __getadvsettensor__(self,adv_dataset_path):
-
-        if self._args.perceptualattack == False:
-            file_dir=os.listdir(adv_dataset_path)
-            file_dir.sort()
-            filenames = [name for name in file_dir if os.path.splitext(name)[-1] == '.npz' and name[9:12] == 'adv']           
-
-            adv_xset_tensor = []
-            adv_yset_tensor = []
-
-            for index, filename in enumerate(filenames):
-                adv_npz_path = os.path.join(adv_dataset_path,filename)
-
-                load_adv_img = np.load(adv_npz_path)['w']            
-                load_adv_img = torch.tensor(load_adv_img)
-                
-                load_adv_label = int(filename[13:14])               
-                load_adv_label = torch.tensor(load_adv_label)
-
-                adv_xset_tensor.append(load_adv_img)
-                adv_yset_tensor.append(load_adv_label)
-
-            adv_xset_tensor = torch.stack(adv_xset_tensor)                                                                         
-            adv_yset_tensor = torch.stack(adv_yset_tensor)   
-
-            return adv_xset_tensor.cpu(), adv_yset_tensor.cpu()  
-
-        elif self._args.perceptualattack == True:
-            file_dir=os.listdir(adv_dataset_path)
-            file_dir.sort()
-            filenames = [name for name in file_dir if os.path.splitext(name)[-1] == '.npz' and name[9:12] == 'per']           
-
-            adv_xset_tensor = []
-            adv_yset_tensor = []
-
-            for index, filename in enumerate(filenames):
-                adv_npz_path = os.path.join(adv_dataset_path,filename)
-
-                load_adv_img = np.load(adv_npz_path)['w']            
-                load_adv_img = torch.tensor(load_adv_img)
-                
-                load_adv_label = int(filename[13:14])               
-                load_adv_label = torch.tensor(load_adv_label)
-
-                adv_xset_tensor.append(load_adv_img)
-                adv_yset_tensor.append(load_adv_label)
-
-            adv_xset_tensor = torch.stack(adv_xset_tensor)                                                                         
-            adv_yset_tensor = torch.stack(adv_yset_tensor)   
-
-            return adv_xset_tensor.cpu(), adv_yset_tensor.cpu()    
+    def __getadvsettensor__(self,adv_dataset_path, clean_source = None):
+        adv_xset_tensor, adv_yset_tensor = LoadAdvSet(adv_dataset_path, 'per' if self._args.perceptualattack == True else 'adv', clean_source)
+        return adv_xset_tensor, adv_yset_tensor
 
     def getproset(self, pro_dataset_path):
         pro_wset_tensor, pro_yset_tensor = self.__getprosettensor__(pro_dataset_path)
@@ -930,7 +867,7 @@ class RMClassifier:
             self._train_tensorset_x = torch.tensor(aug_x_train)
             self._train_tensorset_y = torch.tensor(aug_y_train)
 
-            self._adv_test_tensorset_x = torch.tensor(x_test_adv)
+            self._adv_test_tensorset_x = x_test_adv if isinstance(x_test_adv, AdvStoreView) else torch.tensor(x_test_adv)     #   int8delta stores stay lazy
             self._adv_test_tensorset_y = torch.tensor(y_test_adv)
 
             self._cle_test_tensorset_x = torch.tensor(cle_x_test)
@@ -966,8 +903,7 @@ class RMClassifier:
 
 
     
-        learned_model= self._model
-        epoch_attack_classifier = AdvAttack(self._args, learned_model)  
+        epoch_attack_classifier = self.attacker()
         target_model = epoch_attack_classifier.targetmodel()        
         epoch_x_test_adv, epoch_y_test_adv = epoch_attack_classifier.generateadvfromtestsettensor(self._cle_test_tensorset_x, self._cle_test_tensorset_y) 
         epoch__adv_test_accuracy, epoch_adv_test_loss = self.evaluatefromtensor(target_model,epoch_x_test_adv,epoch_y_test_adv)
@@ -984,22 +920,24 @@ class RMClassifier:
         shuffle_index = np.arange(trainset_len)
         shuffle_index = torch.tensor(shuffle_index)
 
-        global_train_acc = []
-        global_train_loss = []        
-        global_adv_test_acc = []
-        global_adv_test_loss = []
-        global_cle_test_acc = []
-        global_cle_test_loss = []
+        resume = self.__loadresume__()
+        global_train_acc = self.__resumevalue__(resume, 'global_train_acc', [])
+        global_train_loss = self.__resumevalue__(resume, 'global_train_loss', [])
+        global_adv_test_acc = self.__resumevalue__(resume, 'global_adv_test_acc', [])
+        global_adv_test_loss = self.__resumevalue__(resume, 'global_adv_test_loss', [])
+        global_cle_test_acc = self.__resumevalue__(resume, 'global_cle_test_acc', [])
+        global_cle_test_loss = self.__resumevalue__(resume, 'global_cle_test_loss', [])
 
-        for epoch_index in range (epoch_num):
+        for epoch_index in range(resume['epoch'] if resume is not None else 0, epoch_num):
+            epoch_start = self.__epochstart__(epoch_index, resume, shuffle_index)
 
-            random.shuffle(shuffle_index)
+            self.__shuffleindex__(shuffle_index)
             self.__adjustlearningrate__(epoch_index)     
 
-            epoch_correct_num = 0
-            epoch_total_loss = 0
+            epoch_correct_num = self.__resumevalue__(resume, 'epoch_correct_num', 0, epoch_index)
+            epoch_total_loss = self.__resumevalue__(resume, 'epoch_total_loss', 0, epoch_index)
 
-            for batch_index in range (batch_num):
+            for batch_index, _ in self.__resumebatches__(range(batch_num), epoch_index, resume):
 
                 x_trainbatch = self._train_tensorset_x[shuffle_index[batch_index * batch_size : (batch_index + 1) * batch_size]]
                 y_trainbatch = self._train_tensorset_y[shuffle_index[batch_index * batch_size : (batch_index + 1) * batch_size]]                                                
@@ -1007,27 +945,26 @@ class RMClassifier:
                 batch_imgs = x_trainbatch.cuda()
                 batch_labs = y_trainbatch.cuda()
 
-                self._optimizer.zero_grad()
-                output = self._model(batch_imgs)
+                with self.__autocast__():
+                    output = self._model(batch_imgs)
 
-                lossfunction = 'ce'
-                if lossfunction == 'mse':
-                    softmax_outputs = torch.nn.functional.softmax(output, dim = 1)                           
-                    cla_loss = torch.nn.MSELoss()
-                    batch_loss = cla_loss(softmax_outputs, batch_labs) 
+                    lossfunction = 'ce'
+                    if lossfunction == 'mse':
+                        softmax_outputs = torch.nn.functional.softmax(output, dim = 1)                           
+                        cla_loss = torch.nn.MSELoss()
+                        batch_loss = cla_loss(softmax_outputs, batch_labs) 
 
-                elif lossfunction == 'ce':
-                    batch_loss = self.__CustomSoftlossFunction__(output, batch_labs)
+                    elif lossfunction == 'ce':
+                        batch_loss = self.__CustomSoftlossFunction__(output, batch_labs)
 
-                elif lossfunction == 'cosine':
-                    softmax_outputs = torch.nn.functional.softmax(output, dim = 1)    
-                    cla_loss = torch.cosine_similarity                                                         
-                    batch_loss = cla_loss(softmax_outputs, batch_labs) 
-                    batch_loss = 1 - batch_loss         
-                    batch_loss = batch_loss.mean()
+                    elif lossfunction == 'cosine':
+                        softmax_outputs = torch.nn.functional.softmax(output, dim = 1)    
+                        cla_loss = torch.cosine_similarity                                                         
+                        batch_loss = cla_loss(softmax_outputs, batch_labs) 
+                        batch_loss = 1 - batch_loss         
+                        batch_loss = batch_loss.mean()
 
-                batch_loss.backward()
-                self._optimizer.step()
+                self.__optimizerstep__(batch_loss)
 
                 _, predicted_label_index = torch.max(output.data, 1)    
 
@@ -1037,10 +974,10 @@ class RMClassifier:
                 batch_correct_num = (predicted_label_index == batch_labs_maxindex).sum().item()     
                 epoch_correct_num += batch_correct_num                                     
                 
-                epoch_total_loss += batch_loss
-                print("[Epoch %d/%d] [Batch %d/%d] [Batch classify loss: %f] " % (epoch_index+1, epoch_num, batch_index+1, batch_num, 
-                
-                batch_loss.item()))
+                epoch_total_loss += batch_loss.detach()
+                if (batch_index + 1) % self._args.train_print_interval == 0:
+                    print("[Epoch %d/%d] [Batch %d/%d] [Batch classify loss: %f] " % (epoch_index+1, epoch_num, batch_index+1, batch_num, batch_loss.item()))
+                self.__stepresume__(epoch_index, batch_index, epoch_start, global_train_acc=global_train_acc, global_train_loss=global_train_loss, global_adv_test_acc=global_adv_test_acc, global_adv_test_loss=global_adv_test_loss, global_cle_test_acc=global_cle_test_acc, global_cle_test_loss=global_cle_test_loss, epoch_correct_num=epoch_correct_num, epoch_total_loss=epoch_total_loss)
                 
             
             epoch_train_accuarcy = epoch_correct_num / trainset_len
@@ -1054,8 +991,7 @@ class RMClassifier:
             print(f'{epoch_index+1:04d} epoch rmt trained classifier accuary on the clean testing examples:{epoch_cle_test_accuracy*100:.4f}%' )  
             print(f'{epoch_index+1:04d} epoch rmt trained classifier loss on the clean testing examples:{epoch_cle_test_loss:.4f}' )   
 
-            learned_model= self._model
-            epoch_attack_classifier = AdvAttack(self._args, learned_model)   
+            epoch_attack_classifier = self.attacker()
             target_model = epoch_attack_classifier.targetmodel()              
 
             epoch_x_test_adv, epoch_y_test_adv = epoch_attack_classifier.generateadvfromtestsettensor(self._cle_test_tensorset_x, self._cle_test_tensorset_y) 
@@ -1067,37 +1003,11 @@ class RMClassifier:
             print(f'rmt trained classifier loss on adversarial testset:{epoch_adv_test_loss}' )    
             self._model = target_model
                 
-            tensorboard_log_adv_acc_dir = os.path.join(self._exp_result_dir,f'tensorboard-log-run-acc-adv')
-            os.makedirs(tensorboard_log_adv_acc_dir,exist_ok=True)    
-            print("tensorboard_log_dir:",tensorboard_log_adv_acc_dir)   
-            writer_adv_acc = SummaryWriter(log_dir = tensorboard_log_adv_acc_dir, comment= '-'+'advtestacc') 
-            writer_adv_acc.add_scalar(tag = "epoch_adv_acc", scalar_value = epoch_adv_test_accuracy, global_step = epoch_index + 1 )
-            writer_adv_acc.close()
-            
-
-           
-            tensorboard_log_adv_loss_dir = os.path.join(self._exp_result_dir,f'tensorboard-log-run-loss-adv')
-            os.makedirs(tensorboard_log_adv_loss_dir,exist_ok=True)    
-            writer_adv_loss = SummaryWriter(log_dir = tensorboard_log_adv_loss_dir, comment= '-'+'advtestloss') 
-            writer_adv_loss.add_scalar(tag = "epoch_adv_loss", scalar_value = epoch_adv_test_loss, global_step = epoch_index + 1 )
-            writer_adv_loss.close()
-            
-
-            
-            tensorboard_log_cle_acc_dir = os.path.join(self._exp_result_dir,f'tensorboard-log-run-acc-cle')
-            os.makedirs(tensorboard_log_cle_acc_dir,exist_ok=True)    
-            print("tensorboard_log_dir:",tensorboard_log_cle_acc_dir)   
-            writer_cle_acc = SummaryWriter(log_dir = tensorboard_log_cle_acc_dir, comment= '-'+'cletestacc') 
-            writer_cle_acc.add_scalar(tag = "epoch_cle_acc", scalar_value = epoch_cle_test_accuracy, global_step = epoch_index + 1 )
-            writer_cle_acc.close()
-            
-
-           
-            tensorboard_log_cle_loss_dir = os.path.join(self._exp_result_dir,f'tensorboard-log-run-loss-cle')
-            os.makedirs(tensorboard_log_cle_loss_dir,exist_ok=True)    
-            writer_cle_loss = SummaryWriter(log_dir = tensorboard_log_cle_loss_dir, comment= '-'+'cletestloss') 
-            writer_cle_loss.add_scalar(tag = "epoch_cle_loss", scalar_value = epoch_cle_test_loss, global_step = epoch_index + 1 )
-            writer_cle_loss.close()
+            self.__getmetrics__().scalar("epoch_adv_acc", epoch_adv_test_accuracy, epoch_index + 1)
+            self.__getmetrics__().scalar("epoch_adv_loss", epoch_adv_test_loss, epoch_index + 1)
+            self.__getmetrics__().scalar("epoch_cle_acc", epoch_cle_test_accuracy, epoch_index + 1)
+            self.__getmetrics__().scalar("epoch_cle_loss", epoch_cle_test_loss, epoch_index + 1)
+            self.__epochresume__(epoch_index, shuffle_index, global_train_acc=global_train_acc, global_train_loss=global_train_loss, global_adv_test_acc=global_adv_test_acc, global_adv_test_loss=global_adv_test_loss, global_cle_test_acc=global_cle_test_acc, global_cle_test_loss=global_cle_test_loss)
             
 
         return global_train_acc, global_adv_test_acc, global_cle_test_acc, global_train_loss, global_adv_test_loss, global_cle_test_loss
@@ -1156,79 +1066,220 @@ class RMClassifier:
 
         return test_accuracy, test_loss
 
-    def __CustomSoftlossFunction__(self, batch_outputs, o_batch):       
-        alpha_1, w1_label_index = torch.max(o_batch, 1)                            
+    def __CustomSoftlossFunction__(self, batch_outputs, o_batch, k=2):
+        """
+        Soft label cross entropy over the k largest label components, checked against the per sample loop by clamodels/softlosscheck.py.
+        k=2 keeps the original two-term mixup loss: alpha_1*CE(w1) + alpha_2*CE(w2),
+        where w2 falls back to w1 with alpha_2 = 0 when the label has a single class.
+        k=None uses every class of the soft label.
+        """
+        class_num = o_batch.size(1)
+        if k is None or k > class_num:
+            k = class_num
 
-        modified_mixed_label = copy.deepcopy(o_batch)
+        alpha, label_index = torch.sort(o_batch, dim=1, descending=True, stable=True)                    #   ties keep the first index like torch.max
+        alpha, label_index = alpha[:, :k], label_index[:, :k]
 
-        alpha_2 = []
-        w2_label_index = []
-        for i in range(len(o_batch)):
+        # zero weight terms point back to the w1 label like the single class case
+        if k > 1:
+            empty = alpha[:, 1:] == 0
+            label_index[:, 1:] = torch.where(empty, label_index[:, :1].expand_as(empty), label_index[:, 1:])
 
-            modified_mixed_label[i][w1_label_index[i]] = 0        
-            
-            if torch.nonzero(modified_mixed_label[i]).size(0) == 0:
-                ind = w1_label_index[i].unsqueeze(0).cuda()
-                val = torch.zeros(1, dtype = torch.float32).cuda()
-                alpha_2.append(val)
-                w2_label_index.append(ind)
-                
-                            
-            else:
-                mix_label = modified_mixed_label[i]
-                mix_label = mix_label.unsqueeze(0)
-                val, ind = torch.max(mix_label, 1)
-                alpha_2.append(val)
-                w2_label_index.append(ind)
-
-        w2_label_index = torch.cat(w2_label_index) 
-        alpha_2 = torch.cat(alpha_2) 
-
-        # print("batch_outputs[0]:",batch_outputs[0])
-        # print("alpha_1[0]:",alpha_1[0])
-        # print("alpha_2[0]:",alpha_2[0])
-        # print("w1_label_index[0]:",w1_label_index[0])
-        # print("w2_label_index[0]:",w2_label_index[0])
-
-        cla_loss =  torch.nn.CrossEntropyLoss(reduction = 'none').cuda()
-        loss_a = cla_loss(batch_outputs, w1_label_index)
-        loss_b = cla_loss(batch_outputs, w2_label_index)
-        loss = alpha_1 * loss_a + alpha_2 * loss_b
+        log_prob = torch.nn.functional.log_softmax(batch_outputs.float(), dim=1)                      #   fp16 / bf16 logits under --cla_amp
+        term_loss = -torch.gather(log_prob, 1, label_index)
+        loss = (alpha.to(term_loss.dtype) * term_loss).sum(dim=1)
         loss = loss.mean()
 
         return loss
 
-    #   representation mixup training
-    def rmt(self, args,cle_w_train,cle_y_train, cle_train_dataloader, cle_x_test, cle_y_test, adv_x_test,adv_y_test,exp_result_dir,stylegan2ada_config_kwargs):
+    def __trainforward__(self, inputs):
+        """
+        Training forward pass, the auxiliary heads of inception_v3 / googlenet are dropped.
+        """
+        if self._args.cla_model == 'inception_v3':
+            outputs, aux = self._model(inputs)
+        elif self._args.cla_model == 'googlenet':
+            outputs, aux1, aux2 = self._model(inputs)
+        else:
+            outputs = self._model(inputs)
+        return outputs
 
-        print("cle_w_train.shape:",cle_w_train.shape)   
-        print("cle_y_train.shape:",cle_y_train.shape)
+    def __autocast__(self):
+        """
+        Autocast context of the training forward pass and loss with --cla_amp: fp16 on cuda, bf16 on cpu.
+        """
+        if torch.cuda.is_available():
+            return torch.autocast(device_type='cuda', dtype=torch.float16, enabled=self._args.cla_amp)
+        return torch.autocast(device_type='cpu', dtype=torch.bfloat16, enabled=self._args.cla_amp)
 
-        print("cle_x_test.shape:",cle_x_test.shape)
-        print("cle_y_test.shape:",cle_y_test.shape)        
+    def __getscaler__(self) -> "torch.cuda.amp.GradScaler":
+        if self._scaler is None:
+            self._scaler = torch.cuda.amp.GradScaler(enabled=self._args.cla_amp and torch.cuda.is_available())
+        return self._scaler
 
-        print("adv_x_test.shape:",adv_x_test.shape)
-        print("adv_y_test.shape:",adv_y_test.shape) 
+    def __optimizerstep__(self, loss):
+        """
+        zero_grad, backward and optimizer step. Under fp16 autocast the loss is scaled so that small gradients
+        do not flush to zero, steps with inf / nan gradients are skipped and the scale is lowered.
+        """
+        scaler = self.__getscaler__()
+        self._optimizer.zero_grad()
+        scaler.scale(loss).backward()
+        scaler.step(self._optimizer)
+        scaler.update()
 
+    def __prefetchbatches__(self, batches):
         """
-        cle_w_train.shape: torch.Size([11339, 8, 512])
-        cle_y_train.shape: torch.Size([11339, 8, 10])
-        cle_x_test.shape: torch.Size([26032, 3, 32, 32])
-        cle_y_test.shape: torch.Size([26032])
-        adv_x_test.shape: torch.Size([26032, 3, 32, 32])
-        adv_y_test.shape: torch.Size([26032])
-        """  
+        Copy the next dataloader batch to the device on a side stream while the current batch trains.
+        Only used when the dataloader loads in worker processes: loading in the main process draws from the
+        global rng, and reading one batch ahead would break the exact rng replay of --resume.
+        """
+        if not torch.cuda.is_available() or getattr(self._train_dataloader, 'num_workers', 0) == 0:
+            for batch_index, (raw_img_batch, raw_lab_batch) in batches:
+                yield batch_index, (raw_img_batch.cuda(non_blocking=True), raw_lab_batch.cuda(non_blocking=True))
+            return
+
+        copy_stream = torch.cuda.Stream()
+
+        def todevice(batch_index, raw_img_batch, raw_lab_batch):
+            with torch.cuda.stream(copy_stream):
+                raw_img_batch = raw_img_batch.pin_memory().cuda(non_blocking=True)
+                raw_lab_batch = raw_lab_batch.pin_memory().cuda(non_blocking=True)
+                copied = torch.cuda.Event()
+                copied.record(copy_stream)
+            return batch_index, raw_img_batch, raw_lab_batch, copied
+
+        next_batch = None
+        for batch_index, (raw_img_batch, raw_lab_batch) in batches:
+            batch = todevice(batch_index, raw_img_batch, raw_lab_batch)
+            if next_batch is not None:
+                yield self.__waitbatch__(next_batch)
+            next_batch = batch
+        if next_batch is not None:
+            yield self.__waitbatch__(next_batch)
+
+    def __waitbatch__(self, batch):
+        batch_index, raw_img_batch, raw_lab_batch, copied = batch
+        torch.cuda.current_stream().wait_event(copied)
+        raw_img_batch.record_stream(torch.cuda.current_stream())                                        #   the copy stream allocated them
+        raw_lab_batch.record_stream(torch.cuda.current_stream())
+        return batch_index, (raw_img_batch, raw_lab_batch)
+
+    def __adversarialtestset__(self, cle_x_set=None, cle_y_set=None):
+        """
+        Adversarial testset of the current model: regenerated against it from cle_x_set (default the clean testset)
+        for --whitebox, the stored one for --blackbox.
+        """
+        if cle_x_set is None:
+            cle_x_set, cle_y_set = self._cle_test_tensorset_x, self._cle_test_tensorset_y
+        if self._args.whitebox == True:
+            return self.attacker().generateadvfromtestsettensor(cle_x_set, cle_y_set)
+        elif self._args.blackbox == True:
+            return self._adv_test_tensorset_x, self._adv_test_tensorset_y
+        raise Exception('please choose whitebox or blackbox evaluation')
+
+    def __robustevaluate__(self, scheduler, full=False):
+        """
+        Adversarial accuracy and loss of the current model, with the 95% interval of the accuracy.
+        --whitebox attacks the fixed scheduler subset of the clean testset, or the whole testset if full.
+        """
+        eval_start = time.perf_counter()
+        if self._args.whitebox == True and not full:
+            cle_x_set, cle_y_set = scheduler.subset(self._cle_test_tensorset_x, self._cle_test_tensorset_y)
+        else:
+            cle_x_set, cle_y_set = self._cle_test_tensorset_x, self._cle_test_tensorset_y
+        x_test_adv, y_test_adv = self.__adversarialtestset__(cle_x_set, cle_y_set)
+        adv_test_accuracy, adv_test_loss = self.evaluatefromtensor(self._model, x_test_adv, y_test_adv)
+        scheduler.addeval(time.perf_counter() - eval_start)
+        return adv_test_accuracy, adv_test_loss, WilsonInterval(adv_test_accuracy, len(y_test_adv))
+
+    def __warmrobustevaluate__(self, scheduler, warm, calibrating):
+        """
+        Scheduled whitebox evaluation with warm started attacks on the scheduler subset. A calibrating evaluation runs the
+        full attack and, once examples are cached, also the warm started one on the same model to measure the gap.
+        :returns: accuracy, loss, 95% interval, warm minus full accuracy (None if not measured)
+        """
+        eval_start = time.perf_counter()
+        cle_x_set, cle_y_set = scheduler.subset(self._cle_test_tensorset_x, self._cle_test_tensorset_y)
+        warm_accuracy = None
+        if warm.init() is not None:
+            x_test_adv, y_test_adv = self.attacker().generatewarmstart(cle_x_set, cle_y_set, warm.init(), warm.warm_iter)
+            warm_accuracy, warm_loss = self.evaluatefromtensor(self._model, x_test_adv, y_test_adv)
+        if calibrating:
+            x_test_adv, y_test_adv = self.__adversarialtestset__(cle_x_set, cle_y_set)
+            adv_test_accuracy, adv_test_loss = self.evaluatefromtensor(self._model, x_test_adv, y_test_adv)
+        else:
+            adv_test_accuracy, adv_test_loss = warm_accuracy, warm_loss
+        warm.update(x_test_adv)
+        scheduler.addeval(time.perf_counter() - eval_start)
+        warm_gap = warm_accuracy - adv_test_accuracy if calibrating and warm_accuracy is not None else None
+        return adv_test_accuracy, adv_test_loss, WilsonInterval(adv_test_accuracy, len(y_test_adv)), warm_gap
 
+    def __finalrobustevaluate__(self, policy, scheduler, best_epoch):
+        """
+        Whitebox evaluation on the whole testset of the final model and of the best (by subset accuracy) epoch checkpoint,
+        run once after a training run whose scheduled evaluations were partial.
+        """
+        self.__getcheckpoints__().flush()
+        adv_test_accuracy, adv_test_loss, (ci_low, ci_high) = self.__robustevaluate__(scheduler, full=True)
+        print(f'final {policy.name} trained classifier accuary on the whole adversarial testset:{adv_test_accuracy * 100:.4f}% (95% ci {ci_low * 100:.2f}%-{ci_high * 100:.2f}%)' )
+        print(f'final {policy.name} trained classifier loss on the whole adversarial testset:{adv_test_loss}' )
+        self.__getmetrics__().scalar("final_adv_acc", adv_test_accuracy, self._args.epochs)
+        self.__getmetrics__().scalar("final_adv_loss", adv_test_loss, self._args.epochs)
+
+        if best_epoch < 1 or best_epoch == self._args.epochs:
+            return
+        best_path = os.path.join(self._exp_result_dir, f'{policy.ckpt_prefix}-trained-classifier-{self._args.cla_model}-on-{self._args.dataset}-epoch-{best_epoch:04d}.pkl')
+        if not os.path.exists(best_path):
+            print(f'the best epoch {best_epoch} checkpoint was not retained, skipping its full evaluation')
+            return
+
+        final_model = self._model
+        self._model = copy.deepcopy(final_model)
+        self._model.load_state_dict(torch.load(best_path, map_location='cpu')['model'])
+        adv_test_accuracy, adv_test_loss, (ci_low, ci_high) = self.__robustevaluate__(scheduler, full=True)
+        self._model = final_model
+        print(f'best epoch {best_epoch} {policy.name} trained classifier accuary on the whole adversarial testset:{adv_test_accuracy * 100:.4f}% (95% ci {ci_low * 100:.2f}%-{ci_high * 100:.2f}%)' )
+        self.__getmetrics__().scalar("best_adv_acc", adv_test_accuracy, best_epoch)
+        self.__getmetrics__().scalar("best_adv_loss", adv_test_loss, best_epoch)
+
+    def __residenttensorsets__(self):
+        """
+        With --device_dataset, upload the train and test tensor sets once if they fit into the device budget.
+        :returns: whether the train tensor set is on the device, its batches are then slices of a device permutation
+        """
+        if not self._args.device_dataset or not torch.cuda.is_available():
+            return False
+
+        train_set = [self._train_tensorset_x, self._train_tensorset_y]
+        test_set = [self._cle_test_tensorset_x, self._cle_test_tensorset_y, self._adv_test_tensorset_x, self._adv_test_tensorset_y]
+        train_resident = FitsOnDevice(train_set, self._args.device_dataset_budget)
+        if train_resident:
+            self._train_tensorset_x, self._train_tensorset_y = [tensor.cuda() for tensor in train_set]
+        if FitsOnDevice(test_set, self._args.device_dataset_budget):
+            self._cle_test_tensorset_x, self._cle_test_tensorset_y, self._adv_test_tensorset_x, self._adv_test_tensorset_y = [tensor.cuda() for tensor in test_set]
+        print(f'train tensor set {"uploaded to the device" if train_resident else "kept in host memory"}, test tensor sets on {self._cle_test_tensorset_x.device}')
+        return train_resident
+
+    def __shuffleindex__(self, shuffle_index):
+        shuffle_index.copy_(torch.randperm(len(shuffle_index), device=shuffle_index.device))
+
+    def __defensetrainloop__(self, policy, exp_result_dir, train_x, train_y, cle_train_dataloader, cle_x_test, cle_y_test, adv_x_test, adv_y_test):
+        """
+        Training loop shared by every defense mode: each step trains on policy.batch() built from a dataloader batch
+        and the train_index slice of the shuffled train tensorset, which is cycled when it is shorter than the dataloader.
+        """
         self._exp_result_dir = exp_result_dir
-        if self._args.defense_mode == "rmt":
-            self._exp_result_dir = os.path.join(self._exp_result_dir,f'rmt-{self._args.dataset}-dataset')
-        os.makedirs(self._exp_result_dir,exist_ok=True)            
+        if policy.result_subdir and self._args.defense_mode == policy.name:
+            self._exp_result_dir = os.path.join(self._exp_result_dir,f'{policy.name}-{self._args.dataset}-dataset')
+        os.makedirs(self._exp_result_dir,exist_ok=True)
+
         if torch.cuda.is_available():
             self._lossfunc.cuda()
-            self._model.cuda()       
+            self._model.cuda()
 
-        self._train_tensorset_x = cle_w_train
-        self._train_tensorset_y = cle_y_train
+        self._train_tensorset_x = train_x
+        self._train_tensorset_y = train_y
 
         self._adv_test_tensorset_x = adv_x_test
         self._adv_test_tensorset_y = adv_y_test
@@ -1238,139 +1289,144 @@ class RMClassifier:
 
         print("cle_train_dataloader.len:",len(cle_train_dataloader))
         self._train_dataloader = cle_train_dataloader
+        train_resident = self.__residenttensorsets__()
 
-        if args.whitebox == True:
-            epoch_attack_classifier = AdvAttack(args = self._args, learned_model= self.model())           
-            self._model = epoch_attack_classifier.targetmodel()
-            epoch_x_test_adv, epoch_y_test_adv = epoch_attack_classifier.generateadvfromtestsettensor(self._cle_test_tensorset_x, self._cle_test_tensorset_y) 
-        elif args.blackbox == True:
-            epoch_x_test_adv = self._adv_test_tensorset_x
-            epoch_y_test_adv = self._adv_test_tensorset_y        
-        
-        epoch__adv_test_accuracy, epoch_adv_test_loss = self.evaluatefromtensor(self._model, epoch_x_test_adv,epoch_y_test_adv)
+        scheduler = RobustEvalScheduler(self._args.robust_eval_subset, self._args.robust_eval_every, self._args.robust_eval_budget, self._args.seed)
+        warm = None
+        if self._args.whitebox == True and self._args.robust_eval_warm_iter is not None:
+            warm = WarmStartTracker(self._args.robust_eval_warm_iter, self._args.robust_eval_calibrate_every)
+        if policy.evaluate_before:
+            epoch_adv_test_accuracy, epoch_adv_test_loss, (adv_ci_low, adv_ci_high) = self.__robustevaluate__(scheduler)
+            print(f'Accuary of before {policy.name} trained classifier on adversarial testset:{epoch_adv_test_accuracy * 100:.4f}% (95% ci {adv_ci_low * 100:.2f}%-{adv_ci_high * 100:.2f}%)' )
+            print(f'Loss of before {policy.name} trained classifier on adversarial testset:{epoch_adv_test_loss}' )
 
-        print(f'Accuary of before rmt trained classifier on adversarial testset:{epoch__adv_test_accuracy * 100:.4f}%' ) 
-        print(f'Loss of before rmt trained classifier on adversarial testset:{epoch_adv_test_loss}' )    
-
-        w_trainset_len = len(self._train_tensorset_x)
+        trainset_len = len(self._train_tensorset_x)
         batch_size = self._args.batch_size
-        w_batch_num = int(np.ceil(w_trainset_len / float(batch_size)))
+        train_batch_num = int(np.ceil(trainset_len / float(batch_size)))
 
-        print("w_trainset_len:",w_trainset_len)
+        print("trainset_len:",trainset_len)
         print("batch_size:",batch_size)
-        print("w_batch_num:",w_batch_num)
+        print("train_batch_num:",train_batch_num)
 
-        shuffle_index = np.arange(w_trainset_len)
+        shuffle_index = np.arange(trainset_len)
         shuffle_index = torch.tensor(shuffle_index)
-
-        for epoch_index in range(self._args.epochs):
+        if train_resident:
+            shuffle_index = shuffle_index.cuda()
+
+        policy.setup(self)
+
+        resume = self.__loadresume__()
+        if resume is not None:
+            scheduler.loadstate(resume['state'])
+            if warm is not None:
+                warm.loadstate(resume['state'])
+        warm_state = warm.state() if warm is not None else {}
+        best_adv_test_accuracy = self.__resumevalue__(resume, 'best_adv_test_accuracy', -1.0)
+        best_epoch = int(self.__resumevalue__(resume, 'best_epoch', 0))
+        for epoch_index in range(resume['epoch'] if resume is not None else 0, self._args.epochs):
+            epoch_start = self.__epochstart__(epoch_index, resume, shuffle_index)
+            epoch_train_start = time.perf_counter()
             print("\n")
-            random.shuffle(shuffle_index)
-            self.__adjustlearningrate__(epoch_index)       
+            self.__shuffleindex__(shuffle_index)
+            self.__adjustlearningrate__(epoch_index)
+            policy.beginepoch(self, epoch_index)
 
-            epoch_total_loss = 0
+            epoch_total_loss = self.__resumevalue__(resume, 'epoch_total_loss', 0, epoch_index)
+            if torch.cuda.is_available():
+                epoch_total_loss = torch.tensor(float(epoch_total_loss), device='cuda')                     #   accumulated on the device, synchronized once per epoch
 
-            for batch_index, (raw_img_batch, raw_lab_batch) in enumerate(self._train_dataloader):      
+            batches = self.__resumebatches__(self._train_dataloader, epoch_index, resume)
+            for batch_index, (raw_img_batch, raw_lab_batch) in self.__prefetchbatches__(batches):
 
-                raw_lab_batch = LongTensor(raw_lab_batch)                           
-                raw_lab_batch = torch.nn.functional.one_hot(raw_lab_batch, args.n_classes).float()
-                
-                if (batch_index + 1) % w_batch_num == 0:
-                    right_index = w_trainset_len
+                if (batch_index + 1) % train_batch_num == 0:
+                    right_index = trainset_len
                 else:
-                    right_index = ( (batch_index + 1) % w_batch_num ) * batch_size
+                    right_index = ( (batch_index + 1) % train_batch_num ) * batch_size
+                train_index = shuffle_index[(batch_index % train_batch_num) * batch_size : right_index]
 
-                pro_img_batch = self._train_tensorset_x[shuffle_index[(batch_index % w_batch_num) * batch_size : right_index]]
-                pro_lab_batch = self._train_tensorset_y[shuffle_index[(batch_index % w_batch_num) * batch_size : right_index]]                   
-                
-                mix_img_batch, mix_lab_batch = mixup_data(args, exp_result_dir, stylegan2ada_config_kwargs, pro_img_batch, pro_lab_batch)   
-                aug_x_train = torch.cat([raw_img_batch, mix_img_batch], dim=0)
-                aug_y_train = torch.cat([raw_lab_batch, mix_lab_batch], dim=0)
+                inputs, targets = policy.batch(self, raw_img_batch, raw_lab_batch, train_index)
 
-                inputs = aug_x_train.cuda()
-                targets = aug_y_train.cuda()
-                
-                self._optimizer.zero_grad()
-                self._model.train()         
-                if self._args.cla_model == 'inception_v3':
-                    outputs, aux = self._model(inputs)
-                elif self._args.cla_model == 'googlenet':
-                    outputs, aux1, aux2 = self._model(inputs)
-                else:
-                    outputs = self._model(inputs)
-
-                lossfunction = 'ce'
-                if lossfunction == 'ce':
-                    loss = self.__CustomSoftlossFunction__(outputs, targets)
-                elif lossfunction == 'mse':
-                    softmax_outputs = torch.nn.functional.softmax(outputs, dim = 1)                          
-                    cla_lossfun = torch.nn.MSELoss().cuda()
-                    loss = cla_lossfun(softmax_outputs, targets) 
-                elif lossfunction == 'cosine':
-                    softmax_outputs = torch.nn.functional.softmax(outputs, dim = 1)    
-                    cla_lossfun = torch.cosine_similarity                                                    
-                    loss = cla_lossfun(softmax_outputs, targets) 
-                    loss = 1 - loss         
-                    loss =loss.mean()
-                self._optimizer.zero_grad()
-                loss.backward()
-                self._optimizer.step()
+                self._model.train()
+                with self.__autocast__():
+                    outputs, targets = policy.forward(self, inputs, targets)
+                    loss = policy.loss(self, outputs, targets)
+                self.__optimizerstep__(loss)
+
+                epoch_total_loss += loss.detach()
+                global_step = epoch_index * len(self._train_dataloader) + batch_index + 1
+                self.__getmetrics__().scalar("step_train_loss", loss, global_step)
+                self.__getmetrics__().rate("step_train_samples_per_sec", len(inputs), global_step)
+                if (batch_index + 1) % self._args.train_print_interval == 0:
+                    print("[Epoch %d/%d] [Batch %d/%d] [Batch classify loss: %f]" % (epoch_index+1, self._args.epochs, batch_index+1, len(self._train_dataloader), loss.item()))
+                self.__stepresume__(epoch_index, batch_index, epoch_start, epoch_total_loss=epoch_total_loss, best_adv_test_accuracy=best_adv_test_accuracy, best_epoch=best_epoch, **scheduler.state(), **warm_state)
+
+            if torch.cuda.is_available():
+                torch.cuda.synchronize()
+            scheduler.addtrain(time.perf_counter() - epoch_train_start)
 
-                epoch_total_loss += loss
-                print("[Epoch %d/%d] [Batch %d/%d] [Batch classify loss: %f]" % (epoch_index+1, self._args.epochs, batch_index+1, len(self._train_dataloader), loss.item()))
-            
             epoch_cle_test_accuracy, epoch_cle_test_loss = self.evaluatefromtensor(self._model, self._cle_test_tensorset_x, self._cle_test_tensorset_y)
-            print(f'{epoch_index+1:04d} epoch rmt trained classifier accuary on the clean testing examples:{epoch_cle_test_accuracy*100:.4f}%' )  
-            print(f'{epoch_index+1:04d} epoch rmt trained classifier loss on the clean testing examples:{epoch_cle_test_loss:.4f}' )   
+            print(f'{epoch_index+1:04d} epoch {policy.name} trained classifier accuary on the clean testing examples:{epoch_cle_test_accuracy*100:.4f}%' )
+            print(f'{epoch_index+1:04d} epoch {policy.name} trained classifier loss on the clean testing examples:{epoch_cle_test_loss:.4f}' )
+
+            epoch_adv_test_accuracy = None
+            if warm is not None and scheduler.due(epoch_index, self._args.epochs) and not (epoch_index + 1 == self._args.epochs or warm.calibrating()):
+                warm_test_accuracy, warm_test_loss, (warm_ci_low, warm_ci_high), _ = self.__warmrobustevaluate__(scheduler, warm, calibrating=False)
+                print(f'{epoch_index+1:04d} epoch {policy.name} trained classifier accuary on warm started ({warm.warm_iter} steps, fast tracking only) adversarial testset:{warm_test_accuracy * 100:.4f}% (95% ci {warm_ci_low * 100:.2f}%-{warm_ci_high * 100:.2f}%)' )
+                self.__getmetrics__().scalar("epoch_warm_adv_acc", warm_test_accuracy, epoch_index + 1)
+                self.__getmetrics__().scalar("epoch_warm_adv_loss", warm_test_loss, epoch_index + 1)
+            elif self._args.blackbox == True or scheduler.due(epoch_index, self._args.epochs):                #   the stored blackbox testset is cheap, it is evaluated every epoch
+                if warm is not None:                                                                        #   full-strength calibration, the last epoch always is one
+                    epoch_adv_test_accuracy, epoch_adv_test_loss, (adv_ci_low, adv_ci_high), warm_gap = self.__warmrobustevaluate__(scheduler, warm, calibrating=True)
+                    if warm_gap is not None:
+                        print(f'{epoch_index+1:04d} epoch warm started accuracy minus full-strength accuracy:{warm_gap * 100:+.4f}%' )
+                        self.__getmetrics__().scalar("epoch_warm_adv_acc_gap", warm_gap, epoch_index + 1)
+                else:
+                    epoch_adv_test_accuracy, epoch_adv_test_loss, (adv_ci_low, adv_ci_high) = self.__robustevaluate__(scheduler)
+                print(f'{epoch_index+1:04d} epoch {policy.name} trained classifier accuary on adversarial testset:{epoch_adv_test_accuracy * 100:.4f}% (95% ci {adv_ci_low * 100:.2f}%-{adv_ci_high * 100:.2f}%)' )
+                print(f'{epoch_index+1:04d} epoch {policy.name} trained classifier loss on adversarial testset:{epoch_adv_test_loss}' )
+                self.__getmetrics__().scalar("epoch_adv_acc", epoch_adv_test_accuracy, epoch_index + 1)
+                self.__getmetrics__().scalar("epoch_adv_acc_ci_low", adv_ci_low, epoch_index + 1)
+                self.__getmetrics__().scalar("epoch_adv_acc_ci_high", adv_ci_high, epoch_index + 1)
+                self.__getmetrics__().scalar("epoch_adv_loss", epoch_adv_test_loss, epoch_index + 1)
+            else:
+                print(f'{epoch_index+1:04d} epoch {policy.name} robust evaluation skipped by the schedule')
 
-            if args.whitebox == True:
-                epoch_attack_classifier = AdvAttack(self._args, self._model)   
-                self._model = epoch_attack_classifier.targetmodel()            
-                epoch_x_test_adv, epoch_y_test_adv = epoch_attack_classifier.generateadvfromtestsettensor(self._cle_test_tensorset_x, self._cle_test_tensorset_y)         
-            elif args.blackbox == True:
-                epoch_x_test_adv = self._adv_test_tensorset_x
-                epoch_y_test_adv = self._adv_test_tensorset_y
+            if policy.saveepoch(self._args, epoch_index):
+                self.__getcheckpoints__().save(f'{policy.ckpt_prefix}-trained-classifier-{self._args.cla_model}-on-{self._args.dataset}-epoch-{epoch_index+1:04d}.pkl', self._model, self._optimizer, epoch=epoch_index + 1, metric=epoch_adv_test_accuracy)
+                if epoch_adv_test_accuracy is not None and epoch_adv_test_accuracy > best_adv_test_accuracy:
+                    best_adv_test_accuracy, best_epoch = epoch_adv_test_accuracy, epoch_index + 1
 
-            epoch_adv_test_accuracy, epoch_adv_test_loss = self.evaluatefromtensor(self._model,epoch_x_test_adv,epoch_y_test_adv)
-            print(f'{epoch_index+1:04d} epoch rmt trained classifier accuary on adversarial testset:{epoch_adv_test_accuracy * 100:.4f}%' ) 
-            print(f'{epoch_index+1:04d} epoch rmt trained classifier loss on adversarial testset:{epoch_adv_test_loss}' )    
+            self.__getmetrics__().scalar("epoch_cle_acc", epoch_cle_test_accuracy, epoch_index + 1)
+            self.__getmetrics__().scalar("epoch_cle_loss", epoch_cle_test_loss, epoch_index + 1)
+            self.__getmetrics__().scalar("epoch_augtrain_loss", epoch_total_loss/len(self._train_dataloader), epoch_index + 1)
+            warm_state = warm.state() if warm is not None else {}
+            self.__epochresume__(epoch_index, shuffle_index, best_adv_test_accuracy=best_adv_test_accuracy, best_epoch=best_epoch, **scheduler.state(), **warm_state)
 
-            if (epoch_index+1) >= 1 or self._args.dataset == "imagenetmixed10":
-                torch.save(self._model,f'{self._exp_result_dir}/rmt-trained-classifier-{self._args.cla_model}-on-{self._args.dataset}-epoch-{epoch_index+1:04d}.pkl')            
+        if self._args.whitebox == True and scheduler.partial():
+            self.__finalrobustevaluate__(policy, scheduler, best_epoch)
 
-            
-            tensorboard_log_adv_acc_dir = os.path.join(self._exp_result_dir,f'tensorboard-log-run-acc-adv')
-            os.makedirs(tensorboard_log_adv_acc_dir,exist_ok=True)    
-            writer_adv_acc = SummaryWriter(log_dir = tensorboard_log_adv_acc_dir, comment= '-'+'advtestacc') 
-            writer_adv_acc.add_scalar(tag = "epoch_adv_acc", scalar_value = epoch_adv_test_accuracy, global_step = epoch_index + 1 )
-            writer_adv_acc.close()
-
-           
-            tensorboard_log_adv_loss_dir = os.path.join(self._exp_result_dir,f'tensorboard-log-run-loss-adv')
-            os.makedirs(tensorboard_log_adv_loss_dir,exist_ok=True)    
-            writer_adv_loss = SummaryWriter(log_dir = tensorboard_log_adv_loss_dir, comment= '-'+'advtestloss') 
-            writer_adv_loss.add_scalar(tag = "epoch_adv_loss", scalar_value = epoch_adv_test_loss, global_step = epoch_index + 1 )
-            writer_adv_loss.close()
+    #   representation mixup training
+    def rmt(self, args,cle_w_train,cle_y_train, cle_train_dataloader, cle_x_test, cle_y_test, adv_x_test,adv_y_test,exp_result_dir,stylegan2ada_config_kwargs):
 
-            
-            tensorboard_log_cle_acc_dir = os.path.join(self._exp_result_dir,f'tensorboard-log-run-acc-cle')
-            os.makedirs(tensorboard_log_cle_acc_dir,exist_ok=True)    
-            writer_cle_acc = SummaryWriter(log_dir = tensorboard_log_cle_acc_dir, comment= '-'+'cletestacc') 
-            writer_cle_acc.add_scalar(tag = "epoch_cle_acc", scalar_value = epoch_cle_test_accuracy, global_step = epoch_index + 1 )
-            writer_cle_acc.close()
-
-            tensorboard_log_cle_loss_dir = os.path.join(self._exp_result_dir,f'tensorboard-log-run-loss-cle')
-            os.makedirs(tensorboard_log_cle_loss_dir,exist_ok=True)    
-            writer_cle_loss = SummaryWriter(log_dir = tensorboard_log_cle_loss_dir, comment= '-'+'cletestloss') 
-            writer_cle_loss.add_scalar(tag = "epoch_cle_loss", scalar_value = epoch_cle_test_loss, global_step = epoch_index + 1 )
-            writer_cle_loss.close()
-            
-            tensorboard_log_train_loss_dir = os.path.join(self._exp_result_dir,f'tensorboard-log-run-loss-train')
-            os.makedirs(tensorboard_log_train_loss_dir,exist_ok=True)    
-            writer_tra_loss = SummaryWriter(log_dir = tensorboard_log_train_loss_dir, comment= '-'+'augtrainloss') 
-            writer_tra_loss.add_scalar(tag = "epoch_augtrain_loss", scalar_value = epoch_total_loss/len(self._train_dataloader), global_step = epoch_index + 1 )
-            writer_tra_loss.close()
-            
+        print("cle_w_train.shape:",cle_w_train.shape)   
+        print("cle_y_train.shape:",cle_y_train.shape)
+
+        print("cle_x_test.shape:",cle_x_test.shape)
+        print("cle_y_test.shape:",cle_y_test.shape)        
+
+        print("adv_x_test.shape:",adv_x_test.shape)
+        print("adv_y_test.shape:",adv_y_test.shape) 
+
+        """
+        cle_w_train.shape: torch.Size([11339, 8, 512])
+        cle_y_train.shape: torch.Size([11339, 8, 10])
+        cle_x_test.shape: torch.Size([26032, 3, 32, 32])
+        cle_y_test.shape: torch.Size([26032])
+        adv_x_test.shape: torch.Size([26032, 3, 32, 32])
+        adv_y_test.shape: torch.Size([26032])
+        """
+        policy = LatentMixupPolicy(exp_result_dir, stylegan2ada_config_kwargs)
+        self.__defensetrainloop__(policy, exp_result_dir, cle_w_train, cle_y_train, cle_train_dataloader, cle_x_test, cle_y_test, adv_x_test, adv_y_test)
 
     def __adjustlearningrate__(self, epoch_index):
         if self._args.train_mode == 'cla-train':
@@ -1448,946 +1504,24 @@ class RMClassifier:
     # 20211107 input mixup train
     def inputmixuptrain(self,args, cle_x_train, cle_y_train, cle_train_dataloader, cle_x_test,cle_y_test,adv_x_test,adv_y_test,exp_result_dir):
         print("compare with---------input mixup train--------------")
-
-        print("cle_x_train.shape:",cle_x_train.shape)   
-        print("cle_y_train.shape:",cle_y_train.shape)
-
-        print("cle_x_test.shape:",cle_x_test.shape)
-        print("cle_y_test.shape:",cle_y_test.shape)        
-
-        print("adv_x_test.shape:",adv_x_test.shape)
-        print("adv_y_test.shape:",adv_y_test.shape) 
-
-        """
-        cle_x_test.shape: torch.Size([10000, 3, 32, 32])
-        cle_y_test.shape: torch.Size([10000])
-        adv_x_test.shape: torch.Size([10000, 3, 32, 32])
-        adv_y_test.shape: torch.Size([10000])
-        """
-
-        self._exp_result_dir = exp_result_dir
-        if self._args.defense_mode == "inputmixup":
-            self._exp_result_dir = os.path.join(self._exp_result_dir,f'inputmixup-{self._args.dataset}-dataset')
-        os.makedirs(self._exp_result_dir,exist_ok=True) 
-
-        if torch.cuda.is_available():
-            self._lossfunc.cuda()
-            self._model.cuda()         
-
-        self._train_tensorset_x = cle_x_train
-        self._train_tensorset_y = cle_y_train
-
-        self._adv_test_tensorset_x = adv_x_test
-        self._adv_test_tensorset_y = adv_y_test
-
-        self._cle_test_tensorset_x = cle_x_test
-        self._cle_test_tensorset_y = cle_y_test
-
-        self._train_dataloader = cle_train_dataloader
-
-        if args.whitebox == True:
-            epoch_attack_classifier = AdvAttack(args = self._args, learned_model= self.model())          
-            self._model = epoch_attack_classifier.targetmodel()
-            epoch_x_test_adv, epoch_y_test_adv = epoch_attack_classifier.generateadvfromtestsettensor(self._cle_test_tensorset_x, self._cle_test_tensorset_y) 
-        elif args.blackbox == True:
-            epoch_x_test_adv = self._adv_test_tensorset_x
-            epoch_y_test_adv = self._adv_test_tensorset_y     
-
-        epoch_adv_test_accuracy, epoch_adv_test_loss = self.evaluatefromtensor(self._model, epoch_x_test_adv,epoch_y_test_adv)
-        print(f'Accuary of before inputmixup trained classifier on adversarial testset:{epoch_adv_test_accuracy * 100:.4f}%' ) 
-        print(f'Loss of before inputmixup trained classifier on adversarial testset:{epoch_adv_test_loss}' )    
-        
-        w_trainset_len = len(self._train_tensorset_x)
-        batch_size = self._args.batch_size
-        w_batch_num = int(np.ceil(w_trainset_len / float(batch_size)))
-
-        print("w_trainset_len:",w_trainset_len)
-        print("batch_size:",batch_size)
-        print("w_batch_num:",w_batch_num)
-        """
-        w_trainset_len: 25397
-        batch_size: 256
-        w_batch_num: 100
-        """
-        shuffle_index = np.arange(w_trainset_len)
-        shuffle_index = torch.tensor(shuffle_index)
-
-        for epoch_index in range(self._args.epochs):
-            print("\n")
-            random.shuffle(shuffle_index)
-            self.__adjustlearningrate__(epoch_index)       
-
-            epoch_total_loss = 0
-
-            for batch_index, (raw_img_batch, raw_lab_batch) in enumerate(self._train_dataloader):    
-                raw_lab_batch = LongTensor(raw_lab_batch)                           
-                raw_lab_batch = torch.nn.functional.one_hot(raw_lab_batch, args.n_classes).float()
-
-                if (batch_index + 1) % w_batch_num == 0:
-                    right_index = w_trainset_len
-                else:
-                    right_index = ( (batch_index + 1) % w_batch_num ) * batch_size
-
-                cle_img_batch = self._train_tensorset_x[shuffle_index[(batch_index % w_batch_num) * batch_size : right_index]]
-                cle_lab_batch = self._train_tensorset_y[shuffle_index[(batch_index % w_batch_num) * batch_size : right_index]]                   
-                
-                mix_img_batch, mix_lab_batch = input_mixup_data(args, cle_img_batch, cle_lab_batch)        
-                
-                aug_x_train = torch.cat([raw_img_batch, mix_img_batch], dim=0)
-                aug_y_train = torch.cat([raw_lab_batch, mix_lab_batch], dim=0)
-                inputs = aug_x_train.cuda()
-                targets = aug_y_train.cuda()
-
-                self._model.train()              
-
-                if self._args.cla_model == 'inception_v3':
-                    outputs, aux = self._model(inputs)
-                elif self._args.cla_model == 'googlenet':
-                    outputs, aux1, aux2 = self._model(inputs)
-                else:
-                    outputs = self._model(inputs)
-
-                lossfunction = 'ce'
-                if lossfunction == 'ce':
-                    loss = self.__CustomSoftlossFunction__(outputs, targets)
-                elif lossfunction == 'mse':
-                    softmax_outputs = torch.nn.functional.softmax(outputs, dim = 1)                             
-                    cla_lossfun = torch.nn.MSELoss().cuda()
-                    loss = cla_lossfun(softmax_outputs, targets) 
-                elif lossfunction == 'cosine':
-                    softmax_outputs = torch.nn.functional.softmax(outputs, dim = 1)    
-                    cla_lossfun = torch.cosine_similarity                                                        
-                    loss = cla_lossfun(softmax_outputs, targets) 
-                    loss = 1 - loss         
-                    loss =loss.mean()
-
-                self._optimizer.zero_grad()
-                loss.backward()
-                self._optimizer.step()
-
-                epoch_total_loss += loss
-                print("[Epoch %d/%d] [Batch %d/%d] [Batch classify loss: %f]" % (epoch_index+1, self._args.epochs, batch_index+1, len(self._train_dataloader), loss.item()))
-
-            epoch_cle_test_accuracy, epoch_cle_test_loss = self.evaluatefromtensor(self._model, self._cle_test_tensorset_x, self._cle_test_tensorset_y)
-            print(f'{epoch_index+1:04d} epoch inputmixup trained classifier accuary on the clean testing examples:{epoch_cle_test_accuracy*100:.4f}%' )  
-            print(f'{epoch_index+1:04d} epoch inputmixup trained classifier loss on the clean testing examples:{epoch_cle_test_loss:.4f}' )   
-
-            if args.whitebox == True:
-                epoch_attack_classifier = AdvAttack(self._args, self._model)  
-                self._model = epoch_attack_classifier.targetmodel()              
-                epoch_x_test_adv, epoch_y_test_adv = epoch_attack_classifier.generateadvfromtestsettensor(self._cle_test_tensorset_x, self._cle_test_tensorset_y)         
-            elif args.blackbox == True:
-                epoch_x_test_adv = self._adv_test_tensorset_x
-                epoch_y_test_adv = self._adv_test_tensorset_y
-
-            epoch_adv_test_accuracy, epoch_adv_test_loss = self.evaluatefromtensor(self._model,epoch_x_test_adv,epoch_y_test_adv)               
-            print(f'{epoch_index+1:04d} epoch inputmixup trained classifier accuary on adversarial testset:{epoch_adv_test_accuracy * 100:.4f}%' ) 
-            print(f'{epoch_index+1:04d} epoch inputmixup trained classifier loss on adversarial testset:{epoch_adv_test_loss}' )    
-
-            if (epoch_index+1)  >= 28 or self._args.dataset == "imagenetmixed10":
-                torch.save(self._model,f'{self._exp_result_dir}/inputmixup-trained-classifier-{self._args.cla_model}-on-{self._args.dataset}-epoch-{epoch_index+1:04d}.pkl')   
-                
-            
-            tensorboard_log_adv_acc_dir = os.path.join(self._exp_result_dir,f'tensorboard-log-run-acc-adv')
-            os.makedirs(tensorboard_log_adv_acc_dir,exist_ok=True)    
-            writer_adv_acc = SummaryWriter(log_dir = tensorboard_log_adv_acc_dir, comment= '-'+'advtestacc') 
-            writer_adv_acc.add_scalar(tag = "epoch_adv_acc", scalar_value = epoch_adv_test_accuracy, global_step = epoch_index + 1 )
-            writer_adv_acc.close()
-           
-            tensorboard_log_adv_loss_dir = os.path.join(self._exp_result_dir,f'tensorboard-log-run-loss-adv')
-            os.makedirs(tensorboard_log_adv_loss_dir,exist_ok=True)    
-            writer_adv_loss = SummaryWriter(log_dir = tensorboard_log_adv_loss_dir, comment= '-'+'advtestloss') 
-            writer_adv_loss.add_scalar(tag = "epoch_adv_loss", scalar_value = epoch_adv_test_loss, global_step = epoch_index + 1 )
-            writer_adv_loss.close()
-            
-            tensorboard_log_cle_acc_dir = os.path.join(self._exp_result_dir,f'tensorboard-log-run-acc-cle')
-            os.makedirs(tensorboard_log_cle_acc_dir,exist_ok=True)    
-            writer_cle_acc = SummaryWriter(log_dir = tensorboard_log_cle_acc_dir, comment= '-'+'cletestacc') 
-            writer_cle_acc.add_scalar(tag = "epoch_cle_acc", scalar_value = epoch_cle_test_accuracy, global_step = epoch_index + 1 )
-            writer_cle_acc.close()
-           
-            tensorboard_log_cle_loss_dir = os.path.join(self._exp_result_dir,f'tensorboard-log-run-loss-cle')
-            os.makedirs(tensorboard_log_cle_loss_dir,exist_ok=True)    
-            writer_cle_loss = SummaryWriter(log_dir = tensorboard_log_cle_loss_dir, comment= '-'+'cletestloss') 
-            writer_cle_loss.add_scalar(tag = "epoch_cle_loss", scalar_value = epoch_cle_test_loss, global_step = epoch_index + 1 )
-            writer_cle_loss.close()
-            
-            tensorboard_log_train_loss_dir = os.path.join(self._exp_result_dir,f'tensorboard-log-run-loss-train')
-            os.makedirs(tensorboard_log_train_loss_dir,exist_ok=True)    
-            writer_tra_loss = SummaryWriter(log_dir = tensorboard_log_train_loss_dir, comment= '-'+'augtrainloss') 
-            writer_tra_loss.add_scalar(tag = "epoch_augtrain_loss", scalar_value = epoch_total_loss/len(self._train_dataloader), global_step = epoch_index + 1 )
-            writer_tra_loss.close()        
+        self.__defensetrainloop__(InputMixupPolicy(), exp_result_dir, cle_x_train, cle_y_train, cle_train_dataloader, cle_x_test, cle_y_test, adv_x_test, adv_y_test)
 
     def advtrain(self, args, cle_train_dataloader, adv_x_train, adv_y_train, cle_x_test, cle_y_test, adv_x_test, adv_y_test, exp_result_dir):
-        self._exp_result_dir = exp_result_dir
         self._lossfunc = torch.nn.CrossEntropyLoss()
+        self.__defensetrainloop__(AdversarialPolicy(), exp_result_dir, adv_x_train, adv_y_train, cle_train_dataloader, cle_x_test, cle_y_test, adv_x_test, adv_y_test)
 
-        if torch.cuda.is_available():
-            self._lossfunc.cuda()
-            self._model.cuda()       
-
-        self._train_tensorset_x = adv_x_train
-        self._train_tensorset_y = adv_y_train
-
-        self._adv_test_tensorset_x = adv_x_test
-        self._adv_test_tensorset_y = adv_y_test
-
-        self._cle_test_tensorset_x = cle_x_test
-        self._cle_test_tensorset_y = cle_y_test
-
-        self._train_dataloader = cle_train_dataloader
-
-        if args.whitebox == True:
-            epoch_attack_classifier = AdvAttack(args = self._args, learned_model= self.model())           
-            self._model = epoch_attack_classifier.targetmodel()
-            epoch_x_test_adv, epoch_y_test_adv = epoch_attack_classifier.generateadvfromtestsettensor(self._cle_test_tensorset_x, self._cle_test_tensorset_y) 
-        elif args.blackbox == True:
-            
-            epoch_x_test_adv = self._adv_test_tensorset_x
-            epoch_y_test_adv = self._adv_test_tensorset_y     
-
-        epoch_adv_test_accuracy, epoch_adv_test_loss = self.evaluatefromtensor(self._model, epoch_x_test_adv,epoch_y_test_adv)
-        print(f'Accuary of before rmt trained classifier on adversarial testset:{epoch_adv_test_accuracy * 100:.4f}%' ) 
-        print(f'Loss of before rmt trained classifier on adversarial testset:{epoch_adv_test_loss}' )    
-
-        adv_trainset_len = len(self._train_tensorset_x)
-        batch_size = self._args.batch_size
-        adv_batch_num = int(np.ceil(adv_trainset_len / float(batch_size)))
-
-        print("adv_trainset_len:",adv_trainset_len) 
-        print("batch_size:",batch_size)
-        print("adv_batch_num:",adv_batch_num)
-
-        shuffle_index = np.arange(adv_trainset_len)
-        shuffle_index = torch.tensor(shuffle_index)
-
-        for epoch_index in range(self._args.epochs):
-            print("\n")
-            random.shuffle(shuffle_index)
-            self.__adjustlearningrate__(epoch_index)     
-            epoch_total_loss = 0
-
-            for batch_index, (raw_img_batch, raw_lab_batch) in enumerate(self._train_dataloader):      
-
-                if (batch_index + 1) % adv_batch_num == 0:
-                    right_index = adv_trainset_len
-                else:
-                    right_index = ( (batch_index + 1) % adv_batch_num ) * batch_size
-
-                adv_img_batch = self._train_tensorset_x[shuffle_index[(batch_index % adv_batch_num) * batch_size : right_index]]
-                adv_lab_batch = self._train_tensorset_y[shuffle_index[(batch_index % adv_batch_num) * batch_size : right_index]]                   
-
-                aug_x_train = torch.cat([raw_img_batch, adv_img_batch], dim=0)
-                aug_y_train = torch.cat([raw_lab_batch, adv_lab_batch], dim=0)    
-                inputs = aug_x_train.cuda()
-                targets = aug_y_train.cuda()      
-                                      
-                self._model.train()      
-
-                if self._args.cla_model == 'inception_v3':
-                    outputs, aux = self._model(inputs)
-                elif self._args.cla_model == 'googlenet':
-                    outputs, aux1, aux2 = self._model(inputs)
-                else:
-                    outputs = self._model(inputs)
-
-                loss = self._lossfunc(outputs, targets)
-                
-                self._optimizer.zero_grad()
-                loss.backward()
-                self._optimizer.step()
-
-                epoch_total_loss += loss
-                print("[Epoch %d/%d] [Batch %d/%d] [Batch classify loss: %f]" % (epoch_index+1, self._args.epochs, batch_index+1, len(self._train_dataloader), loss.item()))
-                
-            epoch_cle_test_accuracy, epoch_cle_test_loss = self.evaluatefromtensor(self._model, self._cle_test_tensorset_x, self._cle_test_tensorset_y)
-            print(f'{epoch_index+1:04d} epoch at trained classifier accuary on the clean testing examples:{epoch_cle_test_accuracy*100:.4f}%' )  
-            print(f'{epoch_index+1:04d} epoch at trained classifier loss on the clean testing examples:{epoch_cle_test_loss:.4f}' )           
-
-            if args.whitebox == True:
-                epoch_attack_classifier = AdvAttack(self._args, self._model)  
-                self._model = epoch_attack_classifier.targetmodel()               
-                epoch_x_test_adv, epoch_y_test_adv = epoch_attack_classifier.generateadvfromtestsettensor(self._cle_test_tensorset_x, self._cle_test_tensorset_y)         
-            elif args.blackbox == True:
-                epoch_x_test_adv = self._adv_test_tensorset_x
-                epoch_y_test_adv = self._adv_test_tensorset_y
-
-            epoch_adv_test_accuracy, epoch_adv_test_loss = self.evaluatefromtensor(self._model,epoch_x_test_adv,epoch_y_test_adv)               
-            print(f'{epoch_index+1:04d} epoch at trained classifier accuary on adversarial testset:{epoch_adv_test_accuracy * 100:.4f}%' ) 
-            print(f'{epoch_index+1:04d} epoch at trained classifier loss on adversarial testset:{epoch_adv_test_loss}' )    
-
-            if (epoch_index+1)  >= 28 or self._args.dataset == "imagenetmixed10": 
-                torch.save(self._model,f'{self._exp_result_dir}/adversarial-trained-classifier-{self._args.cla_model}-on-{self._args.dataset}-epoch-{epoch_index+1:04d}.pkl')   
-
-            
-            tensorboard_log_adv_acc_dir = os.path.join(self._exp_result_dir,f'tensorboard-log-run-acc-adv')
-            os.makedirs(tensorboard_log_adv_acc_dir,exist_ok=True)    
-            writer_adv_acc = SummaryWriter(log_dir = tensorboard_log_adv_acc_dir, comment= '-'+'advtestacc') 
-            writer_adv_acc.add_scalar(tag = "epoch_adv_acc", scalar_value = epoch_adv_test_accuracy, global_step = epoch_index + 1 )
-            writer_adv_acc.close()
-           
-            tensorboard_log_adv_loss_dir = os.path.join(self._exp_result_dir,f'tensorboard-log-run-loss-adv')
-            os.makedirs(tensorboard_log_adv_loss_dir,exist_ok=True)    
-            writer_adv_loss = SummaryWriter(log_dir = tensorboard_log_adv_loss_dir, comment= '-'+'advtestloss') 
-            writer_adv_loss.add_scalar(tag = "epoch_adv_loss", scalar_value = epoch_adv_test_loss, global_step = epoch_index + 1 )
-            writer_adv_loss.close()
-            
-            tensorboard_log_cle_acc_dir = os.path.join(self._exp_result_dir,f'tensorboard-log-run-acc-cle')
-            os.makedirs(tensorboard_log_cle_acc_dir,exist_ok=True)    
-            writer_cle_acc = SummaryWriter(log_dir = tensorboard_log_cle_acc_dir, comment= '-'+'cletestacc') 
-            writer_cle_acc.add_scalar(tag = "epoch_cle_acc", scalar_value = epoch_cle_test_accuracy, global_step = epoch_index + 1 )
-            writer_cle_acc.close()
-           
-            tensorboard_log_cle_loss_dir = os.path.join(self._exp_result_dir,f'tensorboard-log-run-loss-cle')
-            os.makedirs(tensorboard_log_cle_loss_dir,exist_ok=True)    
-            writer_cle_loss = SummaryWriter(log_dir = tensorboard_log_cle_loss_dir, comment= '-'+'cletestloss') 
-            writer_cle_loss.add_scalar(tag = "epoch_cle_loss", scalar_value = epoch_cle_test_loss, global_step = epoch_index + 1 )
-            writer_cle_loss.close()
-            
-
-            
-            tensorboard_log_train_loss_dir = os.path.join(self._exp_result_dir,f'tensorboard-log-run-loss-train')
-            os.makedirs(tensorboard_log_train_loss_dir,exist_ok=True)    
-            writer_tra_loss = SummaryWriter(log_dir = tensorboard_log_train_loss_dir, comment= '-'+'augtrainloss') 
-            writer_tra_loss.add_scalar(tag = "epoch_augtrain_loss", scalar_value = epoch_total_loss/len(self._train_dataloader), global_step = epoch_index + 1 )
-            writer_tra_loss.close()
-            
     def manifoldmixuptrain(self,args, cle_x_train, cle_y_train, cle_train_dataloader, cle_x_test,cle_y_test,adv_x_test,adv_y_test,exp_result_dir):
         print("compare with---------manifold mixup train--------------")
-
-        print("cle_x_train.shape:",cle_x_train.shape)   
-        print("cle_y_train.shape:",cle_y_train.shape)
-
-        print("cle_x_test.shape:",cle_x_test.shape)
-        print("cle_y_test.shape:",cle_y_test.shape)        
-
-        print("adv_x_test.shape:",adv_x_test.shape)
-        print("adv_y_test.shape:",adv_y_test.shape)           
-        self._exp_result_dir = exp_result_dir
-        if self._args.defense_mode == "manifoldmixup":
-            self._exp_result_dir = os.path.join(self._exp_result_dir,f'manifoldmixup-{self._args.dataset}-dataset')
-        os.makedirs(self._exp_result_dir,exist_ok=True) 
-
-        if torch.cuda.is_available():
-            self._lossfunc.cuda()
-            self._model.cuda()        
-
-        self._train_tensorset_x = cle_x_train
-        self._train_tensorset_y = cle_y_train
-
-        self._adv_test_tensorset_x = adv_x_test
-        self._adv_test_tensorset_y = adv_y_test
-
-        self._cle_test_tensorset_x = cle_x_test
-        self._cle_test_tensorset_y = cle_y_test
-
-        self._train_dataloader = cle_train_dataloader
-
-        
-        if args.whitebox == True:
-            epoch_attack_classifier = AdvAttack(args = self._args, learned_model= self.model())              
-            self._model = epoch_attack_classifier.targetmodel()
-            epoch_x_test_adv, epoch_y_test_adv = epoch_attack_classifier.generateadvfromtestsettensor(self._cle_test_tensorset_x, self._cle_test_tensorset_y) 
-        elif args.blackbox == True:
-            epoch_x_test_adv = self._adv_test_tensorset_x
-            epoch_y_test_adv = self._adv_test_tensorset_y     
-
-        epoch_adv_test_accuracy, epoch_adv_test_loss = self.evaluatefromtensor(self._model, epoch_x_test_adv,epoch_y_test_adv)
-        print(f'Accuary of before manifoldmixup trained classifier on adversarial testset:{epoch_adv_test_accuracy * 100:.4f}%' ) 
-        print(f'Loss of before manifoldmixup trained classifier on adversarial testset:{epoch_adv_test_loss}' )    
-
-        w_trainset_len = len(self._train_tensorset_x)                               
-        batch_size = self._args.batch_size
-        w_batch_num = int(np.ceil(w_trainset_len / float(batch_size)))
-
-        print("w_trainset_len:",w_trainset_len)
-        print("batch_size:",batch_size)
-        print("w_batch_num:",w_batch_num)
-        """
-        w_trainset_len: 25397
-        batch_size: 256
-        w_batch_num: 100
-        """
-
-        shuffle_index = np.arange(w_trainset_len)   
-        shuffle_index = torch.tensor(shuffle_index)
-
-        for epoch_index in range(self._args.epochs):
-            print("\n")
-            random.shuffle(shuffle_index)
-            self.__adjustlearningrate__(epoch_index)       
-
-            epoch_total_loss = 0
-
-            for batch_index, (raw_img_batch, raw_lab_batch) in enumerate(self._train_dataloader):           
-
-                if (batch_index + 1) % w_batch_num == 0:
-                    right_index = w_trainset_len
-                else:
-                    right_index = ( (batch_index + 1) % w_batch_num ) * batch_size
-
-                cle_img_batch = self._train_tensorset_x[shuffle_index[(batch_index % w_batch_num) * batch_size : right_index]]
-                cle_lab_batch = self._train_tensorset_y[shuffle_index[(batch_index % w_batch_num) * batch_size : right_index]]                   
-                   
-                inputs = cle_img_batch.cuda()
-                targets = cle_lab_batch.cuda()
-
-                self._model.train()                                                                                                     
-                if self._args.cla_model == 'inception_v3':
-                    outputs, aux = self._model(inputs)
-                elif self._args.cla_model == 'googlenet':
-                    outputs, aux1, aux2 = self._model(inputs)
-                else:                                                                                                                   
-                                                                                                         
-                    outputs, targets = self._model(inputs, y=targets, defense_mode=self._args.defense_mode, beta_alpha=self._args.beta_alpha)    
-
-               
-                loss = self.__CustomSoftlossFunction__(outputs, targets)
-
-                self._optimizer.zero_grad()
-                loss.backward()
-                self._optimizer.step()
-
-                epoch_total_loss += loss
-                #------------------------------
-                print("[Epoch %d/%d] [Batch %d/%d] [Batch classify loss: %f]" % (epoch_index+1, self._args.epochs, batch_index+1, len(self._train_dataloader), loss.item()))           
-            epoch_cle_test_accuracy, epoch_cle_test_loss = self.evaluatefromtensor(self._model, self._cle_test_tensorset_x, self._cle_test_tensorset_y)
-            print(f'{epoch_index+1:04d} epoch manifoldmixup trained classifier accuary on the clean testing examples:{epoch_cle_test_accuracy*100:.4f}%' )  
-            print(f'{epoch_index+1:04d} epoch manifoldmixup trained classifier loss on the clean testing examples:{epoch_cle_test_loss:.4f}' )   
-
-            if args.whitebox == True:
-                
-                epoch_attack_classifier = AdvAttack(self._args, self._model)    
-                self._model = epoch_attack_classifier.targetmodel()                
-                epoch_x_test_adv, epoch_y_test_adv = epoch_attack_classifier.generateadvfromtestsettensor(self._cle_test_tensorset_x, self._cle_test_tensorset_y)         
-            elif args.blackbox == True:
-                 
-                epoch_x_test_adv = self._adv_test_tensorset_x
-                epoch_y_test_adv = self._adv_test_tensorset_y
-
-            epoch_adv_test_accuracy, epoch_adv_test_loss = self.evaluatefromtensor(self._model,epoch_x_test_adv,epoch_y_test_adv)               
-            print(f'{epoch_index+1:04d} epoch manifoldmixup trained classifier accuary on adversarial testset:{epoch_adv_test_accuracy * 100:.4f}%' ) 
-            print(f'{epoch_index+1:04d} epoch manifoldmixup trained classifier loss on adversarial testset:{epoch_adv_test_loss}' )    
-
-            if (epoch_index+1)  <=20 or (epoch_index+1) >= 28 or self._args.dataset == "imagenetmixed10":
-                torch.save(self._model,f'{self._exp_result_dir}/manifoldmixup-trained-classifier-{self._args.cla_model}-on-{self._args.dataset}-epoch-{epoch_index+1:04d}.pkl')   
-
-            
-            tensorboard_log_adv_acc_dir = os.path.join(self._exp_result_dir,f'tensorboard-log-run-acc-adv')
-            os.makedirs(tensorboard_log_adv_acc_dir,exist_ok=True)    
-               
-            writer_adv_acc = SummaryWriter(log_dir = tensorboard_log_adv_acc_dir, comment= '-'+'advtestacc') 
-            writer_adv_acc.add_scalar(tag = "epoch_adv_acc", scalar_value = epoch_adv_test_accuracy, global_step = epoch_index + 1 )
-            writer_adv_acc.close()
-            
-
-           
-            tensorboard_log_adv_loss_dir = os.path.join(self._exp_result_dir,f'tensorboard-log-run-loss-adv')
-            os.makedirs(tensorboard_log_adv_loss_dir,exist_ok=True)    
-            writer_adv_loss = SummaryWriter(log_dir = tensorboard_log_adv_loss_dir, comment= '-'+'advtestloss') 
-            writer_adv_loss.add_scalar(tag = "epoch_adv_loss", scalar_value = epoch_adv_test_loss, global_step = epoch_index + 1 )
-            writer_adv_loss.close()
-            
-
-            
-            tensorboard_log_cle_acc_dir = os.path.join(self._exp_result_dir,f'tensorboard-log-run-acc-cle')
-            os.makedirs(tensorboard_log_cle_acc_dir,exist_ok=True)    
-               
-            writer_cle_acc = SummaryWriter(log_dir = tensorboard_log_cle_acc_dir, comment= '-'+'cletestacc') 
-            writer_cle_acc.add_scalar(tag = "epoch_cle_acc", scalar_value = epoch_cle_test_accuracy, global_step = epoch_index + 1 )
-            writer_cle_acc.close()
-            
-
-           
-            tensorboard_log_cle_loss_dir = os.path.join(self._exp_result_dir,f'tensorboard-log-run-loss-cle')
-            os.makedirs(tensorboard_log_cle_loss_dir,exist_ok=True)    
-            writer_cle_loss = SummaryWriter(log_dir = tensorboard_log_cle_loss_dir, comment= '-'+'cletestloss') 
-            writer_cle_loss.add_scalar(tag = "epoch_cle_loss", scalar_value = epoch_cle_test_loss, global_step = epoch_index + 1 )
-            writer_cle_loss.close()
-            
-
-            
-            tensorboard_log_train_loss_dir = os.path.join(self._exp_result_dir,f'tensorboard-log-run-loss-train')
-            os.makedirs(tensorboard_log_train_loss_dir,exist_ok=True)    
-            writer_tra_loss = SummaryWriter(log_dir = tensorboard_log_train_loss_dir, comment= '-'+'augtrainloss') 
-            writer_tra_loss.add_scalar(tag = "epoch_augtrain_loss", scalar_value = epoch_total_loss/len(self._train_dataloader), global_step = epoch_index + 1 )
-            writer_tra_loss.close()
-            
+        self.__defensetrainloop__(ManifoldMixupPolicy('manifoldmixup'), exp_result_dir, cle_x_train, cle_y_train, cle_train_dataloader, cle_x_test, cle_y_test, adv_x_test, adv_y_test)
 
     def patchmixuptrain(self,args, cle_x_train, cle_y_train, cle_train_dataloader, cle_x_test,cle_y_test,adv_x_test,adv_y_test,exp_result_dir):
         print("compare with---------patch mixup train--------------")
+        self.__defensetrainloop__(ManifoldMixupPolicy('patchmixup'), exp_result_dir, cle_x_train, cle_y_train, cle_train_dataloader, cle_x_test, cle_y_test, adv_x_test, adv_y_test)
 
-        print("cle_x_train.shape:",cle_x_train.shape)   
-        print("cle_y_train.shape:",cle_y_train.shape)
-
-        print("cle_x_test.shape:",cle_x_test.shape)
-        print("cle_y_test.shape:",cle_y_test.shape)        
-
-        print("adv_x_test.shape:",adv_x_test.shape)
-        print("adv_y_test.shape:",adv_y_test.shape)           
-        self._exp_result_dir = exp_result_dir
-        if self._args.defense_mode == "patchmixup":
-            self._exp_result_dir = os.path.join(self._exp_result_dir,f'patchmixup-{self._args.dataset}-dataset')
-        os.makedirs(self._exp_result_dir,exist_ok=True) 
-
-        if torch.cuda.is_available():
-            self._lossfunc.cuda()
-            self._model.cuda()          
-
-        self._train_tensorset_x = cle_x_train
-        self._train_tensorset_y = cle_y_train
-
-        self._adv_test_tensorset_x = adv_x_test
-        self._adv_test_tensorset_y = adv_y_test
-
-        self._cle_test_tensorset_x = cle_x_test
-        self._cle_test_tensorset_y = cle_y_test
-
-        self._train_dataloader = cle_train_dataloader
-
-        w_trainset_len = len(self._train_tensorset_x)                               
-        batch_size = self._args.batch_size
-        w_batch_num = int(np.ceil(w_trainset_len / float(batch_size)))
-
-        print("w_trainset_len:",w_trainset_len)
-        print("batch_size:",batch_size)
-        print("w_batch_num:",w_batch_num)
-        """
-        w_trainset_len: 25397
-        batch_size: 256
-        w_batch_num: 100
-        """
-
-        shuffle_index = np.arange(w_trainset_len)   
-        shuffle_index = torch.tensor(shuffle_index)
-
-        for epoch_index in range(self._args.epochs):
-            print("\n")
-            random.shuffle(shuffle_index)
-            self.__adjustlearningrate__(epoch_index)       
-
-            epoch_total_loss = 0
-
-            for batch_index, (raw_img_batch, raw_lab_batch) in enumerate(self._train_dataloader):           
-                if (batch_index + 1) % w_batch_num == 0:
-                    right_index = w_trainset_len
-                else:
-                    right_index = ( (batch_index + 1) % w_batch_num ) * batch_size
-
-                cle_img_batch = self._train_tensorset_x[shuffle_index[(batch_index % w_batch_num) * batch_size : right_index]]
-                cle_lab_batch = self._train_tensorset_y[shuffle_index[(batch_index % w_batch_num) * batch_size : right_index]]                   
-                   
-                inputs = cle_img_batch.cuda()
-                targets = cle_lab_batch.cuda()
-                self._model.train()                                                                                                     
-                if self._args.cla_model == 'inception_v3':
-                    outputs, aux = self._model(inputs)
-                elif self._args.cla_model == 'googlenet':
-                    outputs, aux1, aux2 = self._model(inputs)
-                else:                                                                                                                                                                                                   
-                    outputs, targets = self._model(inputs, y=targets, defense_mode=self._args.defense_mode)    
-                loss = self.__CustomSoftlossFunction__(outputs, targets)
-
-                self._optimizer.zero_grad()
-                loss.backward()
-                self._optimizer.step()
-
-                epoch_total_loss += loss
-                print("[Epoch %d/%d] [Batch %d/%d] [Batch classify loss: %f]" % (epoch_index+1, self._args.epochs, batch_index+1, len(self._train_dataloader), loss.item()))           
-            
-            epoch_cle_test_accuracy, epoch_cle_test_loss = self.evaluatefromtensor(self._model, self._cle_test_tensorset_x, self._cle_test_tensorset_y)
-               
-            print(f'{epoch_index+1:04d} epoch patchmixup trained classifier accuary on the clean testing examples:{epoch_cle_test_accuracy*100:.4f}%' )  
-            print(f'{epoch_index+1:04d} epoch patchmixup trained classifier loss on the clean testing examples:{epoch_cle_test_loss:.4f}' )   
-
-            if args.whitebox == True:
-                epoch_attack_classifier = AdvAttack(self._args, self._model)    
-                self._model = epoch_attack_classifier.targetmodel()                
-                epoch_x_test_adv, epoch_y_test_adv = epoch_attack_classifier.generateadvfromtestsettensor(self._cle_test_tensorset_x, self._cle_test_tensorset_y)         
-            elif args.blackbox == True:
-                 
-                epoch_x_test_adv = self._adv_test_tensorset_x
-                epoch_y_test_adv = self._adv_test_tensorset_y
-
-            epoch_adv_test_accuracy, epoch_adv_test_loss = self.evaluatefromtensor(self._model,epoch_x_test_adv,epoch_y_test_adv)               
-            print(f'{epoch_index+1:04d} epoch patchmixup trained classifier accuary on adversarial testset:{epoch_adv_test_accuracy * 100:.4f}%' ) 
-            print(f'{epoch_index+1:04d} epoch patchmixup trained classifier loss on adversarial testset:{epoch_adv_test_loss}' )    
-            
-            if (epoch_index+1)  <=20 or (epoch_index+1) >= 28 or self._args.dataset == "imagenetmixed10":
-                torch.save(self._model,f'{self._exp_result_dir}/patchmixup-trained-classifier-{self._args.cla_model}-on-{self._args.dataset}-epoch-{epoch_index+1:04d}.pkl')   
-
-            tensorboard_log_adv_acc_dir = os.path.join(self._exp_result_dir,f'tensorboard-log-run-acc-adv')
-            os.makedirs(tensorboard_log_adv_acc_dir,exist_ok=True)    
-               
-            writer_adv_acc = SummaryWriter(log_dir = tensorboard_log_adv_acc_dir, comment= '-'+'advtestacc') 
-            writer_adv_acc.add_scalar(tag = "epoch_adv_acc", scalar_value = epoch_adv_test_accuracy, global_step = epoch_index + 1 )
-            writer_adv_acc.close()
-           
-            tensorboard_log_adv_loss_dir = os.path.join(self._exp_result_dir,f'tensorboard-log-run-loss-adv')
-            os.makedirs(tensorboard_log_adv_loss_dir,exist_ok=True)    
-            writer_adv_loss = SummaryWriter(log_dir = tensorboard_log_adv_loss_dir, comment= '-'+'advtestloss') 
-            writer_adv_loss.add_scalar(tag = "epoch_adv_loss", scalar_value = epoch_adv_test_loss, global_step = epoch_index + 1 )
-            writer_adv_loss.close()
-            
-            tensorboard_log_cle_acc_dir = os.path.join(self._exp_result_dir,f'tensorboard-log-run-acc-cle')
-            os.makedirs(tensorboard_log_cle_acc_dir,exist_ok=True)    
-               
-            writer_cle_acc = SummaryWriter(log_dir = tensorboard_log_cle_acc_dir, comment= '-'+'cletestacc') 
-            writer_cle_acc.add_scalar(tag = "epoch_cle_acc", scalar_value = epoch_cle_test_accuracy, global_step = epoch_index + 1 )
-            writer_cle_acc.close()
-
-            tensorboard_log_cle_loss_dir = os.path.join(self._exp_result_dir,f'tensorboard-log-run-loss-cle')
-            os.makedirs(tensorboard_log_cle_loss_dir,exist_ok=True)    
-            writer_cle_loss = SummaryWriter(log_dir = tensorboard_log_cle_loss_dir, comment= '-'+'cletestloss') 
-            writer_cle_loss.add_scalar(tag = "epoch_cle_loss", scalar_value = epoch_cle_test_loss, global_step = epoch_index + 1 )
-            writer_cle_loss.close()
-            
-            tensorboard_log_train_loss_dir = os.path.join(self._exp_result_dir,f'tensorboard-log-run-loss-train')
-            os.makedirs(tensorboard_log_train_loss_dir,exist_ok=True)    
-            writer_tra_loss = SummaryWriter(log_dir = tensorboard_log_train_loss_dir, comment= '-'+'augtrainloss') 
-            writer_tra_loss.add_scalar(tag = "epoch_augtrain_loss", scalar_value = epoch_total_loss/len(self._train_dataloader), global_step = epoch_index + 1 )
-            writer_tra_loss.close()
-            
     def puzzlemixuptrain(self,args, cle_x_train, cle_y_train, cle_train_dataloader, cle_x_test,cle_y_test,adv_x_test,adv_y_test,exp_result_dir):
         print("compare with---------puzzle mixup train--------------")
-        print("cle_x_train.shape:",cle_x_train.shape)   
-        print("cle_y_train.shape:",cle_y_train.shape)
-        print("cle_x_test.shape:",cle_x_test.shape)
-        print("cle_y_test.shape:",cle_y_test.shape)        
-        print("adv_x_test.shape:",adv_x_test.shape)
-        print("adv_y_test.shape:",adv_y_test.shape)      
-     
-        self._exp_result_dir = exp_result_dir
-        if self._args.defense_mode == "puzzlemixup":
-            self._exp_result_dir = os.path.join(self._exp_result_dir,f'puzzlemixup-{self._args.dataset}-dataset')
-        os.makedirs(self._exp_result_dir,exist_ok=True) 
-
-        if torch.cuda.is_available():
-            self._lossfunc.cuda()
-            self._model.cuda()          
-
-        self._train_tensorset_x = cle_x_train
-        self._train_tensorset_y = cle_y_train
-
-        self._adv_test_tensorset_x = adv_x_test
-        self._adv_test_tensorset_y = adv_y_test
-
-        self._cle_test_tensorset_x = cle_x_test
-        self._cle_test_tensorset_y = cle_y_test
-
-        self._train_dataloader = cle_train_dataloader
-        w_trainset_len = len(self._train_tensorset_x)             
-        batch_size = self._args.batch_size
-        w_batch_num = int(np.ceil(w_trainset_len / float(batch_size)))
-
-        print("batch_size:",batch_size)
-        print("w_batch_num:",w_batch_num)
-
-        shuffle_index = np.arange(w_trainset_len)   
-        shuffle_index = torch.tensor(shuffle_index)
-        unary = None
-
-        for epoch_index in range(self._args.epochs):
-            print("\n")
-            random.shuffle(shuffle_index)
-            self.__adjustlearningrate__(epoch_index)       
-
-            epoch_total_loss = 0
-
-            for batch_index, (raw_img_batch, raw_lab_batch) in enumerate(self._train_dataloader):           
-                raw_lab_batch = LongTensor(raw_lab_batch)                                                   
-                raw_lab_batch = torch.nn.functional.one_hot(raw_lab_batch, args.n_classes).float()
-                
-                if (batch_index + 1) % w_batch_num == 0:
-                    right_index = w_trainset_len
-                else:
-                    right_index = ( (batch_index + 1) % w_batch_num ) * batch_size
-
-                cle_img_batch = self._train_tensorset_x[shuffle_index[(batch_index % w_batch_num) * batch_size : right_index]]
-                cle_lab_batch = self._train_tensorset_y[shuffle_index[(batch_index % w_batch_num) * batch_size : right_index]]                   
-
-                inputs = cle_img_batch.cuda()
-                targets = cle_lab_batch.cuda()
-                
-                input_var = Variable(inputs, requires_grad=True)                 
-                target_var = Variable(targets)                                    
-                                    
-                self._model.eval()                                                      
-                output = self._model(input_var)                                         
-                loss_batch = self.__CustomSoftlossFunction__(output, target_var)                        
-                loss_batch_mean = torch.mean(loss_batch, dim=0)                        
-                loss_batch_mean.backward(retain_graph=True)
-                unary = torch.sqrt(torch.mean(input_var.grad**2, dim=1))        
-                self._model.train()                                                
-                self._optimizer.zero_grad()
-                input_var, target_var = Variable(inputs), Variable(targets)
-
-                mix_input_var, mix_target_var = puzzle_mixup_data(input_var, target_var, beta_alpha=self._args.beta_alpha, grad=unary)  签              
-
-                raw_img_batch = raw_img_batch.cuda()
-                raw_lab_batch = raw_lab_batch.cuda()
-                mix_input_var = mix_input_var.cuda()
-                mix_target_var = mix_target_var.cuda()
-
-                aug_x_train = torch.cat([raw_img_batch, mix_input_var], dim=0)
-                aug_y_train = torch.cat([raw_lab_batch, mix_target_var], dim=0)
-                inputs = aug_x_train.cuda()
-                targets = aug_y_train.cuda()
-
-                """
-                inputs.shape: torch.Size([4, 3, 32, 32])
-                targets.shape: torch.Size([4, 10])
-                """
-
-                self._model.train()                                                 
-                if self._args.cla_model == 'inception_v3':
-                    outputs, aux = self._model(inputs)
-                elif self._args.cla_model == 'googlenet':
-                    outputs, aux1, aux2 = self._model(inputs)
-                else:                                                                                       
-                    outputs = self._model(inputs)
-
-               
-                loss = self.__CustomSoftlossFunction__(outputs, targets)
-
-                self._optimizer.zero_grad()
-                loss.backward()
-                self._optimizer.step()
-
-                epoch_total_loss += loss
-                print("[Epoch %d/%d] [Batch %d/%d] [Batch classify loss: %f]" % (epoch_index+1, self._args.epochs, batch_index+1, len(self._train_dataloader), loss.item()))
-                
-            epoch_cle_test_accuracy, epoch_cle_test_loss = self.evaluatefromtensor(self._model, self._cle_test_tensorset_x, self._cle_test_tensorset_y)
-            
-            print(f'{epoch_index+1:04d} epoch puzzlemixup trained classifier accuary on the clean testing examples:{epoch_cle_test_accuracy*100:.4f}%' )  
-            print(f'{epoch_index+1:04d} epoch puzzlemixup trained classifier loss on the clean testing examples:{epoch_cle_test_loss:.4f}' )   
-
-            if args.whitebox == True:
-                
-                epoch_attack_classifier = AdvAttack(self._args, self._model)    
-                self._model = epoch_attack_classifier.targetmodel()                
-                epoch_x_test_adv, epoch_y_test_adv = epoch_attack_classifier.generateadvfromtestsettensor(self._cle_test_tensorset_x, self._cle_test_tensorset_y)         
-            elif args.blackbox == True:
-                 
-                epoch_x_test_adv = self._adv_test_tensorset_x
-                epoch_y_test_adv = self._adv_test_tensorset_y
-
-            epoch_adv_test_accuracy, epoch_adv_test_loss = self.evaluatefromtensor(self._model,epoch_x_test_adv,epoch_y_test_adv)               
-            print(f'{epoch_index+1:04d} epoch puzzlemixup trained classifier accuary on adversarial testset:{epoch_adv_test_accuracy * 100:.4f}%' ) 
-            print(f'{epoch_index+1:04d} epoch puzzlemixup trained classifier loss on adversarial testset:{epoch_adv_test_loss}' )    
-
-            if (epoch_index+1)  >= 28 or self._args.dataset == "imagenetmixed10":
-                torch.save(self._model,f'{self._exp_result_dir}/puzzlemixup-trained-classifier-{self._args.cla_model}-on-{self._args.dataset}-epoch-{epoch_index+1:04d}.pkl')   
-
-            
-            tensorboard_log_adv_acc_dir = os.path.join(self._exp_result_dir,f'tensorboard-log-run-acc-adv')
-            os.makedirs(tensorboard_log_adv_acc_dir,exist_ok=True)    
-               
-            writer_adv_acc = SummaryWriter(log_dir = tensorboard_log_adv_acc_dir, comment= '-'+'advtestacc') 
-            writer_adv_acc.add_scalar(tag = "epoch_adv_acc", scalar_value = epoch_adv_test_accuracy, global_step = epoch_index + 1 )
-            writer_adv_acc.close()
-            
-
-           
-            tensorboard_log_adv_loss_dir = os.path.join(self._exp_result_dir,f'tensorboard-log-run-loss-adv')
-            os.makedirs(tensorboard_log_adv_loss_dir,exist_ok=True)    
-            writer_adv_loss = SummaryWriter(log_dir = tensorboard_log_adv_loss_dir, comment= '-'+'advtestloss') 
-            writer_adv_loss.add_scalar(tag = "epoch_adv_loss", scalar_value = epoch_adv_test_loss, global_step = epoch_index + 1 )
-            writer_adv_loss.close()
-            
-
-            
-            tensorboard_log_cle_acc_dir = os.path.join(self._exp_result_dir,f'tensorboard-log-run-acc-cle')
-            os.makedirs(tensorboard_log_cle_acc_dir,exist_ok=True)    
-               
-            writer_cle_acc = SummaryWriter(log_dir = tensorboard_log_cle_acc_dir, comment= '-'+'cletestacc') 
-            writer_cle_acc.add_scalar(tag = "epoch_cle_acc", scalar_value = epoch_cle_test_accuracy, global_step = epoch_index + 1 )
-            writer_cle_acc.close()
-            
-
-           
-            tensorboard_log_cle_loss_dir = os.path.join(self._exp_result_dir,f'tensorboard-log-run-loss-cle')
-            os.makedirs(tensorboard_log_cle_loss_dir,exist_ok=True)    
-            writer_cle_loss = SummaryWriter(log_dir = tensorboard_log_cle_loss_dir, comment= '-'+'cletestloss') 
-            writer_cle_loss.add_scalar(tag = "epoch_cle_loss", scalar_value = epoch_cle_test_loss, global_step = epoch_index + 1 )
-            writer_cle_loss.close()
-            
-
-            
-            tensorboard_log_train_loss_dir = os.path.join(self._exp_result_dir,f'tensorboard-log-run-loss-train')
-            os.makedirs(tensorboard_log_train_loss_dir,exist_ok=True)    
-            writer_tra_loss = SummaryWriter(log_dir = tensorboard_log_train_loss_dir, comment= '-'+'augtrainloss') 
-            writer_tra_loss.add_scalar(tag = "epoch_augtrain_loss", scalar_value = epoch_total_loss/len(self._train_dataloader), global_step = epoch_index + 1 )
-            writer_tra_loss.close()
-            
+        self.__defensetrainloop__(PuzzleMixupPolicy(), exp_result_dir, cle_x_train, cle_y_train, cle_train_dataloader, cle_x_test, cle_y_test, adv_x_test, adv_y_test)
 
     def cutmixuptrain(self,args, cle_x_train, cle_y_train, cle_train_dataloader, cle_x_test,cle_y_test,adv_x_test,adv_y_test,exp_result_dir):
         print("compare with---------cut mixup train--------------")
-        print("cle_x_train.shape:",cle_x_train.shape)   
-        print("cle_y_train.shape:",cle_y_train.shape)
-        print("cle_x_test.shape:",cle_x_test.shape)
-        print("cle_y_test.shape:",cle_y_test.shape)        
-        print("adv_x_test.shape:",adv_x_test.shape)
-        print("adv_y_test.shape:",adv_y_test.shape)      
-     
-        self._exp_result_dir = exp_result_dir
-        if self._args.defense_mode == "cutmixup":
-            self._exp_result_dir = os.path.join(self._exp_result_dir,f'cutmixup-{self._args.dataset}-dataset')
-        os.makedirs(self._exp_result_dir,exist_ok=True) 
-
-        if torch.cuda.is_available():
-            self._lossfunc.cuda()
-            self._model.cuda()          
-
-        self._train_tensorset_x = cle_x_train
-        self._train_tensorset_y = cle_y_train
-
-        self._adv_test_tensorset_x = adv_x_test
-        self._adv_test_tensorset_y = adv_y_test
-
-        self._cle_test_tensorset_x = cle_x_test
-        self._cle_test_tensorset_y = cle_y_test
-
-        self._train_dataloader = cle_train_dataloader
-
-        w_trainset_len = len(self._train_tensorset_x)                               
-        batch_size = self._args.batch_size
-        w_batch_num = int(np.ceil(w_trainset_len / float(batch_size)))
-
-        # print("w_trainset_len:",w_trainset_len)
-        print("batch_size:",batch_size)
-        print("w_batch_num:",w_batch_num)
-
-        shuffle_index = np.arange(w_trainset_len)   
-        shuffle_index = torch.tensor(shuffle_index)
-        unary = None
-
-        for epoch_index in range(self._args.epochs):
-            print("\n")
-            random.shuffle(shuffle_index)
-            self.__adjustlearningrate__(epoch_index)       
-
-            epoch_total_loss = 0
-
-            for batch_index, (raw_img_batch, raw_lab_batch) in enumerate(self._train_dataloader):           
-                raw_lab_batch = LongTensor(raw_lab_batch)                                                   
-                raw_lab_batch = torch.nn.functional.one_hot(raw_lab_batch, args.n_classes).float()
-
-                if (batch_index + 1) % w_batch_num == 0:
-                    right_index = w_trainset_len
-                else:
-                    right_index = ( (batch_index + 1) % w_batch_num ) * batch_size
-
-                cle_img_batch = self._train_tensorset_x[shuffle_index[(batch_index % w_batch_num) * batch_size : right_index]]
-                cle_lab_batch = self._train_tensorset_y[shuffle_index[(batch_index % w_batch_num) * batch_size : right_index]]                   
-
-                inputs = cle_img_batch.cuda()
-                targets = cle_lab_batch.cuda()
-                
-                
-
-                input_var = Variable(inputs)                                        
-                target_var = Variable(targets)                                      
-
-
-                mix_input_var, mix_target_var = cut_mixup_data(input_var, target_var, self._args.beta_alpha)               
-
-
-                raw_img_batch = raw_img_batch.cuda()
-                raw_lab_batch = raw_lab_batch.cuda()
-                mix_input_var = mix_input_var.cuda()
-                mix_target_var = mix_target_var.cuda()
-
-                # print("raw_img_batch.shape",raw_img_batch.shape)
-                # print("raw_lab_batch.shape",raw_lab_batch.shape)
-                # print("mix_input_var.shape",mix_input_var.shape)
-                # print("mix_target_var.shape",mix_target_var.shape)
-
-                aug_x_train = torch.cat([raw_img_batch, mix_input_var], dim=0)
-                aug_y_train = torch.cat([raw_lab_batch, mix_target_var], dim=0)
-                inputs = aug_x_train.cuda()
-                targets = aug_y_train.cuda()
-
-                self._model.train()                                                 
-                if self._args.cla_model == 'inception_v3':
-                    outputs, aux = self._model(inputs)
-                elif self._args.cla_model == 'googlenet':
-                    outputs, aux1, aux2 = self._model(inputs)
-                else:                                                                                       
-                    outputs = self._model(inputs)
-
-               
-                loss = self.__CustomSoftlossFunction__(outputs, targets)
-
-                self._optimizer.zero_grad()
-                loss.backward()
-                self._optimizer.step()
-
-                epoch_total_loss += loss
-                #------------------------------
-                print("[Epoch %d/%d] [Batch %d/%d] [Batch classify loss: %f]" % (epoch_index+1, self._args.epochs, batch_index+1, len(self._train_dataloader), loss.item()))
-
-            epoch_cle_test_accuracy, epoch_cle_test_loss = self.evaluatefromtensor(self._model, self._cle_test_tensorset_x, self._cle_test_tensorset_y)
-               
-            
-            print(f'{epoch_index+1:04d} epoch cutmixup trained classifier accuary on the clean testing examples:{epoch_cle_test_accuracy*100:.4f}%' )  
-            print(f'{epoch_index+1:04d} epoch cutmixup trained classifier loss on the clean testing examples:{epoch_cle_test_loss:.4f}' )   
-
-            if args.whitebox == True:
-                
-                epoch_attack_classifier = AdvAttack(self._args, self._model)    
-                self._model = epoch_attack_classifier.targetmodel()                
-                epoch_x_test_adv, epoch_y_test_adv = epoch_attack_classifier.generateadvfromtestsettensor(self._cle_test_tensorset_x, self._cle_test_tensorset_y)         
-            elif args.blackbox == True:
-                 
-                epoch_x_test_adv = self._adv_test_tensorset_x
-                epoch_y_test_adv = self._adv_test_tensorset_y
-
-            epoch_adv_test_accuracy, epoch_adv_test_loss = self.evaluatefromtensor(self._model,epoch_x_test_adv,epoch_y_test_adv)               
-            print(f'{epoch_index+1:04d} epoch cutmixup trained classifier accuary on adversarial testset:{epoch_adv_test_accuracy * 100:.4f}%' ) 
-            print(f'{epoch_index+1:04d} epoch cutmixup trained classifier loss on adversarial testset:{epoch_adv_test_loss}' )    
-
-            if (epoch_index+1)  >= 28 or self._args.dataset == "imagenetmixed10":
-                torch.save(self._model,f'{self._exp_result_dir}/cutmixup-trained-classifier-{self._args.cla_model}-on-{self._args.dataset}-epoch-{epoch_index+1:04d}.pkl')   
-
-            
-            tensorboard_log_adv_acc_dir = os.path.join(self._exp_result_dir,f'tensorboard-log-run-acc-adv')
-            os.makedirs(tensorboard_log_adv_acc_dir,exist_ok=True)    
-               
-            writer_adv_acc = SummaryWriter(log_dir = tensorboard_log_adv_acc_dir, comment= '-'+'advtestacc') 
-            writer_adv_acc.add_scalar(tag = "epoch_adv_acc", scalar_value = epoch_adv_test_accuracy, global_step = epoch_index + 1 )
-            writer_adv_acc.close()
-            
-
-           
-            tensorboard_log_adv_loss_dir = os.path.join(self._exp_result_dir,f'tensorboard-log-run-loss-adv')
-            os.makedirs(tensorboard_log_adv_loss_dir,exist_ok=True)    
-            writer_adv_loss = SummaryWriter(log_dir = tensorboard_log_adv_loss_dir, comment= '-'+'advtestloss') 
-            writer_adv_loss.add_scalar(tag = "epoch_adv_loss", scalar_value = epoch_adv_test_loss, global_step = epoch_index + 1 )
-            writer_adv_loss.close()
-            
-
-            
-            tensorboard_log_cle_acc_dir = os.path.join(self._exp_result_dir,f'tensorboard-log-run-acc-cle')
-            os.makedirs(tensorboard_log_cle_acc_dir,exist_ok=True)    
-               
-            writer_cle_acc = SummaryWriter(log_dir = tensorboard_log_cle_acc_dir, comment= '-'+'cletestacc') 
-            writer_cle_acc.add_scalar(tag = "epoch_cle_acc", scalar_value = epoch_cle_test_accuracy, global_step = epoch_index + 1 )
-            writer_cle_acc.close()
-            
-
-           
-            tensorboard_log_cle_loss_dir = os.path.join(self._exp_result_dir,f'tensorboard-log-run-loss-cle')
-            os.makedirs(tensorboard_log_cle_loss_dir,exist_ok=True)    
-            writer_cle_loss = SummaryWriter(log_dir = tensorboard_log_cle_loss_dir, comment= '-'+'cletestloss') 
-            writer_cle_loss.add_scalar(tag = "epoch_cle_loss", scalar_value = epoch_cle_test_loss, global_step = epoch_index + 1 )
-            writer_cle_loss.close()
-            
-
-            
-            tensorboard_log_train_loss_dir = os.path.join(self._exp_result_dir,f'tensorboard-log-run-loss-train')
-            os.makedirs(tensorboard_log_train_loss_dir,exist_ok=True)    
-            writer_tra_loss = SummaryWriter(log_dir = tensorboard_log_train_loss_dir, comment= '-'+'augtrainloss') 
-            writer_tra_loss.add_scalar(tag = "epoch_augtrain_loss", scalar_value = epoch_total_loss/len(self._train_dataloader), global_step = epoch_index + 1 )
-            writer_tra_loss.close()
-                        
\ No newline at end of file
+        self.__defensetrainloop__(CutMixupPolicy(), exp_result_dir, cle_x_train, cle_y_train, cle_train_dataloader, cle_x_test, cle_y_test, adv_x_test, adv_y_test)
@@ -22,7 +22,7 @@ import utils.sampler
 
 def hidden_patchmixup_process(out, y, defense_mode):      
     batch_size = out.size()[0]
-    index = torch.randperm(batch_size).cuda()                           
+    index = torch.randperm(batch_size).to(out.device)                           
 
     """
     index: tensor([0, 1, 2, 3], device='cuda:0')
@@ -31,50 +31,19 @@ def hidden_patchmixup_process(out, y, defense_mode):
     y.shape: torch.Size([4, 10])
     """                      
     is_2d = True if len(out.size()) == 2 else False                 
-    m = utils.sampler.BernoulliSampler(out.size(0), out.size(1), is_2d, p=None)                                
+    m = utils.sampler.BernoulliSampler(out.size(0), out.size(1), is_2d, p=None).to(out.device)
 
-    lam = []
-    for i in range(len(m)):
-        lam_i = (torch.nonzero(m[i]).size(0)) / m.size(1)
-        lam.append(lam_i)
-
-    lam = np.asarray(lam)
-    lam = torch.tensor(lam).unsqueeze(1)
-
-    m1 = m.cpu()
-    m2 = (1.-m).cpu()
-    lam1 = lam.cpu()
-    lam2 = (1.-lam).cpu() 
-
-    """
-    lam1: tensor([[0.5039],[0.4727],[0.5547],[0.4922]], dtype=torch.float64)
-    lam2: tensor([[0.4961],[0.5273],[0.4453],[0.5078]], dtype=torch.float64)
-    """
+    #   share of the channels taken from w1, stays on the device and in the (autocast) dtype of out
+    lam = (m.reshape(batch_size, -1) != 0).sum(dim=1, keepdim=True).to(y.dtype) / m.size(1)
+    m = m.to(out.dtype)
 
     """
-    m1.shape: torch.Size([4, 64, 1, 1])
-    m2.shape: torch.Size([4, 64, 1, 1])
-    lam1.shape: torch.Size([4, 1])
-    lam2.shape: torch.Size([4, 1])
+    m.shape: torch.Size([4, 64, 1, 1])
+    lam: tensor([[0.5039],[0.4727],[0.5547],[0.4922]], device='cuda:0')
     """
 
-    w1 = out.cpu()
-    w2 = out[index,:].cpu()        
-    y1 = y.cpu()
-    y2 = y[index,:].cpu()
-
-    """
-    y1: tensor([[0., 0., 0., 0., 0., 0., 1., 0., 0., 0.],
-                [0., 0., 0., 0., 0., 0., 0., 0., 0., 1.],
-                [0., 0., 0., 0., 0., 0., 1., 0., 0., 0.],
-                [0., 0., 0., 0., 0., 0., 0., 0., 0., 1.]])
-    y2: tensor([[0., 0., 0., 0., 0., 0., 1., 0., 0., 0.],
-                [0., 0., 0., 0., 0., 0., 0., 0., 0., 1.],
-                [0., 0., 0., 0., 0., 0., 1., 0., 0., 0.],
-                [0., 0., 0., 0., 0., 0., 0., 0., 0., 1.]])
-    """
-    out = m1*w1 + m2*w2
-    mixed_y = lam1*y1 + lam2*y2
+    out = m*out + (1.-m)*out[index,:]
+    mixed_y = lam*y + (1.-lam)*y[index,:]
 
     """
     out.shape: torch.Size([4, 128, 16, 16])
@@ -84,14 +53,8 @@ def hidden_patchmixup_process(out, y, defense_mode):
                     [0.0000, 0.0000, 0.0000, 0.0000, 0.0000, 0.0000, 0.4688, 0.0000, 0.0000, 0.5312], 
                     [0.0000, 0.0000, 0.0000, 0.0000, 0.0000, 0.0000, 0.5781, 0.0000, 0.0000, 0.4219],
                     [0.0000, 0.0000, 0.0000, 0.0000, 0.0000, 0.0000, 0.0000, 0.0000, 0.0000, 1.0000]
-                    ], dtype=torch.float64)
-    mixed_y: tensor([[0., 0., 0., 0., 0., 0., 1., 0., 0., 0.],
-                    [0., 0., 0., 0., 0., 0., 0., 0., 0., 1.],
-                    [0., 0., 0., 0., 0., 0., 1., 0., 0., 0.],
-                    [0., 0., 0., 0., 0., 0., 0., 0., 0., 1.]], dtype=torch.float64)                    
+                    ], device='cuda:0')
     """                               
-    out=out.cuda()
-    mixed_y=mixed_y.cuda()
 
     return out, mixed_y
 
@@ -99,7 +62,7 @@ def hidden_manifoldmixup_process(out, y, defense_mode, beta_alpha):
     alpha=beta_alpha
     lam = np.random.beta(alpha, alpha)                              
     batch_size = out.size()[0]
-    index = torch.randperm(batch_size).cuda()                                                 
+    index = torch.randperm(batch_size).to(out.device)                                                 
 
     """
     index: tensor([24, 31, ..., 12, 29, 19],  device='cuda:0')
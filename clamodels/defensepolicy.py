@@ -0,0 +1,294 @@
+"""
+Author: maggie
+Date:   2022-06-15
+Place:  Xidian University
+@copyright
+"""
+
+import numpy as np
+import torch
+from torch.autograd import Variable
+from utils import puzzle
+from utils.pairindex import LatentPairIndex
+from genmodels.mixgenerate import MixGenerate
+from genmodels.mixpool import MixPool, MixPoolReplay, MixPoolExists
+
+def mixup_box(out, y, lam, index):
+    '''CutMix'''
+    input1=out
+    input2=out[index]
+    target1=y
+    target2=y[index]
+
+    batch_size, _, height, width = input1.shape
+    ratio = np.zeros([batch_size])
+
+    rx = np.random.uniform(0, height)
+    ry = np.random.uniform(0, width)
+    rh = np.sqrt(1 - lam) * height
+    rw = np.sqrt(1 - lam) * width
+
+    x1 = int(np.clip(rx - rh / 2, a_min=0., a_max=height))
+    x2 = int(np.clip(rx + rh / 2, a_min=0., a_max=height))
+    y1 = int(np.clip(ry - rw / 2, a_min=0., a_max=width))
+    y2 = int(np.clip(ry + rw / 2, a_min=0., a_max=width))
+
+    input1[:, :, x1:x2, y1:y2] = input2[:, :, x1:x2, y1:y2]
+    ratio += 1 - (x2 - x1) * (y2 - y1) / (width * height)
+    ratio = torch.tensor(ratio, dtype=torch.float32)
+    ratio = ratio.cuda()
+
+    mixed_x = input1
+    mixed_y = ratio.unsqueeze(-1) * target1 + (1 - ratio.unsqueeze(-1)) * target2
+
+    return mixed_x, mixed_y
+
+def cut_mixup_data(out, y, beta_alpha):
+    alpha=beta_alpha
+    lam = np.random.beta(alpha, alpha)
+    batch_size = out.size()[0]
+    index = torch.randperm(batch_size).cuda()
+    mix_x_train, mix_y_train = mixup_box(out, y, lam=lam, index=index)
+
+    return mix_x_train, mix_y_train
+
+def puzzle_mixup_data(out, y, beta_alpha, grad):
+    alpha=beta_alpha
+    lam = np.random.beta(alpha, alpha)
+    batch_size = out.size()[0]
+    index = torch.randperm(batch_size).cuda()
+    block_num = 2**np.random.randint(1, 5)
+    out, mixed_y = puzzle.mixup_graph(out=out, y=y, grad=grad, alpha=alpha, lam=lam, index=index, block_num=block_num, transport=True, std=1, mean=0)
+
+    return out, mixed_y
+
+
+def mixup_data(args, exp_result_dir, stylegan2ada_config_kwargs, inputs, targets, partner_inputs=None, partner_targets=None):
+    if args.gen_network_pkl != None:
+
+        generate_model = MixGenerate(args, exp_result_dir, stylegan2ada_config_kwargs)
+        generate_model.cle_w_train = inputs
+        generate_model.cle_y_train = targets
+        generate_model.partner_w_train = partner_inputs
+        generate_model.partner_y_train = partner_targets
+        mix_w_train, mix_y_train = generate_model.interpolate()
+        generate_model.mix_w_train = mix_w_train
+        generate_model.mix_y_train = mix_y_train
+        mix_x_train, mix_y_train = generate_model.generate()
+
+    else:
+        raise Exception("There is no gen_network_pkl, please load generative model first!")
+
+    return mix_x_train, mix_y_train
+
+def input_mixup_data(args, raw_img_batch, raw_lab_batch):
+    lam = np.random.beta(args.beta_alpha, args.beta_alpha)
+    batch_size = raw_img_batch.size()[0]
+    index = torch.randperm(batch_size).cuda()
+    mixed_img_batch = lam * raw_img_batch + (1 - lam) * raw_img_batch[index, :]
+    mixed_lab_batch = lam * raw_lab_batch + (1 - lam) * raw_lab_batch[index, :]
+    return mixed_img_batch,mixed_lab_batch
+
+class DefensePolicy:
+    r"""
+        What one defense mode trains on, plugged into RMClassifier.__defensetrainloop__.
+        The engine owns shuffling, the device copies, the optimizer step, evaluation, metrics, checkpoints and resume,
+        a policy only builds the training batch and, if needed, its own forward pass and loss.
+
+        attributes:
+            name: name of the defense mode in logs
+            ckpt_prefix: epoch checkpoint file prefix
+            result_subdir: the run saves into <exp_result_dir>/<name>-<dataset>-dataset when defense_mode is name
+            evaluate_before: evaluate on the adversarial testset before training
+
+        methods:
+            setup(classifier), beginepoch(classifier, epoch_index)
+            batch(classifier, raw_img_batch, raw_lab_batch, train_index) -> (inputs, targets) on the device
+            forward(classifier, inputs, targets) -> (outputs, targets)
+            loss(classifier, outputs, targets)
+            saveepoch(args, epoch_index): whether an epoch checkpoint is saved
+    """
+    name = None
+    ckpt_prefix = None
+    result_subdir = True
+    evaluate_before = True
+
+    def setup(self, classifier):
+        if classifier._args.pair_mode != 'batchshuffle':
+            raise Exception(f'--pair_mode picks partners in the projected w set of rmt, {self.name} trains on pixel batches and does not use it')
+        if classifier._args.mix_pool is not None:
+            raise Exception(f'--mix_pool holds samples generated from the projected w set of rmt, {self.name} does not use it')
+
+    def beginepoch(self, classifier, epoch_index):
+        pass
+
+    def onehot(self, classifier, raw_lab_batch):
+        return torch.nn.functional.one_hot(raw_lab_batch.long(), classifier._args.n_classes).float()
+
+    def trainbatch(self, classifier, train_index):
+        return classifier._train_tensorset_x[train_index].cuda(), classifier._train_tensorset_y[train_index].cuda()
+
+    def batch(self, classifier, raw_img_batch, raw_lab_batch, train_index):
+        raise NotImplementedError
+
+    def forward(self, classifier, inputs, targets):
+        return classifier.__trainforward__(inputs), targets
+
+    def loss(self, classifier, outputs, targets):
+        return classifier.__CustomSoftlossFunction__(outputs, targets)
+
+    def saveepoch(self, args, epoch_index):
+        return (epoch_index+1) >= 28 or args.dataset == "imagenetmixed10"
+
+class LatentMixupPolicy(DefensePolicy):
+    r"""
+        rmt: raw clean batch + images generated from mixed projected w (pairing by --pair_mode, or sampled from --mix_pool).
+    """
+    name = 'rmt'
+    ckpt_prefix = 'rmt'
+
+    def __init__(self, exp_result_dir, stylegan2ada_config_kwargs) -> None:
+        self._exp_result_dir = exp_result_dir
+        self._stylegan2ada_config_kwargs = stylegan2ada_config_kwargs
+        self._pair_index = None
+        self._mix_replay = None
+
+    def setup(self, classifier):
+        args = classifier._args
+        w_set = classifier._train_tensorset_x
+        y_set = classifier._train_tensorset_y
+        if args.pair_mode != 'batchshuffle':
+            print(f"building {args.pair_mode} pair index over {len(w_set)} projected w...")
+            self._pair_index = LatentPairIndex(w_set, y_set, pair_mode=args.pair_mode, knn_mode=args.knn_mode, knn_k=args.knn_k, ivf_bucket_num=args.ivf_bucket_num, knn_block_mb=args.knn_block_mb)
+
+        if args.mix_pool is not None:
+            pool_generate_model = MixGenerate(args, self._exp_result_dir, self._stylegan2ada_config_kwargs)
+            if MixPoolExists(args.mix_pool):
+                mix_pool = MixPool(args.mix_pool, in_memory = args.mix_pool_in_memory)
+            else:
+                mix_pool = pool_generate_model.buildmixpool(args.mix_pool, args.mix_pool_size, w_set, y_set)
+            mix_function = lambda num: pool_generate_model.mixgeneratebatch(w_set, y_set, num)
+            self._mix_replay = MixPoolReplay(mix_pool, mix_function, args.mix_refresh_ratio, args.batch_size)
+
+    def beginepoch(self, classifier, epoch_index):
+        if self._mix_replay is not None and epoch_index > 0:
+            self._mix_replay.refresh()
+
+    def batch(self, classifier, raw_img_batch, raw_lab_batch, train_index):
+        args = classifier._args
+        pro_img_batch = classifier._train_tensorset_x[train_index]
+        pro_lab_batch = classifier._train_tensorset_y[train_index]
+
+        partner_img_batch = None
+        partner_lab_batch = None
+        if self._pair_index is not None:
+            partner_index = self._pair_index.partners(train_index, args.mix_w_num - 1)                  #   [bs,mix_w_num-1]
+            partner_img_batch = classifier._train_tensorset_x[partner_index]
+            partner_lab_batch = classifier._train_tensorset_y[partner_index]
+
+        if self._mix_replay is not None:
+            mix_img_batch, mix_lab_batch = self._mix_replay.sample(len(pro_img_batch))
+        else:
+            mix_img_batch, mix_lab_batch = mixup_data(args, self._exp_result_dir, self._stylegan2ada_config_kwargs, pro_img_batch, pro_lab_batch, partner_img_batch, partner_lab_batch)
+
+        inputs = torch.cat([raw_img_batch, mix_img_batch.cuda()], dim=0)
+        targets = torch.cat([self.onehot(classifier, raw_lab_batch), mix_lab_batch.cuda()], dim=0)
+        return inputs, targets
+
+    def saveepoch(self, args, epoch_index):
+        return True
+
+class InputMixupPolicy(DefensePolicy):
+    r"""
+        inputmixup: raw clean batch + pixel space mixup of a clean batch.
+    """
+    name = 'inputmixup'
+    ckpt_prefix = 'inputmixup'
+
+    def batch(self, classifier, raw_img_batch, raw_lab_batch, train_index):
+        cle_img_batch, cle_lab_batch = self.trainbatch(classifier, train_index)
+        mix_img_batch, mix_lab_batch = input_mixup_data(classifier._args, cle_img_batch, cle_lab_batch)
+        inputs = torch.cat([raw_img_batch, mix_img_batch], dim=0)
+        targets = torch.cat([self.onehot(classifier, raw_lab_batch), mix_lab_batch], dim=0)
+        return inputs, targets
+
+class AdversarialPolicy(DefensePolicy):
+    r"""
+        at: raw clean batch + a batch of the precomputed adversarial trainset, hard label cross entropy.
+    """
+    name = 'at'
+    ckpt_prefix = 'adversarial'
+    result_subdir = False
+
+    def batch(self, classifier, raw_img_batch, raw_lab_batch, train_index):
+        adv_img_batch, adv_lab_batch = self.trainbatch(classifier, train_index)
+        inputs = torch.cat([raw_img_batch, adv_img_batch], dim=0)
+        targets = torch.cat([raw_lab_batch, adv_lab_batch], dim=0)
+        return inputs, targets
+
+    def loss(self, classifier, outputs, targets):
+        return classifier._lossfunc(outputs, targets)
+
+class ManifoldMixupPolicy(DefensePolicy):
+    r"""
+        manifoldmixup / patchmixup: the model mixes hidden features of a clean batch itself and returns the mixed targets.
+    """
+    def __init__(self, name) -> None:
+        self.name = name
+        self.ckpt_prefix = name
+        self.evaluate_before = name == 'manifoldmixup'
+
+    def batch(self, classifier, raw_img_batch, raw_lab_batch, train_index):
+        return self.trainbatch(classifier, train_index)
+
+    def forward(self, classifier, inputs, targets):
+        if classifier._args.cla_model in ['inception_v3', 'googlenet']:
+            return classifier.__trainforward__(inputs), targets
+        if self.name == 'manifoldmixup':
+            return classifier._model(inputs, y=targets, defense_mode=classifier._args.defense_mode, beta_alpha=classifier._args.beta_alpha)
+        return classifier._model(inputs, y=targets, defense_mode=classifier._args.defense_mode)
+
+    def saveepoch(self, args, epoch_index):
+        return (epoch_index+1) <= 20 or (epoch_index+1) >= 28 or args.dataset == "imagenetmixed10"
+
+class PuzzleMixupPolicy(DefensePolicy):
+    r"""
+        puzzlemixup: raw clean batch + puzzle mix of a clean batch guided by the input gradient saliency.
+    """
+    name = 'puzzlemixup'
+    ckpt_prefix = 'puzzlemixup'
+    evaluate_before = False
+
+    def batch(self, classifier, raw_img_batch, raw_lab_batch, train_index):
+        inputs, targets = self.trainbatch(classifier, train_index)
+
+        input_var = Variable(inputs, requires_grad=True)
+        target_var = Variable(targets)
+        classifier._model.eval()
+        output = classifier._model(input_var)
+        loss_batch = classifier.__CustomSoftlossFunction__(output, target_var)
+        loss_batch_mean = torch.mean(loss_batch, dim=0)
+        loss_batch_mean.backward(retain_graph=True)
+        unary = torch.sqrt(torch.mean(input_var.grad**2, dim=1))
+        classifier._model.train()
+        classifier._optimizer.zero_grad()
+
+        mix_input_var, mix_target_var = puzzle_mixup_data(Variable(inputs), Variable(targets), beta_alpha=classifier._args.beta_alpha, grad=unary)
+        inputs = torch.cat([raw_img_batch, mix_input_var.cuda()], dim=0)
+        targets = torch.cat([self.onehot(classifier, raw_lab_batch), mix_target_var.cuda()], dim=0)
+        return inputs, targets
+
+class CutMixupPolicy(DefensePolicy):
+    r"""
+        cutmixup: raw clean batch + cutmix of a clean batch.
+    """
+    name = 'cutmixup'
+    ckpt_prefix = 'cutmixup'
+    evaluate_before = False
+
+    def batch(self, classifier, raw_img_batch, raw_lab_batch, train_index):
+        cle_img_batch, cle_lab_batch = self.trainbatch(classifier, train_index)
+        mix_input_var, mix_target_var = cut_mixup_data(Variable(cle_img_batch), Variable(cle_lab_batch), classifier._args.beta_alpha)
+        inputs = torch.cat([raw_img_batch, mix_input_var.cuda()], dim=0)
+        targets = torch.cat([self.onehot(classifier, raw_lab_batch), mix_target_var.cuda()], dim=0)
+        return inputs, targets
@@ -0,0 +1,112 @@
+"""
+Author: maggie
+Date:   2022-06-15
+Place:  Xidian University
+@copyright
+"""
+
+import click
+import torch
+from clamodels.classifier import RMClassifier
+
+#----------------------------------------------------------------------------
+
+def LoopSoftloss(batch_outputs, o_batch, k=2):
+    """
+    The per sample soft label loss __CustomSoftlossFunction__ replaced: the label components are taken by repeated torch.max
+    of the label with the earlier ones zeroed, a label without further nonzero component falls back to w1 with zero weight.
+    k=2 is the original two-term loss alpha_1*CE(w1) + alpha_2*CE(w2).
+    """
+    cla_loss = torch.nn.CrossEntropyLoss(reduction = 'none')
+    loss = 0
+    for term_index in range(k):
+        alpha = []
+        label_index = []
+        for i in range(len(o_batch)):
+            modified_mixed_label = o_batch[i].clone()
+            w1_value, w1_index = torch.max(modified_mixed_label.unsqueeze(0), 1)
+            val, ind = w1_value, w1_index
+            for _ in range(term_index):
+                modified_mixed_label[ind] = 0
+                if torch.nonzero(modified_mixed_label).size(0) == 0:
+                    val, ind = torch.zeros(1, dtype = o_batch.dtype), w1_index
+                    break
+                val, ind = torch.max(modified_mixed_label.unsqueeze(0), 1)
+            alpha.append(val)
+            label_index.append(ind)
+        loss = loss + torch.cat(alpha) * cla_loss(batch_outputs, torch.cat(label_index))
+    return loss.mean()
+
+def RandomSoftLabels(samples, n_classes, generator):
+    """
+    Mixup like soft labels: one hot, two and three class mixes, dirichlet mixes and tied components.
+    """
+    o_batch = torch.zeros(samples, n_classes)
+    for i in range(samples):
+        classes = torch.randperm(n_classes, generator=generator)
+        kind = i % 6
+        if kind == 0:                                                                                   #   one hot
+            o_batch[i, classes[0]] = 1
+        elif kind == 1:                                                                                 #   two class mix
+            lam = torch.rand(1, generator=generator).item()
+            o_batch[i, classes[0]], o_batch[i, classes[1]] = lam, 1 - lam
+        elif kind == 2:                                                                                 #   three class mix
+            o_batch[i, classes[:3]] = torch.distributions.Dirichlet(torch.ones(3)).sample()
+        elif kind == 3:                                                                                 #   dirichlet over every class
+            o_batch[i] = torch.distributions.Dirichlet(torch.ones(n_classes)).sample()
+        elif kind == 4:                                                                                 #   tied top components
+            tie_num = 2 + i % 3
+            o_batch[i, classes[:tie_num]] = 1 / tie_num
+        else:                                                                                           #   tied second components
+            o_batch[i, classes[0]], o_batch[i, classes[1]], o_batch[i, classes[2]] = 0.5, 0.25, 0.25
+    return o_batch
+
+#----------------------------------------------------------------------------
+
+@click.command()
+@click.option('--samples', help='Random soft labels per check', type=int, default=600, show_default=True)
+@click.option('--n_classes', type=int, default=10, show_default=True)
+@click.option('--tol', help='Allowed abs difference of loss and logit gradients', type=float, default=1e-5, show_default=True)
+@click.option('--seed', type=int, default=0, show_default=True)
+def check_softloss(samples, n_classes, tol, seed):
+    """Check the topk / gather soft label loss of RMClassifier against the per sample loop it replaced.
+
+    Random logits and mixup like soft labels, tied label components included, are compared for k=2 and k=3
+    by the loss value and its gradient with respect to the logits.
+
+    Example:
+
+    \b
+    python -m clamodels.softlosscheck --samples=1200 --n_classes=100
+    """
+    torch.manual_seed(seed)
+    generator = torch.Generator().manual_seed(seed)
+    o_batch = RandomSoftLabels(samples, n_classes, generator)
+    logits = torch.randn(samples, n_classes, generator=generator) * 3
+
+    failed = []
+    for k in [2, 3]:
+        loop_outputs = logits.clone().requires_grad_(True)
+        loop_loss = LoopSoftloss(loop_outputs, o_batch, k)
+        loop_loss.backward()
+
+        vector_outputs = logits.clone().requires_grad_(True)
+        vector_loss = RMClassifier.__CustomSoftlossFunction__(None, vector_outputs, o_batch.clone(), k)
+        vector_loss.backward()
+
+        loss_diff = (loop_loss - vector_loss).abs().item()
+        grad_diff = (loop_outputs.grad - vector_outputs.grad).abs().max().item()
+        print(f'k={k} loop loss {loop_loss.item():.6f} | topk loss {vector_loss.item():.6f} | loss difference {loss_diff:.2e} | max abs grad difference {grad_diff:.2e}')
+        if loss_diff > tol or grad_diff > tol:
+            failed.append(f'k={k}')
+
+    if len(failed) > 0:
+        raise Exception(f'topk soft label loss differs from the per sample loop: {", ".join(failed)}')
+    print('topk soft label loss matches the per sample loop')
+
+#----------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    check_softloss() # pylint: disable=no-value-for-parameter
+
+#----------------------------------------------------------------------------
@@ -8,6 +8,7 @@ Place:  Xidian University
 import torch.utils.data
 from robustness.tools.imagenet_helpers import common_superclass_wnid, ImageNetHierarchy
 import robustness.datasets
+from datas.deviceloader import DeviceTensorLoader, MaterializeDataset
 
 
 class RMDataloader:
@@ -24,8 +25,24 @@ class RMDataloader:
     def testdataloader(self)->"torch.utils.data.DataLoader":
         return self._testdataloader
 
+    def __usedevicedataset__(self):
+        if not self._args.device_dataset:
+            return False
+        if self._args.dataset not in ['mnist','kmnist','cifar10','cifar100','svhn']:
+            print(f'--device_dataset is only supported for small datasets, *{self._args.dataset}* uses the torch dataloader')
+            return False
+        return True
+
+    def __loaddevicedataloader__(self, dataset, shuffle) ->"DeviceTensorLoader":
+        x_set, y_set = MaterializeDataset(dataset, num_workers=self._args.cpus)
+        dataloader = DeviceTensorLoader(x_set, y_set, self._args.batch_size, shuffle=shuffle, device_budget=self._args.device_dataset_budget)
+        print(f'{len(x_set)} *{self._args.dataset}* samples {"uploaded to the device" if dataloader.resident else "kept in pinned host memory"}')
+        return dataloader
+
     def __loadtraindataloader__(self) ->"torch.utils.data.DataLoader":
-        if self._args.dataset != 'imagenetmixed10':
+        if self.__usedevicedataset__():
+            train_dataloader = self.__loaddevicedataloader__(self._traindataset, shuffle=True)
+        elif self._args.dataset != 'imagenetmixed10':
             train_dataloader = torch.utils.data.DataLoader(   
                 self._traindataset,
                 batch_size=self._args.batch_size,
@@ -43,7 +60,9 @@ class RMDataloader:
         return train_dataloader
     
     def __loadtestdataloader__(self):
-        if self._args.dataset != 'imagenetmixed10':
+        if self.__usedevicedataset__():
+            test_dataloader = self.__loaddevicedataloader__(self._testdataset, shuffle=False)
+        elif self._args.dataset != 'imagenetmixed10':
             test_dataloader = torch.utils.data.DataLoader(                       
                 self._testdataset,
                 batch_size=self._args.batch_size,                                  
@@ -0,0 +1,108 @@
+"""
+Author: maggie
+Date:   2021-06-18
+Place:  Xidian University
+@copyright
+"""
+
+import torch
+import torch.utils.data
+
+def FitsOnDevice(tensors, device_budget):
+    """
+    Whether the tensors together take at most device_budget (fraction) of the currently free device memory.
+    """
+    if not torch.cuda.is_available():
+        return False
+    free_bytes, total_bytes = torch.cuda.mem_get_info()
+    need_bytes = sum(tensor.numel() * tensor.element_size() for tensor in tensors)
+    return need_bytes <= device_budget * free_bytes
+
+def MaterializeDataset(dataset, batch_size = 1024, num_workers = 0):
+    """
+    Run the (deterministic) transforms of every item once and stack the results into an (x_set, y_set) tensor set.
+    """
+    loader = torch.utils.data.DataLoader(dataset, batch_size=batch_size, shuffle=False, num_workers=num_workers)
+    x_set = []
+    y_set = []
+    for images, labels in loader:
+        x_set.append(images)
+        y_set.append(torch.as_tensor(labels))
+    return torch.cat(x_set), torch.cat(y_set)
+
+class DeviceTensorLoader:
+    r"""
+        DataLoader replacement over an in-memory tensor set, yielding (x, y) batches that are already on the device.
+        If the set fits in device_budget of the free device memory it is uploaded once, the permutation is drawn
+        on the device and batches are slices without host involvement. Otherwise the set stays in pinned host memory,
+        batches are gathered into two pinned staging buffers and copied with non_blocking=True.
+        The permutation comes from the global torch (cuda) rng, so the resume rng replay stays exact.
+
+        attributes:
+            x_set, y_set: the tensor set, on the device when resident
+            batch_size, shuffle, drop_last
+            device_budget: fraction of the free device memory the set may take
+            resident: whether the set lives on the device
+            dataset: TensorDataset view of the set, for len(loader.dataset) and per item access
+
+        methods:
+            __iter__(), __len__()
+    """
+    num_workers = 0
+
+    def __init__(self, x_set, y_set, batch_size, shuffle = True, drop_last = False, device_budget = 0.5) -> None:
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self._device = torch.device('cuda') if torch.cuda.is_available() else torch.device('cpu')
+        self.resident = FitsOnDevice([x_set, y_set], device_budget)
+        if self.resident:
+            self.x_set = x_set.to(self._device)
+            self.y_set = y_set.to(self._device)
+        else:
+            self.x_set = x_set.pin_memory() if torch.cuda.is_available() else x_set
+            self.y_set = y_set.pin_memory() if torch.cuda.is_available() else y_set
+        self.dataset = torch.utils.data.TensorDataset(self.x_set, self.y_set)
+        self._staging = None
+        self._staging_events = [None, None]
+
+    def __len__(self):
+        if self.drop_last:
+            return len(self.x_set) // self.batch_size
+        return (len(self.x_set) + self.batch_size - 1) // self.batch_size
+
+    def __iter__(self):
+        set_num = len(self.x_set)
+        index_device = self.x_set.device
+        if self.shuffle:
+            order = torch.randperm(set_num, device=index_device)
+        else:
+            order = torch.arange(set_num, device=index_device)
+
+        for batch_index in range(len(self)):
+            batch_order = order[batch_index * self.batch_size : (batch_index + 1) * self.batch_size]
+            if self.resident or self._device.type == 'cpu':
+                yield self.x_set[batch_order], self.y_set[batch_order]
+            else:
+                yield self.__stage__(batch_index % 2, batch_order)
+
+    def __stage__(self, slot, batch_order):
+        if self._staging is None:
+            self._staging = [
+                (torch.empty((self.batch_size,) + tuple(self.x_set.shape[1:]), dtype=self.x_set.dtype).pin_memory(),
+                 torch.empty((self.batch_size,) + tuple(self.y_set.shape[1:]), dtype=self.y_set.dtype).pin_memory())
+                for _ in range(2)
+            ]
+        if self._staging_events[slot] is not None:
+            self._staging_events[slot].synchronize()                                                    #   the copy out of this buffer two batches ago is done
+
+        x_staging, y_staging = self._staging[slot]
+        batch_num = len(batch_order)
+        torch.index_select(self.x_set, 0, batch_order, out=x_staging[:batch_num])
+        torch.index_select(self.y_set, 0, batch_order, out=y_staging[:batch_num])
+        x_batch = x_staging[:batch_num].to(self._device, non_blocking=True)
+        y_batch = y_staging[:batch_num].to(self._device, non_blocking=True)
+        copied = torch.cuda.Event()
+        copied.record()
+        self._staging_events[slot] = copied
+        return x_batch, y_batch
@@ -46,4 +46,64 @@ def EvaluateAccuracy(classifier, classify_loss, test_dataloader:torch.utils.data
     test_loss = epoch_total_loss / len(test_dataloader)     
 
     return test_accuracy,test_loss 
-    
\ No newline at end of file
+    
+def EvaluateAccuracyFromTensor(classifier, x_set, y_set, batch_size, return_logits=False):
+    """
+    Evaluate classifier on a tensor set with the correct count and the summed batch loss kept on the device,
+    so there is a single host sync at the end instead of one per batch.
+    A cpu x_set is staged through two pinned buffers and copied with non_blocking=True.
+    :returns: test_accuracy (float), test_loss (float, mean of the batch losses), and the [N, n_classes] device logits if return_logits
+    """
+    classifier.eval()
+    device = torch.device('cuda') if torch.cuda.is_available() else torch.device('cpu')
+    classifier.to(device)
+
+    testset_total_num = len(x_set)
+    batch_num = (testset_total_num + batch_size - 1) // batch_size
+    eva_loss = torch.nn.CrossEntropyLoss().to(device)
+
+    y_set = y_set.to(device, non_blocking=True)
+    staging = None
+    staging_events = [None, None]
+    if x_set.device.type == 'cpu' and device.type == 'cuda':
+        staging = [torch.empty((batch_size,) + tuple(x_set.shape[1:]), dtype=x_set.dtype).pin_memory() for _ in range(2)]
+
+    epoch_correct_num = torch.zeros((), dtype=torch.long, device=device)
+    epoch_total_loss = torch.zeros((), dtype=torch.float32, device=device)
+    logits = []
+
+    with torch.no_grad():
+        for batch_index in range(batch_num):
+            left_index = batch_index * batch_size
+            right_index = min(left_index + batch_size, testset_total_num)
+
+            if staging is not None:
+                slot = batch_index % 2
+                if staging_events[slot] is not None:
+                    staging_events[slot].synchronize()                                                  #   the copy issued from this buffer two batches ago is done
+                buffer = staging[slot][:right_index - left_index]
+                buffer.copy_(x_set[left_index : right_index])
+                imgs = buffer.to(device, non_blocking=True)
+                staging_events[slot] = torch.cuda.Event()
+                staging_events[slot].record()
+            else:
+                imgs = x_set[left_index : right_index].to(device, non_blocking=True)
+            labs = y_set[left_index : right_index]
+
+            output = classifier(imgs)
+            if isinstance(output, (tuple, list)):                                                      #   inception_v3 / googlenet auxiliary outputs
+                output = output[0]
+
+            epoch_total_loss += eva_loss(output, labs).float()
+            epoch_correct_num += (output.argmax(dim=1) == labs).sum()
+            if return_logits:
+                logits.append(output)
+
+    epoch_correct_num, epoch_total_loss = torch.stack([epoch_correct_num.float(), epoch_total_loss]).tolist()
+    test_accuracy = epoch_correct_num / testset_total_num
+    test_loss = epoch_total_loss / batch_num
+    classifier.train()
+
+    if return_logits:
+        return test_accuracy, test_loss, torch.cat(logits)
+    return test_accuracy, test_loss
@@ -0,0 +1,106 @@
+"""
+Author: maggie
+Date:   2022-06-15
+Place:  Xidian University
+@copyright
+"""
+
+import time
+import argparse
+import click
+import numpy as np
+import torch
+import torchvision
+from clamodels.classifier import RMClassifier
+from evaluations.accuracy import EvaluateAccuracyFromTensor
+
+#----------------------------------------------------------------------------
+
+def LoadCIFAR10Tensor(data_root, train):
+    dataset = torchvision.datasets.CIFAR10(root=data_root, train=train, download=True)
+    x_set = torch.tensor(dataset.data).permute(0, 3, 1, 2).float() / 255.0
+    y_set = torch.tensor(dataset.targets)
+    return x_set, y_set
+
+def SyntheticTensor(num, n_classes):
+    x_set = torch.rand(num, 3, 32, 32)
+    y_set = torch.randint(0, n_classes, (num,))
+    return x_set, y_set
+
+def BenchmarkClassifierTraining(cla_model, cla_amp, x_train, y_train, x_test, y_test, epochs, batch_size, lr, seed):
+    """
+    Train a fresh classifier through the RMClassifier amp step (soft label loss on one-hot labels).
+    :returns: training samples per second (first epoch excluded as warm up when epochs > 1), clean test accuracy
+    """
+    torch.manual_seed(seed)
+    np.random.seed(seed)
+    args = argparse.Namespace(cla_model=cla_model, cla_amp=cla_amp, n_classes=10, channels=3, img_size=32, pretrained_on_imagenet=False, lr=lr)
+    classifier = RMClassifier(args)
+    model = classifier.model().cuda()
+    x_train = x_train.cuda()
+    y_train = torch.nn.functional.one_hot(y_train, args.n_classes).float().cuda()
+
+    epoch_seconds = []
+    for epoch_index in range(epochs):
+        shuffle_index = torch.randperm(len(x_train), device='cuda')
+        torch.cuda.synchronize()
+        epoch_start = time.perf_counter()
+        model.train()
+        for batch_start in range(0, len(x_train), batch_size):
+            batch_index = shuffle_index[batch_start : batch_start + batch_size]
+            with classifier.__autocast__():
+                outputs = classifier.__trainforward__(x_train[batch_index])
+                loss = classifier.__CustomSoftlossFunction__(outputs, y_train[batch_index])
+            classifier.__optimizerstep__(loss)
+        torch.cuda.synchronize()
+        epoch_seconds.append(time.perf_counter() - epoch_start)
+        print(f'[{"amp" if cla_amp else "fp32"}] epoch {epoch_index+1}/{epochs}: {epoch_seconds[-1]:.2f}s, last batch loss {loss.item():.4f}')
+
+    timed_seconds = epoch_seconds[1:] if epochs > 1 else epoch_seconds
+    samples_per_sec = len(x_train) * len(timed_seconds) / sum(timed_seconds)
+    test_accuracy, test_loss = EvaluateAccuracyFromTensor(model, x_test, y_test, batch_size)
+    return samples_per_sec, test_accuracy
+
+#----------------------------------------------------------------------------
+
+@click.command()
+@click.option('--cla_model', help='Classifier architecture', default='preactresnet18', show_default=True)
+@click.option('--data', help='CIFAR-10 root, random images are used if omitted (throughput only)', default=None, metavar='PATH')
+@click.option('--epochs', help='Training epochs per precision', type=int, default=3, show_default=True)
+@click.option('--batch_size', type=int, default=256, show_default=True)
+@click.option('--lr', type=float, default=0.01, show_default=True)
+@click.option('--seed', type=int, default=0, show_default=True)
+def benchmark_amp(cla_model, data, epochs, batch_size, lr, seed):
+    """Compare fp32 and --cla_amp classifier training: throughput and clean test accuracy.
+
+    Example:
+
+    \b
+    python -m evaluations.ampbenchmark --cla_model=preactresnet18 --data=~/datasets/cifar10 --epochs=5
+    """
+    if not torch.cuda.is_available():
+        raise Exception('Torch cuda is not available')
+    torch.backends.cudnn.benchmark = True
+
+    if data is not None:
+        x_train, y_train = LoadCIFAR10Tensor(data, train=True)
+        x_test, y_test = LoadCIFAR10Tensor(data, train=False)
+    else:
+        x_train, y_train = SyntheticTensor(10000, 10)
+        x_test, y_test = SyntheticTensor(2000, 10)
+
+    results = {}
+    for cla_amp in [False, True]:
+        results[cla_amp] = BenchmarkClassifierTraining(cla_model, cla_amp, x_train, y_train, x_test, y_test, epochs, batch_size, lr, seed)
+
+    print(f'\n{cla_model}, {len(x_train)} training samples, batch size {batch_size}, {epochs} epochs')
+    for cla_amp, (samples_per_sec, test_accuracy) in results.items():
+        print(f'{"amp " if cla_amp else "fp32"}: {samples_per_sec:9.1f} samples/s, test accuracy {test_accuracy * 100:.2f}%')
+    print(f'speedup: {results[True][0] / results[False][0]:.2f}x, accuracy difference: {(results[True][1] - results[False][1]) * 100:+.2f}%')
+
+#----------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    benchmark_amp() # pylint: disable=no-value-for-parameter
+
+#----------------------------------------------------------------------------
@@ -0,0 +1,69 @@
+"""
+Author: maggie
+Date:   2022-06-15
+Place:  Xidian University
+@copyright
+"""
+
+import copy
+import time
+import torch
+from attacks.advattack import AdvAttack
+
+class CascadeEvaluator:
+    r"""
+        Whitebox robust accuracy under a cascade of pixel attacks ordered from cheap to strong: every stage attacks only the
+        samples that are still classified correctly after the clean evaluation and all earlier stages.
+        A sample counts as robust only if it survives every stage, so the final accuracy is the accuracy under the union
+        (per-sample worst case) of the attacks, never higher than that of any single stage run on the whole set.
+
+        attributes:
+            args: attack settings, the attack_mode of each stage replaces args.attack_mode
+            stages: attack modes, e.g. ['fgsm', 'pgd', 'autoattack']
+
+        methods:
+            evaluate(model, x_set, y_set): final robust accuracy and the per-stage results
+    """
+    def __init__(self, args, stages) -> None:
+        if len(stages) == 0:
+            raise Exception('please input at least one cascade attack')
+        self.args = args
+        self.stages = stages
+        self._attackers = {}
+
+    def __attacker__(self, stage, model):
+        if stage not in self._attackers:
+            stage_args = copy.copy(self.args)
+            stage_args.attack_mode = stage
+            self._attackers[stage] = AdvAttack(stage_args, model)
+        else:
+            self._attackers[stage].refresh(model)
+        return self._attackers[stage]
+
+    def evaluate(self, model, x_set, y_set):
+        """
+        :returns: final robust accuracy, list of per-stage dicts (stage, attacked, broken, robust_accuracy, seconds)
+        """
+        set_num = len(y_set)
+        y_set = torch.as_tensor(y_set)
+        attacker = self.__attacker__(self.stages[0], model)
+        _, _, logits = attacker.evaluatefromtensor(model, x_set, y_set, return_logits=True)
+        survivors = torch.nonzero(logits.argmax(dim=1).cpu() == y_set.cpu()).flatten()
+        stage_results = [{'stage': 'clean', 'attacked': set_num, 'broken': set_num - len(survivors), 'robust_accuracy': len(survivors) / set_num, 'seconds': 0.0}]
+        print(f'cascade clean: {len(survivors)}/{set_num} correctly classified')
+
+        for stage in self.stages:
+            stage_start = time.perf_counter()
+            attacked_num = len(survivors)
+            if attacked_num > 0:
+                attacker = self.__attacker__(stage, model)
+                x_adv, y_adv = attacker.generateadvfromtestsettensor(x_set[survivors.to(x_set.device)], y_set[survivors.to(y_set.device)])
+                _, _, logits = attacker.evaluatefromtensor(model, x_adv, y_adv, return_logits=True)
+                survivors = survivors[(logits.argmax(dim=1) == y_adv.to(logits.device)).cpu()]
+            if torch.cuda.is_available():
+                torch.cuda.synchronize()
+            stage_seconds = time.perf_counter() - stage_start
+            stage_results.append({'stage': stage, 'attacked': attacked_num, 'broken': attacked_num - len(survivors), 'robust_accuracy': len(survivors) / set_num, 'seconds': stage_seconds})
+            print(f'cascade {stage}: attacked {attacked_num}, broken {attacked_num - len(survivors)}, robust accuracy {len(survivors) / set_num * 100:.4f}% ({stage_seconds:.1f}s)')
+
+        return len(survivors) / set_num, stage_results
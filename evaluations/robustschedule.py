@@ -0,0 +1,150 @@
+"""
+Author: maggie
+Date:   2022-06-15
+Place:  Xidian University
+@copyright
+"""
+
+import math
+import torch
+
+def StratifiedSubsetIndex(y_set, subset_size, seed = 0):
+    """
+    Fixed subset of subset_size test samples with the class proportions of y_set (hard labels).
+    A private generator draws it, so the global rng stream of training (and --resume) is not touched.
+    :returns: sorted index tensor into y_set
+    """
+    y_set = torch.as_tensor(y_set).cpu().long()
+    set_num = len(y_set)
+    if subset_size is None or subset_size >= set_num:
+        return torch.arange(set_num)
+
+    generator = torch.Generator()
+    generator.manual_seed(seed)
+    classes, class_count = torch.unique(y_set, return_counts=True)
+    quota = (class_count.double() * subset_size / set_num).floor().long()
+    remainder = (class_count.double() * subset_size / set_num) - quota.double()
+    quota[torch.argsort(remainder, descending=True)[:subset_size - int(quota.sum())]] += 1          #   largest remainders fill the rounding gap
+
+    subset_index = []
+    for label, label_quota in zip(classes, quota):
+        label_index = torch.nonzero(y_set == label).flatten()
+        subset_index.append(label_index[torch.randperm(len(label_index), generator=generator)[:label_quota]])
+    return torch.sort(torch.cat(subset_index)).values
+
+def WilsonInterval(accuracy, sample_num, z = 1.96):
+    """
+    Wilson score interval of an accuracy measured on sample_num samples, 95% for z = 1.96.
+    """
+    if sample_num == 0:
+        return 0.0, 1.0
+    denominator = 1 + z**2 / sample_num
+    center = (accuracy + z**2 / (2 * sample_num)) / denominator
+    half_width = z * math.sqrt(accuracy * (1 - accuracy) / sample_num + z**2 / (4 * sample_num**2)) / denominator
+    return max(0.0, center - half_width), min(1.0, center + half_width)
+
+class RobustEvalScheduler:
+    r"""
+        Decide when a defense training run regenerates whitebox adversarial examples and on which test samples.
+
+        attributes:
+            subset_size: size of the fixed stratified evaluation subset, None evaluates the whole testset
+            eval_every: evaluate every eval_every epochs
+            time_budget: if set, evaluate whenever the evaluation time so far stays within time_budget * training time,
+                         replaces eval_every
+            seed: seed of the subset
+
+        methods:
+            subset(x_set, y_set): the evaluation subset of a testset
+            due(epoch_index, epoch_num): whether epoch epoch_index is evaluated, the last epoch always is
+            addtrain(seconds), addeval(seconds): time accounting of the budget policy
+            state(), loadstate(state): float state kept in the resume checkpoint
+    """
+    def __init__(self, subset_size = None, eval_every = 1, time_budget = None, seed = 0) -> None:
+        if eval_every < 1:
+            raise Exception('please input valid robust evaluation interval: eval_every >= 1')
+        self.subset_size = subset_size
+        self.eval_every = eval_every
+        self.time_budget = time_budget
+        self.seed = seed
+        self._subset_index = None
+        self._train_seconds = 0.0
+        self._eval_seconds = 0.0
+        self._last_eval_seconds = 0.0
+
+    def subset(self, x_set, y_set):
+        if self._subset_index is None:
+            self._subset_index = StratifiedSubsetIndex(y_set, self.subset_size, self.seed)
+        if len(self._subset_index) == len(y_set):
+            return x_set, y_set
+        return x_set[self._subset_index.to(x_set.device)], y_set[self._subset_index.to(y_set.device)]
+
+    def partial(self):
+        """
+        Whether scheduled evaluations see less than the whole testset or skip epochs.
+        """
+        return self.subset_size is not None or self.eval_every > 1 or self.time_budget is not None
+
+    def due(self, epoch_index, epoch_num):
+        if epoch_index + 1 == epoch_num:
+            return True
+        if self.time_budget is not None:
+            return self._eval_seconds + self._last_eval_seconds <= self.time_budget * self._train_seconds
+        return (epoch_index + 1) % self.eval_every == 0
+
+    def addtrain(self, seconds):
+        self._train_seconds += seconds
+
+    def addeval(self, seconds):
+        self._eval_seconds += seconds
+        self._last_eval_seconds = seconds
+
+    def state(self):
+        return {'robust_train_seconds': self._train_seconds, 'robust_eval_seconds': self._eval_seconds, 'robust_last_eval_seconds': self._last_eval_seconds}
+
+    def loadstate(self, state):
+        self._train_seconds = state.get('robust_train_seconds', 0.0)
+        self._eval_seconds = state.get('robust_eval_seconds', 0.0)
+        self._last_eval_seconds = state.get('robust_last_eval_seconds', 0.0)
+
+class WarmStartTracker:
+    r"""
+        Fast tracking of whitebox robustness during training: the adversarial examples of the last evaluation are kept per
+        evaluation sample and the next evaluation runs warm_iter bim / pgd steps from them instead of a full attack.
+        The resulting accuracy is a tracking metric, not a robustness claim. Every calibrate_every-th evaluation (and any
+        evaluation without cached examples, e.g. after --resume) is a full-strength attack that also measures how far the
+        warm started accuracy is from it.
+
+        attributes:
+            warm_iter: attack steps of a warm started evaluation
+            calibrate_every: every calibrate_every-th evaluation runs at full strength
+
+        methods:
+            calibrating(): whether the next evaluation is a full-strength one
+            init(): cached adversarial examples, None before the first evaluation
+            update(x_adv): cache the examples of an evaluation and count it
+            state(), loadstate(state): float state kept in the resume checkpoint
+    """
+    def __init__(self, warm_iter, calibrate_every = 5) -> None:
+        if warm_iter < 1 or calibrate_every < 1:
+            raise Exception('please input valid warm start settings: warm_iter >= 1 and calibrate_every >= 1')
+        self.warm_iter = warm_iter
+        self.calibrate_every = calibrate_every
+        self._x_adv = None
+        self._eval_count = 0
+
+    def calibrating(self):
+        return self._x_adv is None or self._eval_count % self.calibrate_every == 0
+
+    def init(self):
+        return self._x_adv
+
+    def update(self, x_adv):
+        self._x_adv = x_adv.detach()
+        self._eval_count += 1
+
+    def state(self):
+        return {'warm_eval_count': float(self._eval_count)}
+
+    def loadstate(self, state):
+        self._eval_count = int(state.get('warm_eval_count', 0.0))
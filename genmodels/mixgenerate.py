@@ -17,6 +17,9 @@ import genmodels.aae
 import genmodels.vae
 import genmodels.stylegan2
 import genmodels.stylegan2ada
+from genmodels.mixpool import MixPool
+from utils.latentset import LoadProjectedLatentSet, SelectLatentSubset
+from utils.artifactsink import LoadShardedNpz, ShardNpzPath
 import numpy as np
 import os
 
@@ -64,6 +67,26 @@ class GenModel:
     def ganmodel(self):
         return 2 
 
+class MixShardSink:
+    r"""
+        Save every (w, y, x) chunk of MixGenerate.mixgeneratestream() in the ArtifactSink shard layout: image, label and
+        mixed_projected_w shards with the samples under 'w' and their file names under 'names',
+        so the shard dir can be used as --mix_dataset (see getmixset() / LoadShardedNpz()).
+    """
+    def __init__(self, shard_dir) -> None:
+        self._shard_dir = shard_dir
+        self._shard_index = 0
+        self._sample_num = 0
+        os.makedirs(self._shard_dir, exist_ok=True)
+
+    def __call__(self, w_chunk, y_chunk, x_chunk):
+        sample_index = range(self._sample_num, self._sample_num + len(w_chunk))
+        for suffix, chunk in [('image', x_chunk), ('label', y_chunk), ('mixed_projected_w', w_chunk)]:
+            names = np.asarray([f'{index:08d}-mixed-{suffix}.npz' for index in sample_index])
+            np.savez(ShardNpzPath(self._shard_dir, self._shard_index, suffix), names = names, w = chunk.numpy())
+        self._shard_index = self._shard_index + 1
+        self._sample_num = self._sample_num + len(w_chunk)
+
 class MixGenerate:
     r"""
         introduce this class
@@ -73,6 +96,9 @@ class MixGenerate:
         self._args = args
         self._exp_result_dir = exp_result_dir
         self._stylegan2ada_config_kwargs = stylegan2ada_config_kwargs
+        self.partner_w_train = None
+        self.partner_y_train = None
+        self._G = None
 
         if self._args.gen_model == "stylegan2ada":
             self._model = genmodels.stylegan2ada.MaggieStylegan2ada(self._args)                                                
@@ -159,7 +185,7 @@ class MixGenerate:
                     """                                    
                     for batch_index in range(batch_num):
                         print("batch_index:",batch_index)                     
-                        for batch_idx, (imgs, labs) in enumerate(cle_train_dataloader):   集                          
+                        for batch_idx, (imgs, labs) in enumerate(cle_train_dataloader):                          
                             print("batch_idx:",batch_idx)
 
                             if batch_idx == batch_index:
@@ -212,6 +238,19 @@ class MixGenerate:
 
     def interpolatemain(self):
 
+        if self._args.mix_pool is not None:
+            self.buildmixpool(self._args.mix_pool, self._args.mix_pool_size)
+            return
+
+        if self._args.mix_chunk_size is not None:
+            shard_dir = os.path.join(self._exp_result_dir, f'generate-{self._args.dataset}-trainset-shards')
+            mix_num = 0
+            for w_chunk, _, _ in self.mixgeneratestream(self._args.mix_chunk_size, [MixShardSink(shard_dir)]):
+                mix_num = mix_num + len(w_chunk)
+                print(f"generated {mix_num} interpolated samples")
+            print(f"Finished interpolate and generate {self._args.dataset} {mix_num} samples into {shard_dir}!")
+            return
+
         mix_w_train, mix_y_train = self.interpolate()                                                                            
         self.mix_w_train = mix_w_train
         self.mix_y_train = mix_y_train
@@ -234,6 +273,66 @@ class MixGenerate:
         self.generated_y_train = generated_y_train
         print(f"Finished generate {self._args.dataset} {len(self.mix_w_train)} interpolated samples!")
 
+    def mixgeneratestream(self, chunk_size = None, sinks = None):
+        """
+        Interpolate and generate chunk by chunk, yielding (w, y, x) chunks of chunk_size samples.
+        Every sink is called as sink(w, y, x) on each chunk before it is yielded,
+        so memory stays bounded by one chunk whatever mix_img_num is.
+        """
+        if chunk_size is None:
+            chunk_size = self._args.batch_size
+        if sinks is None:
+            sinks = []
+
+        if self._args.gen_model == "stylegan2ada":
+            if self._args.projected_dataset is None and self._args.projected_w1 is None:
+                interpolated_wy_iter = self._model.interpolatestream(self._exp_result_dir, self.cle_w_train, self.cle_y_train)
+            else:
+                interpolated_wy_iter = self._model.interpolatestream(self._exp_result_dir)
+
+            for w_chunk, y_chunk, x_chunk in self._model.generatestream(self._exp_result_dir, interpolated_wy_iter, chunk_size):
+                for sink in sinks:
+                    sink(w_chunk, y_chunk, x_chunk)
+                yield w_chunk, y_chunk, x_chunk
+        else:
+            raise Exception(f'{self._args.gen_model} does not support streaming generation')
+
+    def mixgeneratebatch(self, w_set, y_set, num):
+        """
+        Draw num random projected w from w_set, mix them with in-batch partners and synthesize them.
+        G is loaded once and kept for later calls.
+        """
+        if self._G is None:
+            self._G = self._model.loadgenerator()
+        index = torch.randint(len(w_set), (num,))
+        _, mix_y, mix_x = self._model.mixbatch(self._G, w_set[index], y_set[index])
+        return mix_x, mix_y
+
+    def buildmixpool(self, pool_dir, pool_size, w_set = None, y_set = None):
+        """
+        Offline build of a MixPool of pool_size generated mixed samples from the projected w set.
+        """
+        if w_set is None:
+            w_set, y_set = LoadProjectedLatentSet(self._args.projected_dataset, cache_dir=self._args.projected_cache_dir)
+            w_set, y_set = SelectLatentSubset(w_set, y_set, index=self._args.projected_index, classes=self._args.projected_classes)
+            w_set = torch.from_numpy(w_set)
+            y_set = torch.from_numpy(y_set)
+        if pool_size is None:
+            pool_size = len(w_set)
+
+        batch_size = self._args.batch_size
+        mix_pool = None
+        for start in range(0, pool_size, batch_size):
+            mix_x, mix_y = self.mixgeneratebatch(w_set, y_set, min(batch_size, pool_size - start))
+            if mix_pool is None:
+                mix_pool = MixPool(pool_dir, pool_size, self._args.mix_pool_shard_size, x_shape = mix_x.shape[1:], class_num = mix_y.size(1), x_dtype = self._args.mix_pool_dtype)
+            mix_pool.write(np.arange(start, start + len(mix_x)), mix_x, mix_y)
+            print(f"built {start + len(mix_x)}/{pool_size} mixed samples of the mix pool")
+        mix_pool.finish()
+
+        print(f"Finished building {self._args.dataset} mix pool of {pool_size} samples in {pool_dir}!")
+        return mix_pool
+
     def mixgenerate(self,cle_train_dataloader) -> "tensor" :
 
         if self._args.mix_dataset == None:     
@@ -257,36 +356,36 @@ class MixGenerate:
             return self.generated_x_train,self.generated_y_train
 
     def getmixset(self,mix_dataset_path):
-        
+        """
+        Mixed images and labels of mix_dataset_path, saved one npz per sample or packed by --sink_shard_size.
+        """
         file_dir=os.listdir(mix_dataset_path)
         file_dir.sort()
 
-        img_filenames = [name for name in file_dir if os.path.splitext(name)[-1] == '.npz' and name[-9:-4] == 'image']           
-        label_filenames = [name for name in file_dir if os.path.splitext(name)[-1] == '.npz' and name[-9:-4] == 'label']           
-        
         select_mix_num = int( self._args.aug_mix_rate * self._args.aug_num )
-        
-        mix_xset_tensor = []
-        for miximg_index, img_filename in enumerate(img_filenames):
-            if miximg_index < select_mix_num:
-                mix_img_npz_path = os.path.join(mix_dataset_path,img_filename)
-                load_mix_img = np.load(mix_img_npz_path)['w']            
-                load_mix_img = torch.tensor(load_mix_img)
-                mix_xset_tensor.append(load_mix_img)
-
-        mix_yset_tensor = []
-        for mixy_index, lab_filename in enumerate(label_filenames):
-            if mixy_index < select_mix_num:  
-                mix_lab_npz_path = os.path.join(mix_dataset_path,lab_filename)
-                load_mix_lab = np.load(mix_lab_npz_path)['w']            
-                load_mix_lab = torch.tensor(load_mix_lab)
-                mix_yset_tensor.append(load_mix_lab)
-
-        mix_xset_tensor = torch.stack(mix_xset_tensor)                                                                         
-        mix_yset_tensor = torch.stack(mix_yset_tensor)  
+        mix_xset_tensor = self.__loadmixfield__(mix_dataset_path, file_dir, 'image', select_mix_num)
+        mix_yset_tensor = self.__loadmixfield__(mix_dataset_path, file_dir, 'label', select_mix_num)
 
         return mix_xset_tensor.cuda(), mix_yset_tensor.cuda()
 
+    def __loadmixfield__(self, mix_dataset_path, file_dir, suffix, select_mix_num):
+        filenames = [name for name in file_dir if os.path.splitext(name)[-1] == '.npz' and name[-9:-4] == suffix]
+        shard_filenames, shard_arrays = LoadShardedNpz(mix_dataset_path, suffix)
+
+        names = filenames + shard_filenames
+        if len(names) == 0:
+            raise Exception(f'there is no mixed {suffix} npz in {mix_dataset_path}')
+        order = sorted(range(len(names)), key=lambda name_index: names[name_index])[:select_mix_num]
+
+        mix_set_tensor = []
+        for name_index in order:
+            if name_index < len(filenames):
+                load_mix = np.load(os.path.join(mix_dataset_path, filenames[name_index]))['w']
+            else:
+                load_mix = shard_arrays[name_index - len(filenames)]
+            mix_set_tensor.append(torch.tensor(load_mix))
+        return torch.stack(mix_set_tensor)
+
     def project(self):
         if self._args.gen_model == "stylegan2ada":
 
@@ -323,7 +422,7 @@ class MixGenerate:
             """
             if self._args.defense_mode == 'rmt':
 
-                self._model.interpolate(self._exp_result_dir, self.cle_w_train, self.cle_y_train)
+                self._model.interpolate(self._exp_result_dir, self.cle_w_train, self.cle_y_train, self.partner_w_train, self.partner_y_train)
                 mix_w_train, mix_y_train = self._model.mixwyset()  
 
             else:
@@ -0,0 +1,150 @@
+"""
+Author: maggie
+Date:   2022-06-15
+Place:  Xidian University
+@copyright
+"""
+
+import os
+import json
+import numpy as np
+import torch
+
+def MixPoolExists(pool_dir):
+    """
+    Whether pool_dir holds a finished mix pool, mixpool.json is only written once every sample is stored.
+    """
+    return pool_dir is not None and os.path.exists(os.path.join(pool_dir, 'mixpool.json'))
+
+class MixPool:
+    r"""
+        Pool of generated mixed samples saved as sharded npy arrays under pool_dir.
+        Images are stored as uint8 (x*127.5+128, the stylegan2ada png convention) or float16, soft labels as float16.
+        A new pool gets its mixpool.json from finish(), so an interrupted build is never taken for a finished pool.
+
+        attributes:
+            pool_dir, pool_size, shard_size, x_shape, class_num, x_dtype
+
+        methods:
+            write(index, x, y): store float images in [-1,1] and soft labels at pool positions index
+            finish(): flush a newly built pool and mark it as finished
+            sample(num): num random (x, y) float32 cpu tensors
+    """
+    def __init__(self, pool_dir, pool_size = None, shard_size = None, x_shape = None, class_num = None, x_dtype = 'uint8', in_memory = False) -> None:
+
+        self._pool_dir = pool_dir
+        self._meta_path = os.path.join(pool_dir, 'mixpool.json')
+        meta_path = self._meta_path
+
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            mode = 'r' if in_memory else 'r+'
+        else:
+            if pool_size is None or x_shape is None or class_num is None:
+                raise Exception(f'there is no mix pool in {pool_dir}, please build it first')
+            meta = {'pool_size': pool_size, 'shard_size': shard_size or pool_size, 'x_shape': list(x_shape), 'class_num': class_num, 'x_dtype': x_dtype}
+            mode = 'w+'
+
+        self._meta = meta
+        self.pool_size = meta['pool_size']
+        self.shard_size = meta['shard_size']
+        self.x_shape = tuple(meta['x_shape'])
+        self.class_num = meta['class_num']
+        self.x_dtype = meta['x_dtype']
+
+        self._x_shards = []
+        self._y_shards = []
+        for shard_index, shard_start in enumerate(range(0, self.pool_size, self.shard_size)):
+            shard_len = min(self.shard_size, self.pool_size - shard_start)
+            x_path = os.path.join(pool_dir, f'{shard_index:08d}-mixpool-x.npy')
+            y_path = os.path.join(pool_dir, f'{shard_index:08d}-mixpool-y.npy')
+            if mode == 'w+':
+                os.makedirs(pool_dir, exist_ok=True)
+                x_shard = np.lib.format.open_memmap(x_path, mode='w+', dtype=np.dtype(self.x_dtype), shape=(shard_len,) + self.x_shape)
+                y_shard = np.lib.format.open_memmap(y_path, mode='w+', dtype=np.float16, shape=(shard_len, self.class_num))
+            elif in_memory:
+                x_shard = np.load(x_path)
+                y_shard = np.load(y_path)
+            else:
+                x_shard = np.load(x_path, mmap_mode=mode)
+                y_shard = np.load(y_path, mmap_mode=mode)
+            self._x_shards.append(x_shard)
+            self._y_shards.append(y_shard)
+
+    def __len__(self):
+        return self.pool_size
+
+    def __encode__(self, x):
+        if self.x_dtype == 'uint8':
+            return (x * 127.5 + 128).clamp(0, 255).to(torch.uint8).numpy()
+        return x.to(torch.float16).numpy()
+
+    def __decode__(self, x):
+        x = torch.from_numpy(np.asarray(x))
+        if self.x_dtype == 'uint8':
+            return (x.float() - 128.) / 127.5
+        return x.float()
+
+    def write(self, index, x, y):
+        index = np.asarray(index)
+        x = self.__encode__(x.detach().cpu())
+        y = y.detach().cpu().to(torch.float16).numpy()
+        for shard_index in np.unique(index // self.shard_size):
+            select = (index // self.shard_size) == shard_index
+            rows = index[select] % self.shard_size
+            self._x_shards[shard_index][rows] = x[select]
+            self._y_shards[shard_index][rows] = y[select]
+
+    def flush(self):
+        for x_shard, y_shard in zip(self._x_shards, self._y_shards):
+            if isinstance(x_shard, np.memmap):
+                x_shard.flush()
+                y_shard.flush()
+
+    def finish(self):
+        self.flush()
+        tmp_path = self._meta_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self._meta, f)
+        os.replace(tmp_path, self._meta_path)                                                          #   the pool counts as built only after every shard is flushed
+
+    def sample(self, num):
+        index = np.sort(np.random.randint(0, self.pool_size, size=num))
+        x = []
+        y = []
+        for shard_index in np.unique(index // self.shard_size):
+            rows = index[(index // self.shard_size) == shard_index] % self.shard_size
+            x.append(self._x_shards[shard_index][rows])
+            y.append(self._y_shards[shard_index][rows])
+        x = self.__decode__(np.concatenate(x))
+        y = torch.from_numpy(np.concatenate(y)).float()
+        return x, y
+
+class MixPoolReplay:
+    r"""
+        Serve mixed training samples from a MixPool and regenerate only refresh_ratio of the pool per epoch.
+
+        mix_function(num) must return (x, y) of num freshly generated mixed samples,
+        e.g. a closure over MixGenerate.mixgeneratebatch().
+    """
+    def __init__(self, mix_pool, mix_function, refresh_ratio = 0.0, batch_size = 64) -> None:
+        self._mix_pool = mix_pool
+        self._mix_function = mix_function
+        self._refresh_ratio = refresh_ratio
+        self._batch_size = batch_size
+
+    def refresh(self):
+        refresh_num = int(self._refresh_ratio * len(self._mix_pool))
+        if refresh_num == 0:
+            return
+        print(f"refreshing {refresh_num}/{len(self._mix_pool)} mixed samples of the mix pool...")
+        refresh_index = np.random.choice(len(self._mix_pool), refresh_num, replace=False)
+        for start in range(0, refresh_num, self._batch_size):
+            batch_index = refresh_index[start : start + self._batch_size]
+            x, y = self._mix_function(len(batch_index))
+            self._mix_pool.write(batch_index, x, y)
+        self._mix_pool.flush()
+
+    def sample(self, num):
+        return self._mix_pool.sample(num)
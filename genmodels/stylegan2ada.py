@@ -26,6 +26,8 @@ from utils.stylegan2ada.torch_utils import custom_ops
 
 #----project
 import copy
+import contextlib
+import hashlib
 from time import perf_counter
 import imageio
 import numpy as np
@@ -34,12 +36,29 @@ from numpy.core.records import array
 import torch.nn.functional as F
 import utils.stylegan2ada.legacy as legacy
 import utils.sampler
+from utils.artifactsink import ArtifactSink
+from utils.latentset import LoadProjectedLatentSet, SelectLatentSubset
 import re
 from typing import List, Optional
 import click
 from torchvision.transforms import transforms
 
 
+#   (network_pkl, precision, channels_last) -> passed the fp32 accuracy guard or not
+_checked_inference_policies = {}
+#   (pkl hash, noise_mode, batch size, device) -> traced synthesis module, or None when tracing failed
+_compiled_synthesis = {}
+_pkl_hashes = {}
+
+class SynthesisTraceWrapper(torch.nn.Module):
+    def __init__(self, synthesis, noise_mode):
+        super(SynthesisTraceWrapper, self).__init__()
+        self.synthesis = synthesis
+        self.noise_mode = noise_mode
+
+    def forward(self, ws):
+        return self.synthesis(ws, noise_mode=self.noise_mode)
+
 class MaggieStylegan2ada:
 
     def __init__(self, args):
@@ -599,8 +618,7 @@ class MaggieStylegan2ada:
 
         # Load networks.
         device = torch.device('cuda')
-        with dnnlib.util.open_url(network_pkl) as fp:
-            G = legacy.load_network_pkl(fp)['G_ema'].requires_grad_(False).to(device)                         
+        G = legacy.load_generator(network_pkl, device)
         
         if self._args.dataset =='cifar10' or self._args.dataset =='cifar100' or self._args.dataset =='svhn' or self._args.dataset =='stl10' or self._args.dataset =='imagenetmixed10':
             if self._args.dataset =='svhn' or self._args.dataset =='stl10' or self._args.dataset =='imagenetmixed10':
@@ -711,7 +729,7 @@ class MaggieStylegan2ada:
                 img_index = img_name[0:8]
                 label_number = img_name[9:10]
                 label = img_name[11:]
-                target_fname = os.path.join(opt.viewdataset_path,filename)                                               {filename}'   
+                target_fname = os.path.join(opt.viewdataset_path,filename)
 
                 projected_w,projected_y = self.__run_projection__(
                     network_pkl = opt.gen_network_pkl,
@@ -749,8 +767,7 @@ class MaggieStylegan2ada:
 
         # Load networks.
         device = torch.device('cuda')
-        with dnnlib.util.open_url(network_pkl) as fp:
-            G = legacy.load_network_pkl(fp)['G_ema'].requires_grad_(False).to(device)                                           
+        G = legacy.load_generator(network_pkl, device)
         # Load target image.
         target_pil = PIL.Image.open(target_fname).convert('RGB')
         # print(target_pil)
@@ -913,12 +930,41 @@ class MaggieStylegan2ada:
     def mixwyset(self):
         return self.interpolated_w_set, self.interpolated_y_set
 
-    def interpolate(self, exp_result_dir, projected_w_set = None, projected_y_set = None):
+    def interpolate(self, exp_result_dir, projected_w_set = None, projected_y_set = None, partner_w_set = None, partner_y_set = None):
         self._exp_result_dir = exp_result_dir
+        self.partner_w_set = partner_w_set                                                                 #   [bs,mix_w_num-1,8,512] partners picked by LatentPairIndex
+        self.partner_y_set = partner_y_set
         interpolated_w_set, interpolated_y_set = self.__interpolatemain__(self._args, self._exp_result_dir, projected_w_set, projected_y_set)
+        self.__flushartifacts__()
         self.interpolated_w_set = interpolated_w_set
         self.interpolated_y_set = interpolated_y_set
 
+    def artifactsink(self):
+        """
+        Shared asynchronous writer of the generated png / npz files, flushed at the end of interpolate() and generate().
+        """
+        if getattr(self, '_artifact_sink', None) is None:
+            self._artifact_sink = ArtifactSink(self._args.sink_workers, self._args.sink_queue_size, self._args.sink_shard_size)
+        return self._artifact_sink
+
+    def __flushartifacts__(self):
+        if getattr(self, '_artifact_sink', None) is not None:
+            self._artifact_sink.flush()
+
+    def interpolatestream(self, exp_result_dir, projected_w_set = None, projected_y_set = None):
+        """
+        Iterator version of interpolate(): the mixed (w, y) pairs are yielded one at a time instead of being collected.
+        """
+        self._exp_result_dir = exp_result_dir
+        device = torch.device('cuda')
+        if projected_w_set is not None:
+            projected_w_set_x = torch.as_tensor(projected_w_set).to(device)
+            projected_w_set_y = torch.nn.functional.one_hot(torch.as_tensor(projected_y_set).to(device), self._args.n_classes).float()
+        else:
+            projected_w_set_x, projected_w_set_y = self.__loadprojectedset__(self._args, device)
+
+        return self.__mixedwyiter__(self._args, projected_w_set_x, projected_w_set_y, exp_result_dir)
+
     def __interpolatemain__(self, opt, exp_result_dir, projected_w_set, projected_y_set):
         # print("running interpolate main()..............")
 
@@ -949,7 +995,12 @@ class MaggieStylegan2ada:
             projected_w_set_y = self.projected_y_set               
             projected_w_set_y = torch.nn.functional.one_hot(projected_w_set_y, opt.n_classes).float()           #   CPU tensor 
 
-            interpolated_w_set, interpolated_y_set = self.__getmixedbatchwy__(opt, projected_w_set_x, projected_w_set_y)
+            partner_w_set_x = self.partner_w_set
+            partner_w_set_y = self.partner_y_set
+            if partner_w_set_y is not None:
+                partner_w_set_y = torch.nn.functional.one_hot(partner_w_set_y, opt.n_classes).float()
+
+            interpolated_w_set, interpolated_y_set = self.__getmixedbatchwy__(opt, projected_w_set_x, projected_w_set_y, partner_w_set_x, partner_w_set_y)
 
         else:
             projected_w_set_x = torch.tensor(self.projected_w_set).to(device)                                                      
@@ -960,16 +1011,19 @@ class MaggieStylegan2ada:
             
         return interpolated_w_set, interpolated_y_set   
 
-    def __getmixedbatchwy__(self, opt, projected_w_set_x, projected_w_set_y):
+    def __getmixedbatchwy__(self, opt, projected_w_set_x, projected_w_set_y, partner_w_set_x = None, partner_w_set_y = None):
         repeat_num = projected_w_set_x.size(1)
 
         if opt.mix_w_num == 2:
             batch_size = projected_w_set_x.size()[0]
 
-            shuffle_index = torch.randperm(batch_size)
-
-            shuffled_projected_w_set_x = projected_w_set_x[shuffle_index,:]
-            shuffled_projected_w_set_y = projected_w_set_y[shuffle_index,:]
+            if partner_w_set_x is not None:
+                shuffled_projected_w_set_x = partner_w_set_x[:, 0]
+                shuffled_projected_w_set_y = partner_w_set_y[:, 0]
+            else:
+                shuffle_index = torch.randperm(batch_size)
+                shuffled_projected_w_set_x = projected_w_set_x[shuffle_index,:]
+                shuffled_projected_w_set_y = projected_w_set_y[shuffle_index,:]
             
             projected_w_set_x = projected_w_set_x[:, 0, :].squeeze(1)                           #   [4,8,512] --> [4,1,512] --> [4,512]
             shuffled_projected_w_set_x = shuffled_projected_w_set_x[:, 0, :].squeeze(1)         #   [4,8,512] --> [4,1,512] --> [4,512]
@@ -994,13 +1048,19 @@ class MaggieStylegan2ada:
             # print("ternary mixup")     
             batch_size = projected_w_set_x.size()[0]
 
-            shuffle_index_a = torch.randperm(batch_size)
-            shuffled_projected_w_set_x_a = projected_w_set_x[shuffle_index_a,:]
-            shuffled_projected_w_set_y_a = projected_w_set_y[shuffle_index_a,:]
+            if partner_w_set_x is not None:
+                shuffled_projected_w_set_x_a = partner_w_set_x[:, 0]
+                shuffled_projected_w_set_y_a = partner_w_set_y[:, 0]
+                shuffled_projected_w_set_x_b = partner_w_set_x[:, 1]
+                shuffled_projected_w_set_y_b = partner_w_set_y[:, 1]
+            else:
+                shuffle_index_a = torch.randperm(batch_size)
+                shuffled_projected_w_set_x_a = projected_w_set_x[shuffle_index_a,:]
+                shuffled_projected_w_set_y_a = projected_w_set_y[shuffle_index_a,:]
 
-            shuffle_index_b = torch.randperm(batch_size)
-            shuffled_projected_w_set_x_b = projected_w_set_x[shuffle_index_b,:]
-            shuffled_projected_w_set_y_b = projected_w_set_y[shuffle_index_b,:]
+                shuffle_index_b = torch.randperm(batch_size)
+                shuffled_projected_w_set_x_b = projected_w_set_x[shuffle_index_b,:]
+                shuffled_projected_w_set_y_b = projected_w_set_y[shuffle_index_b,:]
 
             projected_w_set_x = projected_w_set_x[:, 0, :].squeeze(1)                           #   [4,8,512] --> [4,1,512] --> [4,512]
             projected_w_set_y = projected_w_set_y[:, 0, :].squeeze(1)                           #   [4,8,10] --> [4,1,10] --> [4,10]
@@ -1032,14 +1092,25 @@ class MaggieStylegan2ada:
 
     def __getmixededwy__(self,opt, projected_w_set_x,projected_w_set_y,exp_result_dir):
 
+        interpolated_w_set = []
+        interpolated_y_set = []
+        for w_mixed, y_mixed in self.__mixedwyiter__(opt, projected_w_set_x, projected_w_set_y, exp_result_dir):
+            interpolated_w_set.append(w_mixed)
+            interpolated_y_set.append(y_mixed)
+
+        return interpolated_w_set, interpolated_y_set
+
+    def __mixedwyiter__(self,opt, projected_w_set_x,projected_w_set_y,exp_result_dir):
+        """
+        Yield the mixed (w, y) pairs one by one, saving each pair to the interpolate folder as it is produced.
+        """
+
         exp_result_dir = os.path.join(exp_result_dir,f'interpolate-{opt.dataset}-trainset')
         os.makedirs(exp_result_dir,exist_ok=True)    
 
         classification = self.__labelnames__() 
         print("classification label name:",classification)
 
-        interpolated_w_set = []
-        interpolated_y_set = []
         print("projected_w_set_x.shape:",projected_w_set_x.shape)           #   projected_w_set_x.shape: torch.Size([38, 10, 512])
         print("projected_w_set_y.shape:",projected_w_set_y.shape)
         
@@ -1092,11 +1163,10 @@ class MaggieStylegan2ada:
                                     w_mixed = w_mixed.repeat([repeat_num,1])       
                                     y_mixed = y_mixed.repeat([repeat_num,1])                    
 
-                                    np.savez(f'{exp_result_dir}/{i:08d}-{int(w1_label_index)}-{w1_label_name}+{j:08d}-{int(w2_label_index)}-{w2_label_name}-mixed_projected_w.npz', w=w_mixed.unsqueeze(0).cpu().numpy())                  
-                                    np.savez(f'{exp_result_dir}/{i:08d}-{int(w1_label_index)}-{w1_label_name}+{j:08d}-{int(w2_label_index)}-{w2_label_name}-mixed_label.npz', w = y_mixed.unsqueeze(0).cpu().numpy())               
+                                    self.artifactsink().savez(f'{exp_result_dir}/{i:08d}-{int(w1_label_index)}-{w1_label_name}+{j:08d}-{int(w2_label_index)}-{w2_label_name}-mixed_projected_w.npz', w=w_mixed.unsqueeze(0).cpu().numpy())                  
+                                    self.artifactsink().savez(f'{exp_result_dir}/{i:08d}-{int(w1_label_index)}-{w1_label_name}+{j:08d}-{int(w2_label_index)}-{w2_label_name}-mixed_label.npz', w = y_mixed.unsqueeze(0).cpu().numpy())               
 
-                                    interpolated_w_set.append(w_mixed)
-                                    interpolated_y_set.append(y_mixed)
+                                    yield w_mixed, y_mixed
 
                                     mix_num = mix_num + 1
 
@@ -1151,14 +1221,11 @@ class MaggieStylegan2ada:
                                             w_mixed = w_mixed.repeat([repeat_num,1])       
                                             y_mixed = y_mixed.repeat([repeat_num,1]) 
 
-                                            np.savez(f'{exp_result_dir}/{i:08d}-{int(w1_label_index)}-{w1_label_name}+{j:08d}-{int(w2_label_index)}-{w2_label_name}+{k:08d}-{int(w3_label_index)}-{w3_label_name}-mixed_projected_w.npz', w=w_mixed.unsqueeze(0).cpu().numpy())  
-                                            np.savez(f'{exp_result_dir}/{i:08d}-{int(w1_label_index)}-{w1_label_name}+{j:08d}-{int(w2_label_index)}-{w2_label_name}+{k:08d}-{int(w3_label_index)}-{w3_label_name}-mixed_label.npz', w = y_mixed.unsqueeze(0).cpu().numpy())      
-                                            interpolated_w_set.append(w_mixed)
-                                            interpolated_y_set.append(y_mixed)           
-
-                                            mix_num = mix_num + 1                       
+                                            self.artifactsink().savez(f'{exp_result_dir}/{i:08d}-{int(w1_label_index)}-{w1_label_name}+{j:08d}-{int(w2_label_index)}-{w2_label_name}+{k:08d}-{int(w3_label_index)}-{w3_label_name}-mixed_projected_w.npz', w=w_mixed.unsqueeze(0).cpu().numpy())  
+                                            self.artifactsink().savez(f'{exp_result_dir}/{i:08d}-{int(w1_label_index)}-{w1_label_name}+{j:08d}-{int(w2_label_index)}-{w2_label_name}+{k:08d}-{int(w3_label_index)}-{w3_label_name}-mixed_label.npz', w = y_mixed.unsqueeze(0).cpu().numpy())      
+                                            yield w_mixed, y_mixed
 
-        return interpolated_w_set, interpolated_y_set
+                                            mix_num = mix_num + 1
 
     def __BaseMixup2__(self,w1,w2,sample_mode,y1,y2):                                                                    
 
@@ -1171,6 +1238,7 @@ class MaggieStylegan2ada:
         elif sample_mode == 'betasampler':
             alpha = utils.sampler.BetaSampler(w1.size(0), w1.size(1), is_2d, p=None, beta_alpha = self._args.beta_alpha)
 
+        alpha = alpha.to(w1.device)
         w_mixed = alpha*w1 + (1.-alpha)*w2
         y_mixed = alpha*y1 + (1.-alpha)*y2
 
@@ -1191,28 +1259,14 @@ class MaggieStylegan2ada:
             # print('sample_mode = bernoullisampler2, big variance !')
             m = utils.sampler.BernoulliSampler2(w1.size(0), w1.size(1), is_2d, p=None)
 
-        lam = []
-        for i in range(len(m)):
-            lam_i = (torch.nonzero(m[i]).size(0)) / m.size(1)
-            lam.append(lam_i)
-
-        lam = np.asarray(lam)
-        lam = torch.tensor(lam).unsqueeze(1)
+        device = w1.device
+        m = m.to(device)
+        lam = (m != 0).sum(dim=1, keepdim=True).float() / m.size(1)
 
-        m1 = m.cpu()
-        m2 = (1.-m).cpu()
-        lam1 = lam.cpu()
-        lam2 = (1.-lam).cpu() 
+        w_mixed = m*w1 + (1.-m)*w2
+        y_mixed = lam*y1 + (1.-lam)*y2
 
-        w1 = w1.cpu()
-        w2 = w2.cpu()        
-        y1 = y1.cpu()
-        y2 = y2.cpu()
-
-        w_mixed = m1*w1 + m2*w2
-        y_mixed = lam1*y1 + lam2*y2
-
-        return w_mixed.cpu(),y_mixed.cpu()
+        return w_mixed,y_mixed
 
     def __BaseMixup3__(self,w1,w2,w3,sample_mode,y1,y2,y3):
 
@@ -1227,21 +1281,15 @@ class MaggieStylegan2ada:
             # raise error
             alpha = utils.sampler.DirichletSampler(w1.size(0), w1.size(1), is_2d, dirichlet_gama = self._args.dirichlet_gama)
 
-        alpha1 = alpha[:, 0:1].cuda()
-        alpha2 = alpha[:, 1:2].cuda()
-        alpha3 = alpha[:, 2:3].cuda()
-        
-        w1 = w1.cuda()
-        w2 = w2.cuda()
-        w3 = w3.cuda()
-        y1 = y1.cuda()
-        y2 = y2.cuda()
-        y3 = y3.cuda()
+        alpha = alpha.to(w1.device)
+        alpha1 = alpha[:, 0:1]
+        alpha2 = alpha[:, 1:2]
+        alpha3 = alpha[:, 2:3]
 
         w_mixed = alpha1 * w1 + alpha2 * w2 + alpha3 * w3
         y_mixed = alpha1 * y1 + alpha2 * y2 + alpha3 * y3
 
-        return w_mixed.cpu(),y_mixed.cpu()
+        return w_mixed,y_mixed
 
     def __MaskMixup3__(self,w1,w2,w3,sample_mode,y1,y2,y3):
 
@@ -1249,10 +1297,10 @@ class MaggieStylegan2ada:
         if sample_mode == 'bernoullisampler3':
             m = utils.sampler.BernoulliSampler3(w1.size(0), w1.size(1), is_2d)
 
-        m1 = m[:, 0:1, :].squeeze(1).cuda()
-        m2 = m[:, 1:2, :].squeeze(1).cuda()
-        m3 = m[:, 2:3, :].squeeze(1).cuda()
-        
+        m = m.to(w1.device)
+        m1 = m[:, 0:1, :].squeeze(1)
+        m2 = m[:, 1:2, :].squeeze(1)
+        m3 = m[:, 2:3, :].squeeze(1)
 
         """
         m1.shape: torch.Size([4, 512])
@@ -1260,59 +1308,44 @@ class MaggieStylegan2ada:
         m3.shape: torch.Size([4, 512])
         """
 
-        lam1 = []
-        for i in range(len(m1)):        #bs
-            lam1_i = torch.nonzero(m1[i]).size(0) / m.size(2)
-            lam1.append(lam1_i)
-        lam1 = np.asarray(lam1)         #   (4)
-        lam1 = torch.tensor(lam1).unsqueeze(1).cuda()  #   [4,1]
-
-        lam2 = []
-        for i in range(len(m2)):        #bs
-            lam2_i = torch.nonzero(m2[i]).size(0) / m.size(2)
-            lam2.append(lam2_i)
-        lam2 = np.asarray(lam2)         #   (4)
-        lam2 = torch.tensor(lam2).unsqueeze(1).cuda()  #   [4,1]
-
-        lam3 = []
-        for i in range(len(m3)):        #bs
-            lam3_i = torch.nonzero(m3[i]).size(0) / m.size(2)
-            lam3.append(lam3_i)
-        lam3 = np.asarray(lam3)         #   (4)
-        lam3 = torch.tensor(lam3).unsqueeze(1).cuda()  #   [4,1]
-
-        w1 = w1.cuda()
-        w2 = w2.cuda()
-        w3 = w3.cuda()
-        y1 = y1.cuda()
-        y2 = y2.cuda()
-        y3 = y3.cuda()
+        lam1 = (m1 != 0).sum(dim=1, keepdim=True).float() / m.size(2)       #   [4,1]
+        lam2 = (m2 != 0).sum(dim=1, keepdim=True).float() / m.size(2)
+        lam3 = (m3 != 0).sum(dim=1, keepdim=True).float() / m.size(2)
 
         w_mixed = m1*w1 + m2*w2 +m3*w3
         y_mixed = lam1*y1 + lam2*y2 +lam3*y3
 
-        return w_mixed.cpu(),y_mixed.cpu()
+        return w_mixed,y_mixed
 
     def __AdversarialMixup2__(self,ws1,ws2,sample_mode):
         print('AdversarialMixup2')
 
-    def __TwoMixup__(self,opt, exp_result_dir):
+    def __loadlatentfiles__(self, w_paths, y_paths, device):
+        """
+        Read the projected w / label npz files into host memory first and copy them to device in one transfer.
+        """
+        projected_w_set_x = np.concatenate([np.load(w_path)['w'] for w_path in w_paths], axis=0)
+        projected_w_set_y = np.concatenate([np.load(y_path)['w'] for y_path in y_paths], axis=0)
 
-        device = torch.device('cuda')
-        projected_w1_x = np.load(opt.projected_w1)['w']
-        projected_w1_x = torch.tensor(projected_w1_x, device=device)      
-        projected_w2_x = np.load(opt.projected_w2)['w']
-        projected_w2_x = torch.tensor(projected_w2_x, device=device)     
-        projected_w_set_x = torch.cat((projected_w1_x,projected_w2_x),dim=0)
+        projected_w_set_x, projected_w_set_y = SelectLatentSubset(projected_w_set_x, projected_w_set_y, index=self._args.projected_index, classes=self._args.projected_classes)
+        projected_w_set_x = torch.from_numpy(projected_w_set_x).to(device, non_blocking=True)
+        projected_w_set_y = torch.from_numpy(projected_w_set_y).long().to(device, non_blocking=True)
+        projected_w_set_y = torch.nn.functional.one_hot(projected_w_set_y, self._args.n_classes).float()
 
+        return projected_w_set_x, projected_w_set_y
 
-        projected_w1_y = np.load(opt.projected_w1_label)['w']
-        projected_w1_y = torch.tensor(projected_w1_y, device=device)      
-        projected_w2_y = np.load(opt.projected_w2_label)['w']
-        projected_w2_y = torch.tensor(projected_w2_y, device=device)     
+    def __loadprojectedset__(self, opt, device):
+        if opt.projected_dataset != None:
+            return self.__loaddatasetlatent__(opt, device)
+        elif opt.projected_w3 == None:
+            return self.__loadlatentfiles__([opt.projected_w1, opt.projected_w2], [opt.projected_w1_label, opt.projected_w2_label], device)
+        else:
+            return self.__loadlatentfiles__([opt.projected_w1, opt.projected_w2, opt.projected_w3], [opt.projected_w1_label, opt.projected_w2_label, opt.projected_w3_label], device)
 
-        projected_w_set_y = torch.cat((projected_w1_y,projected_w2_y),dim=0)
-        projected_w_set_y = torch.nn.functional.one_hot(projected_w_set_y, opt.n_classes).float().to(device)                            
+    def __TwoMixup__(self,opt, exp_result_dir):
+
+        device = torch.device('cuda')
+        projected_w_set_x, projected_w_set_y = self.__loadprojectedset__(opt, device)
         interpolated_w_set, interpolated_y_set = self.__getmixededwy__(opt, projected_w_set_x,projected_w_set_y,exp_result_dir)
 
         return interpolated_w_set, interpolated_y_set
@@ -1321,46 +1354,14 @@ class MaggieStylegan2ada:
         print("flag: ThreeMixup")
 
         device = torch.device('cuda')
-        projected_w1_x = np.load(opt.projected_w1)['w']
-        projected_w1_x = torch.tensor(projected_w1_x, device=device)      
-        projected_w2_x = np.load(opt.projected_w2)['w']
-        projected_w2_x = torch.tensor(projected_w2_x, device=device)   
-        projected_w3_x = np.load(opt.projected_w3)['w']
-        projected_w3_x = torch.tensor(projected_w3_x, device=device)            
-
-        projected_w_set_x = torch.cat((projected_w1_x,projected_w2_x,projected_w3_x),dim=0)
+        projected_w_set_x, projected_w_set_y = self.__loadprojectedset__(opt, device)
         print("projected_w_set_x.shape：",projected_w_set_x.shape)               
-        projected_w1_y = np.load(opt.projected_w1_label)['w']
-        projected_w1_y = torch.tensor(projected_w1_y, device=device)      
-        projected_w2_y = np.load(opt.projected_w2_label)['w']
-        projected_w2_y = torch.tensor(projected_w2_y, device=device)     
-        projected_w3_y = np.load(opt.projected_w3_label)['w']
-        projected_w3_y = torch.tensor(projected_w3_y, device=device)     
-
-        projected_w_set_y = torch.cat((projected_w1_y,projected_w2_y,projected_w3_y),dim=0)
         print("projected_w_set_y.shape：",projected_w_set_y.shape)              
-        projected_w_set_y = torch.nn.functional.one_hot(projected_w_set_y, opt.n_classes).float().to(device)                            
         interpolated_w_set, interpolated_y_set = self.__getmixededwy__(opt, projected_w_set_x,projected_w_set_y,exp_result_dir)
 
         return interpolated_w_set, interpolated_y_set
 
     def __DatasetMixup__(self,opt,exp_result_dir):
-        file_dir=os.listdir(opt.projected_dataset)                                                                        
-        file_dir.sort()                                                                                                       
-
-        npzfile_name = []
-        for name in file_dir:                                                                                                   
-            if os.path.splitext(name)[-1] == '.npz':
-                npzfile_name.append(name)                                                                                   
-        projected_w_npz_paths =[]
-        label_npz_paths = []
-        for name in npzfile_name:
-            if name[-15:-4] == 'projected_w': 
-                projected_w_npz_paths.append(f'{opt.projected_dataset}/{name}')
-
-            elif name[-9:-4] == 'label':
-                label_npz_paths.append(f'{opt.projected_dataset}/{name}')
-
         if opt.mix_w_num == 2:
             print("flag: DatasetTwoMixup")
         
@@ -1371,40 +1372,213 @@ class MaggieStylegan2ada:
             raise Exception('please input valid w_num: 2 or 3')
 
         device = torch.device('cuda')
-
-        projected_w_set_x = []       
-        for projected_w_path in projected_w_npz_paths:                                                                                   
-            w = np.load(projected_w_path)['w']
-            w = torch.tensor(w, device=device)                                                                                 
-            w = w[-1]                                                                                       #   w.shape: torch.Size([1, 8,512]))         
-            projected_w_set_x.append(w)                                                                                         
-        projected_w_set_x = torch.stack(projected_w_set_x)           
-        projected_w_set_y = []       
-        for label_npz_path in label_npz_paths:                                                                                  
-            y = np.load(label_npz_path)['w']
-            y = torch.tensor(y, device=device)                                                                                 
-            y = y[-1]                                                                                       #   y.shape: torch.Size([1, 8]))
-            projected_w_set_y.append(y)
-        projected_w_set_y = torch.stack(projected_w_set_y)           
-                                                                                                            #   projected_w_set_y.shape: torch.Size([38, 10])
-        projected_w_set_y = torch.nn.functional.one_hot(projected_w_set_y, opt.n_classes).float().to(device)                           
-                                                                                                            #   projected_w_set_y.shape: torch.Size([38, 10, 10])
-        projected_w_set_x = projected_w_set_x.cpu()
-        projected_w_set_y = projected_w_set_y.cpu()
-
+        projected_w_set_x, projected_w_set_y = self.__loadprojectedset__(opt, device)
         interpolated_w_set, interpolated_y_set = self.__getmixededwy__(opt, projected_w_set_x,projected_w_set_y,exp_result_dir)
 
         return interpolated_w_set, interpolated_y_set
 
+    def __loaddatasetlatent__(self, opt, device):
+        #   packed once into projected_w_set.npy / projected_y_set.npy, memory mapped afterwards
+        projected_w_set_x, projected_w_set_y = LoadProjectedLatentSet(opt.projected_dataset, cache_dir=opt.projected_cache_dir)
+        projected_w_set_x, projected_w_set_y = SelectLatentSubset(projected_w_set_x, projected_w_set_y, index=opt.projected_index, classes=opt.projected_classes)
+
+        projected_w_set_x = torch.from_numpy(projected_w_set_x).to(device, non_blocking=True)           #   projected_w_set_x.shape: torch.Size([38, 8, 512])
+        projected_w_set_y = torch.from_numpy(projected_w_set_y).to(device, non_blocking=True)           #   projected_w_set_y.shape: torch.Size([38, 8])
+        projected_w_set_y = torch.nn.functional.one_hot(projected_w_set_y, opt.n_classes).float()      #   projected_w_set_y.shape: torch.Size([38, 8, 10])
+
+        return projected_w_set_x, projected_w_set_y
+
     def genxyset(self):
         return self.generated_x_set, self.generated_y_set
         
     def generate(self, exp_result_dir, interpolated_w_set = None, interpolated_y_set = None):
         self._exp_result_dir = exp_result_dir
         generated_x_set, generated_y_set = self.__generatemain__(self._args, self._exp_result_dir, interpolated_w_set, interpolated_y_set)
+        self.__flushartifacts__()
         self.generated_x_set = generated_x_set
         self.generated_y_set = generated_y_set
 
+    def generatestream(self, exp_result_dir, interpolated_wy_iter, chunk_size):
+        """
+        Synthesize the (w, y) pairs of an iterator chunk_size at a time and yield (w, y, x) chunks,
+        so only one chunk of latents and images is held in memory.
+        """
+        self._exp_result_dir = exp_result_dir
+        G = self.loadgenerator()
+
+        w_chunk = []
+        y_chunk = []
+        for w_mixed, y_mixed in interpolated_wy_iter:
+            w_chunk.append(w_mixed)
+            y_chunk.append(y_mixed)
+            if len(w_chunk) == chunk_size:
+                yield self.__synthesizechunk__(G, torch.stack(w_chunk), torch.stack(y_chunk))
+                w_chunk = []
+                y_chunk = []
+
+        if len(w_chunk) > 0:
+            yield self.__synthesizechunk__(G, torch.stack(w_chunk), torch.stack(y_chunk))
+
+        self.__flushartifacts__()
+
+    def loadgenerator(self, network_pkl = None):
+        """
+        Load G_ema for inference and apply the --gen_precision / --gen_channels_last policy, checked against fp32 once per pkl.
+        """
+        if network_pkl is None:
+            network_pkl = self._args.gen_network_pkl
+        device = torch.device('cuda')
+        G = legacy.load_generator(network_pkl, device)
+        G.eval()
+        G = self.__applyinferencepolicy__(G, network_pkl)
+        self._G_network_pkl = network_pkl
+        return G
+
+    def __applyinferencepolicy__(self, G, network_pkl):
+        precision = self._args.gen_precision
+        device_type = next(G.parameters()).device.type
+        if precision == 'fp16' and device_type == 'cpu':
+            precision = 'bf16'                                                                          #   cpu autocast only supports bf16
+        self._inference_dtype = {'fp32': None, 'fp16': torch.float16, 'bf16': torch.bfloat16}[precision]
+        self._inference_device_type = device_type
+
+        if self._inference_dtype is None and not self._args.gen_channels_last:
+            return G
+
+        policy_key = (network_pkl, precision, self._args.gen_channels_last)
+        if policy_key not in _checked_inference_policies:
+            #   accuracy guard: compare against fp32 contiguous synthesis on a fixed calibration batch
+            z = torch.from_numpy(np.random.RandomState(0).randn(self._args.gen_calibration_num, G.z_dim)).float().to(next(G.parameters()).device)
+            c = torch.zeros([len(z), G.c_dim], device=z.device)
+            if G.c_dim != 0:
+                c[torch.arange(len(z)), torch.arange(len(z)) % G.c_dim] = 1
+            with torch.no_grad():
+                ws = G.mapping(z, c)
+                reference = G.synthesis(ws, noise_mode='const').float()
+
+            policy_passed = True
+            try:
+                if self._args.gen_channels_last:
+                    G = G.to(memory_format=torch.channels_last)
+                candidate = self.__synthesize__(G, ws, noise_mode='const')
+                policy_error = float((candidate - reference).abs().max())
+                print(f"{precision} channels_last={self._args.gen_channels_last} synthesis max abs error against fp32: {policy_error:.6f}")
+                policy_passed = policy_error <= self._args.gen_precision_tol
+            except RuntimeError as runtime_error:
+                print(f"{precision} channels_last={self._args.gen_channels_last} synthesis failed: {runtime_error}")
+                policy_passed = False
+            _checked_inference_policies[policy_key] = policy_passed
+
+        if _checked_inference_policies[policy_key] == False:
+            print("inference policy failed the fp32 accuracy guard, falling back to fp32 synthesis")
+            self._inference_dtype = None
+            return G.to(memory_format=torch.contiguous_format)
+
+        if self._args.gen_channels_last:
+            G = G.to(memory_format=torch.channels_last)
+        return G
+
+    def __inferencecontext__(self):
+        stack = contextlib.ExitStack()
+        stack.enter_context(torch.inference_mode())
+        if getattr(self, '_inference_dtype', None) is not None:
+            stack.enter_context(torch.autocast(device_type=self._inference_device_type, dtype=self._inference_dtype))
+        return stack
+
+    def __synthesize__(self, G, ws, noise_mode):
+        """
+        G.synthesis under the inference policy, returns an ordinary fp32 tensor usable outside inference_mode.
+        """
+        compiled_synthesis = None
+        if self._args.gen_compile and getattr(self, '_inference_dtype', None) is None:
+            compiled_synthesis = self.__compiledsynthesis__(G, ws, noise_mode)
+
+        with self.__inferencecontext__():
+            if compiled_synthesis is not None:
+                img = compiled_synthesis(ws)
+            else:
+                img = G.synthesis(ws, noise_mode=noise_mode)
+        return img.float().clone()
+
+    def __pklhash__(self, network_pkl):
+        if legacy.is_slim_network(network_pkl):
+            network_pkl = os.path.join(network_pkl, 'G_ema.pt')
+        if dnnlib.util.is_url(network_pkl) or not os.path.isfile(network_pkl):
+            return hashlib.sha1(str(network_pkl).encode()).hexdigest()[:16]
+        stat = os.stat(network_pkl)
+        hash_key = (os.path.abspath(network_pkl), stat.st_size, stat.st_mtime)
+        if hash_key not in _pkl_hashes:
+            sha1 = hashlib.sha1()
+            with open(network_pkl, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 24), b''):
+                    sha1.update(block)
+            _pkl_hashes[hash_key] = sha1.hexdigest()[:16]
+        return _pkl_hashes[hash_key]
+
+    def __compiledsynthesis__(self, G, ws, noise_mode):
+        """
+        Traced G.synthesis for this batch size and noise_mode, cached in memory and as a TorchScript file keyed by the pkl hash.
+        Returns None (eager synthesis) if tracing fails or the traced module does not reproduce the eager output.
+        """
+        network_pkl = getattr(self, '_G_network_pkl', self._args.gen_network_pkl)
+        pkl_hash = self.__pklhash__(network_pkl)
+        device = ws.device
+        compile_key = (pkl_hash, noise_mode, ws.shape[0], str(device))
+        if compile_key in _compiled_synthesis:
+            return _compiled_synthesis[compile_key]
+
+        compile_dir = self._args.gen_compile_dir
+        if compile_dir is None:
+            if dnnlib.util.is_url(network_pkl):
+                compile_dir = dnnlib.util.make_cache_dir_path('compiled-synthesis')
+            else:
+                compile_dir = os.path.join(os.path.dirname(os.path.abspath(network_pkl)), 'compiled-synthesis')
+        os.makedirs(compile_dir, exist_ok=True)
+        compile_path = os.path.join(compile_dir, f'{pkl_hash}-{G.img_resolution}-{G.num_ws}-{noise_mode}-bs{ws.shape[0]}-{device.type}.pt')
+
+        compiled_synthesis = None
+        try:
+            if os.path.exists(compile_path):
+                compiled_synthesis = torch.jit.load(compile_path, map_location=device)
+            else:
+                print(f"tracing G.synthesis for batch size {ws.shape[0]}, noise_mode={noise_mode}...")
+                with torch.no_grad():
+                    compiled_synthesis = torch.jit.trace(SynthesisTraceWrapper(G.synthesis, noise_mode).eval(), ws, check_trace=False)
+                    if noise_mode != 'random':
+                        trace_error = float((compiled_synthesis(ws) - G.synthesis(ws, noise_mode=noise_mode)).abs().max())
+                        if trace_error > 1e-3:
+                            raise RuntimeError(f'traced synthesis differs from eager by {trace_error}')
+                torch.jit.save(compiled_synthesis, f'{compile_path}.tmp')
+                os.replace(f'{compile_path}.tmp', compile_path)
+        except Exception as compile_error:
+            print(f"compiled synthesis unavailable, using eager G.synthesis: {compile_error}")
+            compiled_synthesis = None
+
+        _compiled_synthesis[compile_key] = compiled_synthesis
+        return compiled_synthesis
+
+    def __generatez__(self, G, z, label, truncation_psi, noise_mode):
+        with self.__inferencecontext__():
+            img = G(z, label, truncation_psi=truncation_psi, noise_mode=noise_mode)
+        return img.float().clone()
+
+    def mixbatch(self, G, projected_w_batch, projected_y_batch):
+        """
+        Mix one batch of projected w with in-batch partners and synthesize it with an already loaded G.
+        :returns: w [bs,8,512], y [bs,n_classes], x [bs,c,h,w] cpu tensors
+        """
+        projected_y_batch = torch.nn.functional.one_hot(torch.as_tensor(projected_y_batch).long(), self._args.n_classes).float()
+        interpolated_w_batch, interpolated_y_batch = self.__getmixedbatchwy__(self._args, torch.as_tensor(projected_w_batch), projected_y_batch)
+        return self.__synthesizechunk__(G, interpolated_w_batch, interpolated_y_batch)
+
+    def __synthesizechunk__(self, G, w_chunk, y_chunk):
+        ws = w_chunk.to(next(G.parameters()).device)                                                    #   [chunk,8,512]
+        ys = y_chunk[:, -1]                                                                             #   [chunk,8,10] --> [chunk,10]
+        assert ws.shape[1:] == (G.num_ws, G.w_dim)
+        xs = self.__synthesize__(G, ws, noise_mode=self._args.noise_mode)
+
+        return ws.cpu(), ys.cpu(), xs.cpu()
+
     def __generatemain__(self, opt, exp_result_dir, interpolated_w_set, interpolated_y_set):
         # print("running generate main()..............")
 
@@ -1512,9 +1686,7 @@ class MaggieStylegan2ada:
         interpolated_w: torch.tensor,
         interpolated_y: torch.tensor     
     ):
-        device = torch.device('cuda')
-        with dnnlib.util.open_url(network_pkl) as f:
-            G = legacy.load_network_pkl(f)['G_ema'].to(device)                                                              
+        G = self.loadgenerator(network_pkl)
 
         if interpolated_w is not None:
             
@@ -1523,9 +1695,10 @@ class MaggieStylegan2ada:
             mixed_label = mixed_label[:,0,:].squeeze(1)
             assert ws.shape[1:] == (G.num_ws, G.w_dim)                                                                    
             generated_x = []
-            for _, w in enumerate(ws):
-                w = w.cuda()
-                img = G.synthesis(w.unsqueeze(0), noise_mode=noise_mode).cpu()
+            batch_size = self._args.generate_batch_size
+            for batch_start in range(0, len(ws), batch_size):
+                w = ws[batch_start : batch_start + batch_size].cuda()
+                img = self.__synthesize__(G, w, noise_mode=noise_mode).cpu()
                 generated_x.append(img)         
             generated_x = torch.cat(generated_x,dim=0)
             generated_y = mixed_label
@@ -1546,8 +1719,7 @@ class MaggieStylegan2ada:
     ):
 
         device = torch.device('cuda')
-        with dnnlib.util.open_url(network_pkl) as f:
-            G = legacy.load_network_pkl(f)['G_ema'].to(device)                                        
+        G = self.loadgenerator(network_pkl)
 
         if interpolated_w is not None:
             
@@ -1569,7 +1741,7 @@ class MaggieStylegan2ada:
                 classification = self.__labelnames__()
                 assert ws.shape[1:] == (G.num_ws, G.w_dim)                                                                  
                 for _, w in enumerate(ws):
-                    img = G.synthesis(w.unsqueeze(0), noise_mode=noise_mode)
+                    img = self.__synthesize__(G, w.unsqueeze(0), noise_mode=noise_mode)
                     generated_x = img[-1]            
                     generated_y = mixed_label[-1]
                     img = (img.permute(0, 2, 3, 1) * 127.5 + 128).clamp(0, 255).to(torch.uint8)[0].cpu().numpy()
@@ -1577,17 +1749,17 @@ class MaggieStylegan2ada:
                     w2_label_name = f"{classification[int(w2_label_index)]}"
 
                     if self._args.dataset != 'kmnist' and self._args.dataset != 'mnist':
-                        img_pil = PIL.Image.fromarray(img, 'RGB')
+                        img_mode = 'RGB'
 
                     elif self._args.dataset == 'kmnist' or self._args.dataset == 'mnist':
                         img = img.transpose([2, 0, 1])
                         img = img[0]
-                        img_pil = PIL.Image.fromarray(img, 'L')
-                    img = img_pil.save(f'{outdir}/{interpolated_w_index:08d}-{int(w1_label_index)}-{w1_label_name}+{int(w2_label_index)}-{w2_label_name}-mixed-image.png') 
+                        img_mode = 'L'
+                    self.artifactsink().savepng(f'{outdir}/{interpolated_w_index:08d}-{int(w1_label_index)}-{w1_label_name}+{int(w2_label_index)}-{w2_label_name}-mixed-image.png', img, img_mode) 
 
                     if self._args.defense_mode != 'rmt':
-                        np.savez(f'{outdir}/{interpolated_w_index:08d}-{int(w1_label_index)}-{w1_label_name}+{int(w2_label_index)}-{w2_label_name}-mixed-image.npz', w = generated_x.cpu().numpy())                                               
-                        np.savez(f'{outdir}/{interpolated_w_index:08d}-{int(w1_label_index)}-{w1_label_name}+{int(w2_label_index)}-{w2_label_name}-mixed-label.npz', w = generated_y.cpu().numpy())                                               
+                        self.artifactsink().savez(f'{outdir}/{interpolated_w_index:08d}-{int(w1_label_index)}-{w1_label_name}+{int(w2_label_index)}-{w2_label_name}-mixed-image.npz', w = generated_x.cpu().numpy())                                               
+                        self.artifactsink().savez(f'{outdir}/{interpolated_w_index:08d}-{int(w1_label_index)}-{w1_label_name}+{int(w2_label_index)}-{w2_label_name}-mixed-label.npz', w = generated_y.cpu().numpy())                                               
             elif self._args.mix_w_num == 3:
             
                 modified_mixed_label = copy.deepcopy(mixed_label)
@@ -1613,7 +1785,7 @@ class MaggieStylegan2ada:
                 assert ws.shape[1:] == (G.num_ws, G.w_dim)                                                                    
                 for _, w in enumerate(ws):
 
-                    img = G.synthesis(w.unsqueeze(0), noise_mode=noise_mode)
+                    img = self.__synthesize__(G, w.unsqueeze(0), noise_mode=noise_mode)
 
                     generated_x = img[-1]            
                     generated_y = mixed_label[-1]
@@ -1623,16 +1795,16 @@ class MaggieStylegan2ada:
                     w3_label_name = f"{classification[int(w3_label_index)]}"
 
                     if self._args.dataset != 'kmnist' and self._args.dataset != 'mnist':
-                        img_pil = PIL.Image.fromarray(img, 'RGB')
+                        img_mode = 'RGB'
                     elif self._args.dataset == 'kmnist' or self._args.dataset == 'mnist':
                         img = img.transpose([2, 0, 1])
                         img = img[0]
-                        img_pil = PIL.Image.fromarray(img, 'L')                                      
-                    img = img_pil.save(f'{outdir}/{interpolated_w_index:08d}-{int(w1_label_index)}-{w1_label_name}+{int(w2_label_index)}-{w2_label_name}+{int(w3_label_index)}-{w3_label_name}-mixed-image.png')                                        
+                        img_mode = 'L'
+                    self.artifactsink().savepng(f'{outdir}/{interpolated_w_index:08d}-{int(w1_label_index)}-{w1_label_name}+{int(w2_label_index)}-{w2_label_name}+{int(w3_label_index)}-{w3_label_name}-mixed-image.png', img, img_mode)                                        
                     if self._args.defense_mode != 'rmt':
 
-                        np.savez(f'{outdir}/{interpolated_w_index:08d}-{int(w1_label_index)}-{w1_label_name}+{int(w2_label_index)}-{w2_label_name}+{int(w3_label_index)}-{w3_label_name}-mixed-image.npz', w = generated_x.cpu().numpy())                                        
-                        np.savez(f'{outdir}/{interpolated_w_index:08d}-{int(w1_label_index)}-{w1_label_name}+{int(w2_label_index)}-{w2_label_name}+{int(w3_label_index)}-{w3_label_name}-mixed-label.npz', w = generated_y.cpu().numpy())                                             
+                        self.artifactsink().savez(f'{outdir}/{interpolated_w_index:08d}-{int(w1_label_index)}-{w1_label_name}+{int(w2_label_index)}-{w2_label_name}+{int(w3_label_index)}-{w3_label_name}-mixed-image.npz', w = generated_x.cpu().numpy())                                        
+                        self.artifactsink().savez(f'{outdir}/{interpolated_w_index:08d}-{int(w1_label_index)}-{w1_label_name}+{int(w2_label_index)}-{w2_label_name}+{int(w3_label_index)}-{w3_label_name}-mixed-label.npz', w = generated_y.cpu().numpy())                                             
 
             return generated_x, generated_y
             
@@ -1654,9 +1826,9 @@ class MaggieStylegan2ada:
         for seed_idx, seed in enumerate(seeds):
             print('Generating image for seed %d (%d/%d) ...' % (seed, seed_idx, len(seeds)))
             z = torch.from_numpy(np.random.RandomState(seed).randn(1, G.z_dim)).to(device)
-            img = G(z, label, truncation_psi=truncation_psi, noise_mode=noise_mode)
+            img = self.__generatez__(G, z, label, truncation_psi, noise_mode)
             img = (img.permute(0, 2, 3, 1) * 127.5 + 128).clamp(0, 255).to(torch.uint8)
-            PIL.Image.fromarray(img[0].cpu().numpy(), 'RGB').save(f'{outdir}/seed{seed:04d}.png') 
+            self.artifactsink().savepng(f'{outdir}/seed{seed:04d}.png', img[0].cpu().numpy(), 'RGB')
 
         generated_x = img[0]
         generated_y = label
@@ -1725,8 +1897,7 @@ class MaggieStylegan2ada:
 
         print('Loading networks from "%s"...' % network_pkl)
         device = torch.device('cuda')
-        with dnnlib.util.open_url(network_pkl) as f:
-            G = legacy.load_network_pkl(f)['G_ema'].to(device)                                                                  #   type: ignore
+        G = self.loadgenerator(network_pkl)
 
         if projected_w is not None:
             print(f'Generating images from projected W "{projected_w}"')        
@@ -1738,7 +1909,7 @@ class MaggieStylegan2ada:
          
             assert ws.shape[1:] == (G.num_ws, G.w_dim)                                                               
             for idx, w in enumerate(ws):
-                img = G.synthesis(w.unsqueeze(0), noise_mode=noise_mode)
+                img = self.__synthesize__(G, w.unsqueeze(0), noise_mode=noise_mode)
  
                 generated_x = img[-1]                 
                 generated_y = mixed_label[-1]
@@ -1747,49 +1918,59 @@ class MaggieStylegan2ada:
                 w1_name =str(w_name[0][0])
                 w2_name = str(w_name[0][1])
 
-                img_pil = PIL.Image.fromarray(img[0].cpu().numpy(), 'RGB')
-       
-                img = img_pil.save(f'{outdir}/{w1_name}+{w2_name}-mixed-image.png')                                    
-               
-                label_path = f'{outdir}/{w1_name}+{w2_name}-mixed-label.npz'
-                                
-                np.savez(label_path, w = mixed_label.unsqueeze(0).cpu().numpy())                                             
-              
-                np.savez(f'{outdir}/{w1_name}+{w2_name}-mixed-image.npz', w = generated_x.cpu().numpy())       
-                np.savez(f'{outdir}/{w1_name}+{w2_name}-mixed-label.npz', w = generated_y.cpu().numpy())         
+                self.artifactsink().savepng(f'{outdir}/{w1_name}+{w2_name}-mixed-image.png', img[0].cpu().numpy(), 'RGB')
+
+                #   the mixed-label npz used to be written twice, only the last write (generated_y) ever survived
+                self.artifactsink().savez(f'{outdir}/{w1_name}+{w2_name}-mixed-image.npz', w = generated_x.cpu().numpy())       
+                self.artifactsink().savez(f'{outdir}/{w1_name}+{w2_name}-mixed-label.npz', w = generated_y.cpu().numpy())         
                 
             return generated_x, generated_y
 
         if seeds is None:
             ctx.fail('--seeds option is required when not using --projected_w')
 
-        # Labels.
-        label = torch.zeros([1, G.c_dim], device=device)
+        # Labels, one row per seed.
+        seed_class_idx = self._args.seed_class_idx
+        if seed_class_idx is None:
+            seed_class_idx = [class_idx] * len(seeds)
+        elif len(seed_class_idx) == 1:
+            seed_class_idx = seed_class_idx * len(seeds)
+        elif len(seed_class_idx) != len(seeds):
+            raise Exception(f'--seed_class_idx gives {len(seed_class_idx)} labels for {len(seeds)} seeds')
+
+        labels = torch.zeros([len(seeds), G.c_dim], device=device)
         if G.c_dim != 0:
-            if class_idx is None:
+            if None in seed_class_idx:
                 ctx.fail('Must specify class label with --class when using a conditional network')
-            label[:, class_idx] = 1
+            labels[torch.arange(len(seeds)), torch.tensor(seed_class_idx)] = 1
         else:
-            if class_idx is not None:
+            if seed_class_idx[0] is not None:
                 print ('warn: --class=lbl ignored when running on an unconditional network')
 
-        # Generate images.
-        for seed_idx, seed in enumerate(seeds):
-            print('Generating image for seed %d (%d/%d) ...' % (seed, seed_idx, len(seeds)))
-            z = torch.from_numpy(np.random.RandomState(seed).randn(1, G.z_dim)).to(device)
-            img = G(z, label, truncation_psi=truncation_psi, noise_mode=noise_mode)
-            img = (img.permute(0, 2, 3, 1) * 127.5 + 128).clamp(0, 255).to(torch.uint8)
+        # Per seed z, identical to np.random.RandomState(seed).randn(1, G.z_dim) of the batch size 1 loop.
+        zs = np.concatenate([np.random.RandomState(seed).randn(1, G.z_dim) for seed in seeds])
+        zs = torch.from_numpy(zs).to(device)
+
+        # Generate images in micro batches.
+        batch_size = self._args.generate_batch_size
+        for batch_start in range(0, len(seeds), batch_size):
+            print('Generating images for seeds %d-%d (%d/%d) ...' % (seeds[batch_start], seeds[min(batch_start + batch_size, len(seeds)) - 1], batch_start, len(seeds)))
+            z = zs[batch_start : batch_start + batch_size]
+            label = labels[batch_start : batch_start + batch_size]
+            img = self.__generatez__(G, z, label, truncation_psi, noise_mode)
+            img = (img.permute(0, 2, 3, 1) * 127.5 + 128).clamp(0, 255).to(torch.uint8).cpu().numpy()
 
             _, _, _, channel_num = img.shape
-            
-            assert channel_num in [1, 3]
-            if channel_num == 1:
-                PIL.Image.fromarray(img[0][:, :, 0].cpu().numpy(), 'L').save(f'{outdir}/seed{seed:04d}.png') 
-            if channel_num == 3:
-                PIL.Image.fromarray(img[0].cpu().numpy(), 'RGB').save(f'{outdir}/seed{seed:04d}.png') 
 
-        generated_x = img[0]
-        generated_y = label
+            assert channel_num in [1, 3]
+            for img_index, seed in enumerate(seeds[batch_start : batch_start + batch_size]):
+                if channel_num == 1:
+                    self.artifactsink().savepng(f'{outdir}/seed{seed:04d}.png', img[img_index][:, :, 0], 'L')
+                if channel_num == 3:
+                    self.artifactsink().savepng(f'{outdir}/seed{seed:04d}.png', img[img_index], 'RGB')
+
+        generated_x = torch.from_numpy(img[-1])
+        generated_y = label[-1:]
         return generated_x, generated_y
 
     def __num_range__(self, s: str) -> List[int]:
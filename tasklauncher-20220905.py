@@ -14,6 +14,9 @@ import utils.stylegan2ada.legacy as legacy
 import os
 import numpy as np
 from attacks.perattack import PerAttack
+from utils.checkpoint import LoadCheckpointModel
+from evaluations.cascade import CascadeEvaluator
+from attacks.advstore import SubsetAdvSet, CatAdvSets
 
 
 
@@ -74,27 +77,44 @@ if __name__ == '__main__':
                 cla_network_pkl: /root/autodl-tmp/maggie/result/train/cla-train/preactresnet18-imagenetmixed10/standard-trained-classifier-preactresnet18-on-clean-imagenetmixed10-epoch-0023-acc-90.47.pkl
                 """
 
-                learned_model = torch.load(args.cla_network_pkl)
-                attack_classifier = AdvAttack(args,learned_model)
-                target_model = attack_classifier.targetmodel()    
-
-                print("start generating adv 20220812")
-                x_test_adv, y_test_adv = attack_classifier.generate(exp_result_dir, test_dataloader=cle_train_dataloader)         
+                learned_model = LoadCheckpointModel(args.cla_network_pkl, lambda: RMClassifier(args).model())
 
-                adv_test_accuracy, adv_test_loss = attack_classifier.evaluatefromtensor(target_model,x_test_adv,y_test_adv)
-                print(f'standard trained classifier accuary on adversarial testset:{adv_test_accuracy * 100:.4f}%' ) 
-                print(f'standard trained classifier loss on adversarial testset:{adv_test_loss}' )    
+                if args.cascade_attacks is not None:
+                    cle_x_test, cle_y_test = RMClassifier(args, learned_model).getrawset(cle_test_dataloader)
+                    cascade_stages = args.cascade_attacks.split(',')
+                    cascade_accuracy, stage_results = CascadeEvaluator(args, cascade_stages).evaluate(learned_model, cle_x_test, cle_y_test)
+                    print(f'standard trained classifier robust accuary under the {"+".join(cascade_stages)} cascade:{cascade_accuracy * 100:.4f}%' )
 
-                accuracy_txt=open(f'{attack_classifier.getexpresultdir()}/classifier-{args.cla_model}-accuracy-on-{args.dataset}-testset.txt', "w")    
-                txt_content = f'{attack_classifier.getexpresultdir()}/pretrained-classifier-{args.cla_model}-accuracy-on-adv-{args.dataset}-testset = {adv_test_accuracy}\n'
-                accuracy_txt.write(str(txt_content))
+                    cascade_dir = os.path.join(exp_result_dir, f'attack-{args.dataset}-dataset')
+                    os.makedirs(cascade_dir, exist_ok=True)
+                    cascade_txt=open(f'{cascade_dir}/classifier-{args.cla_model}-cascade-accuracy-on-{args.dataset}-testset.txt', "w")
+                    for stage_result in stage_results:
+                        cascade_txt.write(f"{stage_result['stage']}: attacked = {stage_result['attacked']}, broken = {stage_result['broken']}, robust accuracy = {stage_result['robust_accuracy']}, seconds = {stage_result['seconds']:.1f}\n")
+                    cascade_txt.close()
+                else:
+                    attack_classifier = AdvAttack(args,learned_model)
+                    target_model = attack_classifier.targetmodel()    
+
+                    print("start generating adv 20220812")
+                    if args.adv_chunk_size is not None:
+                        adv_store, adv_test_accuracy, adv_test_loss = attack_classifier.generatechunked(exp_result_dir, cle_train_dataloader)
+                    else:
+                        x_test_adv, y_test_adv = attack_classifier.generate(exp_result_dir, test_dataloader=cle_train_dataloader)         
+
+                        adv_test_accuracy, adv_test_loss = attack_classifier.evaluatefromtensor(target_model,x_test_adv,y_test_adv)
+                    print(f'standard trained classifier accuary on adversarial testset:{adv_test_accuracy * 100:.4f}%' ) 
+                    print(f'standard trained classifier loss on adversarial testset:{adv_test_loss}' )    
+
+                    accuracy_txt=open(f'{attack_classifier.getexpresultdir()}/classifier-{args.cla_model}-accuracy-on-{args.dataset}-testset.txt', "w")    
+                    txt_content = f'{attack_classifier.getexpresultdir()}/pretrained-classifier-{args.cla_model}-accuracy-on-adv-{args.dataset}-testset = {adv_test_accuracy}\n'
+                    accuracy_txt.write(str(txt_content))
             
-                loss_txt=open(f'{attack_classifier.getexpresultdir()}/classifier-{args.cla_model}-loss-on-{args.dataset}-testset.txt', "w")    
-                loss_txt_content = f'{attack_classifier.getexpresultdir()}/pretrained-classifier-{args.cla_model}-loss-on-adv-{args.dataset}-testset = {adv_test_loss}\n'
-                loss_txt.write(str(loss_txt_content))    
+                    loss_txt=open(f'{attack_classifier.getexpresultdir()}/classifier-{args.cla_model}-loss-on-{args.dataset}-testset.txt', "w")    
+                    loss_txt_content = f'{attack_classifier.getexpresultdir()}/pretrained-classifier-{args.cla_model}-loss-on-adv-{args.dataset}-testset = {adv_test_loss}\n'
+                    loss_txt.write(str(loss_txt_content))    
             
             elif args.perceptualattack == True: 
-                learned_model = torch.load(args.cla_network_pkl)
+                learned_model = LoadCheckpointModel(args.cla_network_pkl, lambda: RMClassifier(args).model())
                 attack_classifier = PerAttack(args,learned_model)
                 target_model = attack_classifier.targetmodel()    
 
@@ -117,7 +137,7 @@ if __name__ == '__main__':
             print("eps:",args.attack_eps)
             print("latent adversarial attack.............")
             print("cla_network_pkl:",args.cla_network_pkl)
-            learned_cla_model = torch.load(args.cla_network_pkl)
+            learned_cla_model = LoadCheckpointModel(args.cla_network_pkl, lambda: RMClassifier(args).model())
             target_classifier = RMClassifier(args,learned_cla_model)
             cle_w_test, cle_y_test = target_classifier.getproset(args.projected_dataset)
             cle_y_test = cle_y_test[:,0]    
@@ -129,8 +149,7 @@ if __name__ == '__main__':
             cla_net.eval()                
 
             device = torch.device('cuda')
-            with dnnlib.util.open_url(args.gen_network_pkl) as fp:
-                G = legacy.load_network_pkl(fp)['G_ema'].requires_grad_(False).to(device)                                                
+            G = legacy.load_generator(args.gen_network_pkl, device)
             
             gan_net = G.synthesis     
             gan_net.cuda()
@@ -178,7 +197,7 @@ if __name__ == '__main__':
             print("lr:",args.lr)
 
             print("args.cla_network_pkl",args.cla_network_pkl)
-            learned_model = torch.load(args.cla_network_pkl)
+            learned_model = LoadCheckpointModel(args.cla_network_pkl, lambda: RMClassifier(args).model())
             target_classifier = RMClassifier(args,learned_model)
 
             print("args.projected_dataset",args.projected_dataset)
@@ -192,7 +211,7 @@ if __name__ == '__main__':
 
             print("args.test_adv_dataset",args.test_adv_dataset)
             adv_testset_path = args.test_adv_dataset
-            adv_x_test, adv_y_test = target_classifier.getadvset(adv_testset_path)
+            adv_x_test, adv_y_test = target_classifier.getadvset(adv_testset_path, cle_x_test)
             
             cle_test_acc, cle_test_loss = target_classifier.evaluatefromtensor(target_classifier.model(),cle_x_test,cle_y_test)     
             print(f'Accuary of before rmt trained classifier on clean testset:{cle_test_acc * 100:.4f}%' ) 
@@ -234,7 +253,7 @@ if __name__ == '__main__':
             print(f'Loss of rmt trained classifier on clean testset:{cle_test_loss}' ) 
            
             if args.whitebox == True:
-                attack_classifier = AdvAttack(args, target_classifier.model())
+                attack_classifier = target_classifier.attacker()
                 target_model = attack_classifier.targetmodel()
                 adv_x_test, adv_y_test = attack_classifier.generateadvfromtestsettensor(cle_x_test, cle_y_test)
                 adv_test_acc, adv_test_loss = target_classifier.evaluatefromtensor(target_model,adv_x_test,adv_y_test)
@@ -253,7 +272,7 @@ if __name__ == '__main__':
             print("lr:",args.lr)
 
             print("args.cla_network_pkl",args.cla_network_pkl)
-            learned_model = torch.load(args.cla_network_pkl)
+            learned_model = LoadCheckpointModel(args.cla_network_pkl, lambda: RMClassifier(args).model())
             target_classifier = RMClassifier(args,learned_model)
 
             cle_x_train, cle_y_train = target_classifier.getrawset(cle_train_dataloader)
@@ -265,14 +284,14 @@ if __name__ == '__main__':
 
             adv_trainset_path = args.train_adv_dataset
 
-            adv_x_train, adv_y_train = target_classifier.getadvset(adv_trainset_path)
+            adv_x_train, adv_y_train = target_classifier.getadvset(adv_trainset_path, cle_x_train)
             print("adv_x_train.shape:",adv_x_train.shape)
             print("adv_y_train.shape:",adv_y_train.shape)            
 
             print("args.test_adv_dataset",args.test_adv_dataset)
             adv_testset_path = args.test_adv_dataset
 
-            adv_x_test, adv_y_test = target_classifier.getadvset(adv_testset_path)
+            adv_x_test, adv_y_test = target_classifier.getadvset(adv_testset_path, cle_x_test)
             print("adv_x_test.shape:",adv_x_test.shape)
             print("adv_y_test.shape:",adv_y_test.shape)  
 
@@ -293,7 +312,7 @@ if __name__ == '__main__':
             print(f'Loss of adversarial trained classifier on clean testset:{cle_test_loss}' ) 
            
             if args.whitebox == True:
-                attack_classifier = AdvAttack(args, target_classifier.model())
+                attack_classifier = target_classifier.attacker()
                 target_model = attack_classifier.targetmodel()
                 adv_x_test, adv_y_test = attack_classifier.generateadvfromtestsettensor(cle_x_test, cle_y_test)
                 adv_test_acc, adv_test_loss = target_classifier.evaluatefromtensor(target_model,adv_x_test,adv_y_test)
@@ -308,7 +327,7 @@ if __name__ == '__main__':
 
         elif args.defense_mode =='inputmixup':
             print("args.cla_network_pkl",args.cla_network_pkl)
-            learned_model = torch.load(args.cla_network_pkl)
+            learned_model = LoadCheckpointModel(args.cla_network_pkl, lambda: RMClassifier(args).model())
             target_classifier = RMClassifier(args,learned_model)
 
             cle_x_train, cle_y_train = target_classifier.getrawset(cle_train_dataloader)
@@ -320,7 +339,7 @@ if __name__ == '__main__':
             
             print("args.test_adv_dataset",args.test_adv_dataset)
             adv_testset_path = args.test_adv_dataset
-            adv_x_test, adv_y_test = target_classifier.getadvset(adv_testset_path)
+            adv_x_test, adv_y_test = target_classifier.getadvset(adv_testset_path, cle_x_test)
 
             cle_test_acc, cle_test_loss = target_classifier.evaluatefromtensor(target_classifier.model(),cle_x_test,cle_y_test)     
             print(f'Accuary of before inputmixup trained classifier on clean testset:{cle_test_acc * 100:.4f}%' ) 
@@ -344,7 +363,7 @@ if __name__ == '__main__':
             print(f'Loss of inputmixup trained classifier on clean testset:{cle_test_loss}' ) 
            
             if args.whitebox == True:
-                attack_classifier = AdvAttack(args, target_classifier.model())
+                attack_classifier = target_classifier.attacker()
                 target_model = attack_classifier.targetmodel()
                 adv_x_test, adv_y_test = attack_classifier.generateadvfromtestsettensor(cle_x_test, cle_y_test)
                 adv_test_acc, adv_test_loss = target_classifier.evaluatefromtensor(target_model,adv_x_test,adv_y_test)
@@ -363,7 +382,7 @@ if __name__ == '__main__':
             print("cla_network_pkl:",args.cla_network_pkl)
             print("args.attack_mode:",args.attack_mode)
 
-            learned_model = torch.load(args.cla_network_pkl)
+            learned_model = LoadCheckpointModel(args.cla_network_pkl, lambda: RMClassifier(args).model())
             target_classifier = RMClassifier(args,learned_model)
 
             cle_x_train, cle_y_train = target_classifier.getrawset(cle_train_dataloader)
@@ -377,7 +396,7 @@ if __name__ == '__main__':
 
             print("args.test_adv_dataset",args.test_adv_dataset)
             adv_testset_path = args.test_adv_dataset
-            adv_x_test, adv_y_test = target_classifier.getadvset(adv_testset_path)
+            adv_x_test, adv_y_test = target_classifier.getadvset(adv_testset_path, cle_x_test)
 
             cle_test_acc, cle_test_loss = target_classifier.evaluatefromtensor(target_classifier.model(),cle_x_test,cle_y_test)     
             print(f'Accuary of before manifold mixup trained classifier on clean testset:{cle_test_acc * 100:.4f}%' ) 
@@ -402,7 +421,7 @@ if __name__ == '__main__':
             print(f'Loss of manifold trained classifier on clean testset:{cle_test_loss}' ) 
            
             if args.whitebox == True:
-                attack_classifier = AdvAttack(args, target_classifier.model())
+                attack_classifier = target_classifier.attacker()
                 target_model = attack_classifier.targetmodel()
                 adv_x_test, adv_y_test = attack_classifier.generateadvfromtestsettensor(cle_x_test, cle_y_test)
                 adv_test_acc, adv_test_loss = target_classifier.evaluatefromtensor(target_model,adv_x_test,adv_y_test)
@@ -421,7 +440,7 @@ if __name__ == '__main__':
             print("cla_network_pkl:",args.cla_network_pkl)
             print("args.attack_mode:",args.attack_mode)
 
-            learned_model = torch.load(args.cla_network_pkl)
+            learned_model = LoadCheckpointModel(args.cla_network_pkl, lambda: RMClassifier(args).model())
             target_classifier = RMClassifier(args,learned_model)
 
             cle_x_train, cle_y_train = target_classifier.getrawset(cle_train_dataloader)
@@ -435,7 +454,7 @@ if __name__ == '__main__':
 
             print("args.test_adv_dataset",args.test_adv_dataset)
             adv_testset_path = args.test_adv_dataset
-            adv_x_test, adv_y_test = target_classifier.getadvset(adv_testset_path)
+            adv_x_test, adv_y_test = target_classifier.getadvset(adv_testset_path, cle_x_test)
 
             cle_test_acc, cle_test_loss = target_classifier.evaluatefromtensor(target_classifier.model(),cle_x_test,cle_y_test)     
             print(f'Accuary of before patch mixup trained classifier on clean testset:{cle_test_acc * 100:.4f}%' ) 
@@ -460,7 +479,7 @@ if __name__ == '__main__':
             print(f'Loss of patch trained classifier on clean testset:{cle_test_loss}' ) 
            
             if args.whitebox == True:
-                attack_classifier = AdvAttack(args, target_classifier.model())
+                attack_classifier = target_classifier.attacker()
                 target_model = attack_classifier.targetmodel()
                 adv_x_test, adv_y_test = attack_classifier.generateadvfromtestsettensor(cle_x_test, cle_y_test)
                 adv_test_acc, adv_test_loss = target_classifier.evaluatefromtensor(target_model,adv_x_test,adv_y_test)
@@ -479,7 +498,7 @@ if __name__ == '__main__':
             print("args.attack_mode:",args.attack_mode)
             print("cla_network_pkl:",args.cla_network_pkl)
 
-            learned_model = torch.load(args.cla_network_pkl)
+            learned_model = LoadCheckpointModel(args.cla_network_pkl, lambda: RMClassifier(args).model())
             target_classifier = RMClassifier(args,learned_model)
 
             cle_x_train, cle_y_train = target_classifier.getrawset(cle_train_dataloader)
@@ -493,7 +512,7 @@ if __name__ == '__main__':
 
             print("args.test_adv_dataset",args.test_adv_dataset)
             adv_testset_path = args.test_adv_dataset
-            adv_x_test, adv_y_test = target_classifier.getadvset(adv_testset_path)
+            adv_x_test, adv_y_test = target_classifier.getadvset(adv_testset_path, cle_x_test)
 
             cle_test_acc, cle_test_loss = target_classifier.evaluatefromtensor(target_classifier.model(),cle_x_test,cle_y_test)     
             print(f'Accuary of before puzzle mixup trained classifier on clean testset:{cle_test_acc * 100:.4f}%' ) 
@@ -516,7 +535,7 @@ if __name__ == '__main__':
             print(f'Loss of puzzle trained classifier on clean testset:{cle_test_loss}' ) 
            
             if args.whitebox == True:
-                attack_classifier = AdvAttack(args, target_classifier.model())
+                attack_classifier = target_classifier.attacker()
                 target_model = attack_classifier.targetmodel()
                 adv_x_test, adv_y_test = attack_classifier.generateadvfromtestsettensor(cle_x_test, cle_y_test)
                 adv_test_acc, adv_test_loss = target_classifier.evaluatefromtensor(target_model,adv_x_test,adv_y_test)
@@ -535,7 +554,7 @@ if __name__ == '__main__':
             print("cla_network_pkl:",args.cla_network_pkl)
             print("args.attack_mode:",args.attack_mode)
 
-            learned_model = torch.load(args.cla_network_pkl)
+            learned_model = LoadCheckpointModel(args.cla_network_pkl, lambda: RMClassifier(args).model())
             target_classifier = RMClassifier(args,learned_model)
 
             cle_x_train, cle_y_train = target_classifier.getrawset(cle_train_dataloader)
@@ -549,7 +568,7 @@ if __name__ == '__main__':
 
             print("args.test_adv_dataset",args.test_adv_dataset)
             adv_testset_path = args.test_adv_dataset
-            adv_x_test, adv_y_test = target_classifier.getadvset(adv_testset_path)
+            adv_x_test, adv_y_test = target_classifier.getadvset(adv_testset_path, cle_x_test)
 
             cle_test_acc, cle_test_loss = target_classifier.evaluatefromtensor(target_classifier.model(),cle_x_test,cle_y_test)    
             print(f'Accuary of before cut mixup trained classifier on clean testset:{cle_test_acc * 100:.4f}%' ) 
@@ -573,7 +592,7 @@ if __name__ == '__main__':
             print(f'Loss of cut mixup trained classifier on clean testset:{cle_test_loss}' ) 
            
             if args.whitebox == True:
-                attack_classifier = AdvAttack(args, target_classifier.model())
+                attack_classifier = target_classifier.attacker()
                 target_model = attack_classifier.targetmodel()
                 adv_x_test, adv_y_test = attack_classifier.generateadvfromtestsettensor(cle_x_test, cle_y_test)
                 adv_test_acc, adv_test_loss = target_classifier.evaluatefromtensor(target_model,adv_x_test,adv_y_test)
@@ -592,7 +611,7 @@ if __name__ == '__main__':
             print("lr:",args.lr)
 
             print("args.cla_network_pkl",args.cla_network_pkl)
-            learned_model = torch.load(args.cla_network_pkl)
+            learned_model = LoadCheckpointModel(args.cla_network_pkl, lambda: RMClassifier(args).model())
             target_classifier = RMClassifier(args,learned_model)
 
             cle_x_train, cle_y_train = target_classifier.getrawset(cle_train_dataloader)
@@ -604,21 +623,21 @@ if __name__ == '__main__':
 
             print("args.train_adv_dataset",args.train_adv_dataset)
             adv_trainset_path = args.train_adv_dataset
-            adv_x_train, adv_y_train = target_classifier.getadvset(adv_trainset_path)
-            adv_x_train=adv_x_train[:25000]
+            adv_x_train, adv_y_train = target_classifier.getadvset(adv_trainset_path, cle_x_train)
+            adv_x_train=SubsetAdvSet(adv_x_train, slice(0, 25000))
             adv_y_train=adv_y_train[:25000]
             print("adv_x_train.shape:",adv_x_train.shape)
             print("adv_y_train.shape:",adv_y_train.shape)            
 
             print("args.train_adv_dataset_2",args.train_adv_dataset_2)
             adv_trainset_path_2 = args.train_adv_dataset_2
-            adv_x_train_2, adv_y_train_2 = target_classifier.getadvset(adv_trainset_path_2)
-            adv_x_train_2=adv_x_train_2[:25000]
+            adv_x_train_2, adv_y_train_2 = target_classifier.getadvset(adv_trainset_path_2, cle_x_train)
+            adv_x_train_2=SubsetAdvSet(adv_x_train_2, slice(0, 25000))
             adv_y_train_2=adv_y_train_2[:25000]            
             print("adv_x_train_2.shape:",adv_x_train_2.shape)
             print("adv_y_train_2.shape:",adv_y_train_2.shape)  
               
-            adv_x_train = torch.cat([adv_x_train, adv_x_train_2], dim=0)
+            adv_x_train = CatAdvSets([adv_x_train, adv_x_train_2])
             adv_y_train = torch.cat([adv_y_train, adv_y_train_2], dim=0)  
             print("adv_x_train.shape:",adv_x_train.shape)
             print("adv_y_train.shape:",adv_y_train.shape)  
@@ -626,7 +645,7 @@ if __name__ == '__main__':
             print("args.test_adv_dataset",args.test_adv_dataset)
             adv_testset_path = args.test_adv_dataset
 
-            adv_x_test, adv_y_test = target_classifier.getadvset(adv_testset_path)
+            adv_x_test, adv_y_test = target_classifier.getadvset(adv_testset_path, cle_x_test)
             print("adv_x_test.shape:",adv_x_test.shape)
             print("adv_y_test.shape:",adv_y_test.shape)  
 
@@ -646,7 +665,7 @@ if __name__ == '__main__':
             print(f'Loss of dual manifold adversarial trained classifier on clean testset:{cle_test_loss}' ) 
            
             if args.whitebox == True:
-                attack_classifier = AdvAttack(args, target_classifier.model())
+                attack_classifier = target_classifier.attacker()
                 target_model = attack_classifier.targetmodel()
                 adv_x_test, adv_y_test = attack_classifier.generateadvfromtestsettensor(cle_x_test, cle_y_test)
                 adv_test_acc, adv_test_loss = target_classifier.evaluatefromtensor(target_model,adv_x_test,adv_y_test)
@@ -0,0 +1,121 @@
+"""
+Author: maggie
+Date:   2022-06-15
+Place:  Xidian University
+@copyright
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+import numpy as np
+import PIL.Image
+
+def ShardNpzPath(folder, shard_index, suffix):
+    return os.path.join(folder, f'{shard_index:08d}-{suffix}-shard.npz')
+
+def LoadShardedNpz(folder, suffix, key = 'w'):
+    """
+    Samples of the {index:08d}-{suffix}-shard.npz files that ArtifactSink wrote into folder, ordered by their original file names.
+    :returns: original file names, array [N, ...] stacked like a per-sample np.stack would (None if there is no shard)
+    """
+    shard_names = sorted(name for name in os.listdir(folder) if name.endswith(f'-{suffix}-shard.npz'))
+    if len(shard_names) == 0:
+        return [], None
+    names = []
+    arrays = []
+    for shard_name in shard_names:
+        shard = np.load(os.path.join(folder, shard_name))
+        names.extend(str(name) for name in shard['names'])
+        arrays.append(shard[key])
+    order = np.argsort(np.asarray(names), kind='stable')
+    return [names[index] for index in order], np.concatenate(arrays)[order]
+
+class ArtifactSink:
+    r"""
+        Write generated / adversarial samples to disk on a thread pool so saving does not serialize with compute.
+
+        attributes:
+            worker_num: writer threads
+            queue_size: at most queue_size writes are pending, savez()/savepng() block beyond that
+            shard_size: if set, savez() calls of one folder and file name suffix (the part after the last '-', e.g. image.npz /
+                        label.npz) are packed into {shard_index:08d}-{suffix}-shard.npz files of shard_size samples
+                        (arrays stacked per key, original file names in 'names') instead of one npz per sample.
+                        Read them back with LoadShardedNpz()
+
+        methods:
+            savez(path, **arrays), savepng(path, img, mode), flush(), close()
+    """
+    def __init__(self, worker_num = 4, queue_size = 64, shard_size = None) -> None:
+        self._executor = ThreadPoolExecutor(max_workers=worker_num)
+        self._queue_size = queue_size
+        self._slots = threading.BoundedSemaphore(queue_size)
+        self._shard_size = shard_size
+        self._shards = {}
+        self._shard_lock = threading.Lock()
+        self._pending = []
+        self._errors = []
+
+    def __submit__(self, function, *args, **kwargs):
+        self._slots.acquire()
+        future = self._executor.submit(function, *args, **kwargs)
+        future.add_done_callback(self.__done__)
+        if len(self._pending) >= self._queue_size:
+            self._pending = [pending_future for pending_future in self._pending if not pending_future.done()]
+        self._pending.append(future)
+
+    def __done__(self, future):
+        self._slots.release()
+        if future.exception() is not None:
+            self._errors.append(future.exception())
+
+    def savez(self, path, **arrays):
+        if self._shard_size is None:
+            self.__submit__(np.savez, path, **arrays)
+            return
+
+        folder, name = os.path.split(path)
+        suffix = os.path.splitext(name)[0].rsplit('-', 1)[-1]                                          #   images and labels of one folder never share a shard
+        with self._shard_lock:
+            shard = self._shards.setdefault((folder, suffix), {'index': 0, 'names': [], 'arrays': {}})
+            shard['names'].append(name)
+            for key, value in arrays.items():
+                shard['arrays'].setdefault(key, []).append(value)
+            if len(shard['names']) == self._shard_size:
+                self.__submitshard__((folder, suffix), shard)
+
+    def __submitshard__(self, shard_key, shard):
+        folder, suffix = shard_key
+        arrays = {key: np.stack(values) for key, values in shard['arrays'].items()}
+        shard_path = ShardNpzPath(folder, shard['index'], suffix)
+        self.__submit__(np.savez, shard_path, names=np.asarray(shard['names']), **arrays)
+        shard['index'] = shard['index'] + 1
+        shard['names'] = []
+        shard['arrays'] = {}
+
+    def savepng(self, path, img, mode = 'RGB'):
+        """
+        img: uint8 numpy array [h,w,c] ('RGB') or [h,w] ('L'), encoded by the writer thread
+        """
+        self.__submit__(self.__writepng__, path, img, mode)
+
+    def __writepng__(self, path, img, mode):
+        PIL.Image.fromarray(img, mode).save(path)
+
+    def flush(self):
+        with self._shard_lock:
+            for shard_key, shard in self._shards.items():
+                if len(shard['names']) > 0:
+                    self.__submitshard__(shard_key, shard)
+
+        wait(self._pending)
+        self._pending = []
+
+        if len(self._errors) > 0:
+            error = self._errors[0]
+            self._errors = []
+            raise error
+
+    def close(self):
+        self.flush()
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,147 @@
+"""
+Author: maggie
+Date:   2022-06-15
+Place:  Xidian University
+@copyright
+"""
+
+import os
+import json
+import random
+import numpy as np
+import torch
+from concurrent.futures import ThreadPoolExecutor
+
+def SnapshotToHost(obj):
+    """
+    Copy every tensor of a (nested) state dict to host memory so that training can keep updating the originals.
+    """
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().to('cpu', copy=True)
+    if isinstance(obj, dict):
+        return type(obj)((key, SnapshotToHost(value)) for key, value in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(SnapshotToHost(value) for value in obj)
+    return obj
+
+def GetRNGState():
+    rng_state = {
+        'python': random.getstate(),
+        'numpy': np.random.get_state(),
+        'torch': torch.get_rng_state(),
+    }
+    if torch.cuda.is_available():
+        rng_state['cuda'] = torch.cuda.get_rng_state_all()
+    return rng_state
+
+def SetRNGState(rng_state):
+    random.setstate(rng_state['python'])
+    np.random.set_state(rng_state['numpy'])
+    torch.set_rng_state(rng_state['torch'])
+    if 'cuda' in rng_state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(rng_state['cuda'])
+
+def LoadCheckpointModel(checkpoint_path, model_builder):
+    """
+    Load a classifier saved either as a whole pickled module (older runs) or as a CheckpointManager checkpoint.
+    model_builder() must return the untrained architecture, the checkpoint 'model' state dict is loaded into it.
+    """
+    checkpoint = torch.load(checkpoint_path, map_location='cpu')
+    if isinstance(checkpoint, torch.nn.Module):
+        return checkpoint
+    if not isinstance(checkpoint, dict) or 'model' not in checkpoint:
+        raise Exception(f'{checkpoint_path} is neither a pickled model nor a model checkpoint')
+    model = model_builder()
+    model.load_state_dict(checkpoint['model'])
+    return model
+
+class CheckpointManager:
+    r"""
+        Save training checkpoints of one experiment result dir from a background thread.
+        save() snapshots the model / optimizer state dicts and the rng states to host memory and returns,
+        the writer thread saves them to a temporary file and renames it into place.
+
+        attributes:
+            ckpt_dir: experiment result dir, the retained checkpoints are listed in ckpt_dir/checkpoints.json
+            keep_last: keep the keep_last latest epoch checkpoints
+            keep_best: also keep the keep_best checkpoints with the best metric, all are kept if neither is set
+            best_mode: 'max' or 'min', how the metric of keep_best is compared
+
+        methods:
+            save(file_name, model, optimizer=None, epoch=None, metric=None, managed=True, extra=None)
+            latest(): path of the latest retained checkpoint or None
+            flush(), close()
+    """
+    def __init__(self, ckpt_dir, keep_last = None, keep_best = 0, best_mode = 'max') -> None:
+        if best_mode not in ['max', 'min']:
+            raise Exception('please input valid best_mode: max or min')
+        os.makedirs(ckpt_dir, exist_ok=True)
+        self._ckpt_dir = ckpt_dir
+        self._keep_last = keep_last
+        self._keep_best = keep_best or 0
+        self._best_mode = best_mode
+        self._manifest_path = os.path.join(ckpt_dir, 'checkpoints.json')
+        self._entries = []
+        if os.path.exists(self._manifest_path):
+            with open(self._manifest_path) as f:
+                self._entries = json.load(f)
+        self._executor = ThreadPoolExecutor(max_workers=1)                                              #   one writer keeps saves and deletions in order
+        self._pending = []
+
+    def save(self, file_name, model, optimizer = None, epoch = None, metric = None, managed = True, extra = None):
+        checkpoint = {
+            'model': SnapshotToHost(model.state_dict()),
+            'optimizer': SnapshotToHost(optimizer.state_dict()) if optimizer is not None else None,
+            'rng': GetRNGState(),
+            'epoch': epoch,
+            'metric': float(metric) if metric is not None else None,
+        }
+        if extra is not None:
+            checkpoint.update(SnapshotToHost(extra))
+        path = os.path.join(self._ckpt_dir, file_name)
+        self._pending.append(self._executor.submit(self.__write__, path, checkpoint, managed))
+
+    def __write__(self, path, checkpoint, managed):
+        tmp_path = f'{path}.tmp'
+        torch.save(checkpoint, tmp_path)
+        os.replace(tmp_path, path)
+        if not managed:
+            return
+
+        self._entries = [entry for entry in self._entries if entry['path'] != path]
+        self._entries.append({'path': path, 'epoch': checkpoint['epoch'], 'metric': checkpoint['metric']})
+        self.__retain__()
+        tmp_manifest_path = f'{self._manifest_path}.tmp'
+        with open(tmp_manifest_path, 'w') as f:
+            json.dump(self._entries, f, indent=1)
+        os.replace(tmp_manifest_path, self._manifest_path)
+
+    def __retain__(self):
+        if self._keep_last is None and self._keep_best == 0:
+            return
+        keep_last = self._keep_last or 0
+        keep = set(entry['path'] for entry in self._entries[len(self._entries) - keep_last:])
+        if self._keep_best > 0:
+            scored = [entry for entry in self._entries if entry['metric'] is not None]
+            scored.sort(key=lambda entry: entry['metric'], reverse = self._best_mode == 'max')
+            keep.update(entry['path'] for entry in scored[:self._keep_best])
+
+        for entry in self._entries:
+            if entry['path'] not in keep and os.path.exists(entry['path']):
+                os.remove(entry['path'])
+        self._entries = [entry for entry in self._entries if entry['path'] in keep]
+
+    def latest(self):
+        self.flush()
+        if len(self._entries) == 0:
+            return None
+        return self._entries[-1]['path']
+
+    def flush(self):
+        for future in self._pending:
+            future.result()                                                                             #   re-raises a failed write
+        self._pending = []
+
+    def close(self):
+        self.flush()
+        self._executor.shutdown(wait=True)
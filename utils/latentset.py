@@ -0,0 +1,102 @@
+"""
+Author: maggie
+Date:   2022-06-15
+Place:  Xidian University
+@copyright
+"""
+
+import os
+import hashlib
+import numpy as np
+
+def GetProjectedNpzPaths(projected_dataset):
+    file_dir = os.listdir(projected_dataset)
+    file_dir.sort()
+
+    projected_w_npz_paths = []
+    label_npz_paths = []
+    for name in file_dir:
+        if os.path.splitext(name)[-1] != '.npz':
+            continue
+        if name[-15:-4] == 'projected_w':
+            projected_w_npz_paths.append(f'{projected_dataset}/{name}')
+        elif name[-9:-4] == 'label':
+            label_npz_paths.append(f'{projected_dataset}/{name}')
+
+    return projected_w_npz_paths, label_npz_paths
+
+def ProjectedSetKey(npz_paths):
+    """
+    Fingerprint of the projected npz files: sha1 over the sorted file names with their size and mtime,
+    so replaced or re-projected files invalidate the packed cache even when their count is unchanged.
+    """
+    fingerprint = hashlib.sha1()
+    for npz_path in sorted(npz_paths):
+        npz_stat = os.stat(npz_path)
+        fingerprint.update(f'{os.path.basename(npz_path)}:{npz_stat.st_size}:{npz_stat.st_mtime_ns}\n'.encode())
+    return fingerprint.hexdigest()
+
+def LoadProjectedLatentSet(projected_dataset, cache_dir=None):
+    """
+    Load the projected w set and label set of a projected dataset folder as two numpy arrays.
+    The first call packs the per sample *projected_w.npz / *label.npz files into
+    projected_w_set.npy / projected_y_set.npy, later calls memory map the packed arrays
+    as long as projected_set.key still matches ProjectedSetKey() of the npz files.
+    :returns: w_set [N, num_ws, w_dim] float32, y_set [N, num_ws] int64
+    """
+    if cache_dir is None:
+        cache_dir = projected_dataset
+    os.makedirs(cache_dir, exist_ok=True)
+    w_cache_path = os.path.join(cache_dir, 'projected_w_set.npy')
+    y_cache_path = os.path.join(cache_dir, 'projected_y_set.npy')
+    key_path = os.path.join(cache_dir, 'projected_set.key')
+
+    projected_w_npz_paths, label_npz_paths = GetProjectedNpzPaths(projected_dataset)
+    if len(projected_w_npz_paths) != len(label_npz_paths):
+        raise Exception(f'{len(projected_w_npz_paths)} projected_w files but {len(label_npz_paths)} label files')
+
+    set_key = ProjectedSetKey(projected_w_npz_paths + label_npz_paths)
+    if os.path.exists(w_cache_path) and os.path.exists(y_cache_path) and os.path.exists(key_path):
+        with open(key_path) as f:
+            cached_key = f.read().strip()
+        if cached_key == set_key:
+            return np.load(w_cache_path, mmap_mode='r'), np.load(y_cache_path, mmap_mode='r')
+        print("projected latent cache is stale, repacking...")
+
+    print(f"packing {len(projected_w_npz_paths)} projected w npz files into {cache_dir}")
+    w_set = None
+    for index, projected_w_path in enumerate(projected_w_npz_paths):
+        w = np.load(projected_w_path)['w'][-1]                                                      #   w.shape: (8,512)
+        if w_set is None:
+            w_set = np.lib.format.open_memmap(f'{w_cache_path}.tmp.npy', mode='w+', dtype=np.float32, shape=(len(projected_w_npz_paths),) + w.shape)
+        w_set[index] = w
+    if w_set is None:
+        raise Exception(f'no projected_w npz file in {projected_dataset}')
+    w_set.flush()
+    del w_set
+    os.replace(f'{w_cache_path}.tmp.npy', w_cache_path)
+
+    y_set = np.stack([np.load(label_npz_path)['w'][-1] for label_npz_path in label_npz_paths]).astype(np.int64)     #   y_set.shape: (N,8)
+    np.save(f'{y_cache_path}.tmp.npy', y_set)
+    os.replace(f'{y_cache_path}.tmp.npy', y_cache_path)
+    with open(f'{key_path}.tmp', 'w') as f:
+        f.write(set_key)
+    os.replace(f'{key_path}.tmp', key_path)                                                         #   written last, a crash while packing leaves the cache stale
+
+    return np.load(w_cache_path, mmap_mode='r'), np.load(y_cache_path, mmap_mode='r')
+
+def SelectLatentSubset(w_set, y_set, index=None, classes=None):
+    """
+    Select rows of a (memory mapped) latent set by sample index and/or by class label,
+    keeping the given index order. Only the selected rows are read from disk.
+    """
+    if index is None and classes is None:
+        return np.asarray(w_set), np.asarray(y_set)
+
+    select = np.arange(len(y_set))
+    if index is not None:
+        select = np.asarray(index, dtype=np.int64)
+    if classes is not None:
+        select = select[np.isin(np.asarray(y_set[select]).reshape(len(select), -1)[:, -1], np.asarray(classes))]
+
+    return np.ascontiguousarray(w_set[select]), np.ascontiguousarray(y_set[select])
@@ -0,0 +1,127 @@
+"""
+Author: maggie
+Date:   2022-06-15
+Place:  Xidian University
+@copyright
+"""
+
+import os
+import csv
+import json
+import time
+import queue
+import atexit
+import threading
+import torch
+from tensorboardX import SummaryWriter
+
+class MetricSink:
+    r"""
+        Run level scalar metrics, created once per experiment result dir.
+        scalar() only enqueues the record, a background thread converts tensor values, and writes the records
+        in batches to one tensorboard event stream (log_dir/tensorboard-log-run) and to log_dir/metrics.csv or metrics.jsonl.
+
+        attributes:
+            log_dir: experiment result dir
+            file_format: 'csv' or 'jsonl'
+            flush_size: records per batched write
+            flush_interval: seconds after which pending records are written even if there are less than flush_size
+
+        methods:
+            scalar(tag, value, step): value may be a python number or a (cuda) 0-dim tensor, it is not synchronized by the caller
+            rate(tag, num, step): record num / seconds since the last rate() call of tag, e.g. samples per second
+            flush(), close()
+    """
+    def __init__(self, log_dir, file_format = 'csv', flush_size = 256, flush_interval = 10.0) -> None:
+        if file_format not in ['csv', 'jsonl']:
+            raise Exception('please input valid metrics file format: csv or jsonl')
+
+        os.makedirs(log_dir, exist_ok=True)
+        self._writer = SummaryWriter(log_dir = os.path.join(log_dir, 'tensorboard-log-run'))
+        self._file_format = file_format
+        self._file = open(os.path.join(log_dir, f'metrics.{file_format}'), 'a', newline='')
+        self._csv_writer = csv.writer(self._file) if file_format == 'csv' else None
+        if self._csv_writer is not None and self._file.tell() == 0:
+            self._csv_writer.writerow(['wall_time', 'step', 'tag', 'value'])
+
+        self._flush_size = flush_size
+        self._flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._rate_time = {}
+        self._closed = False
+        self._close_event = threading.Event()
+        self._errors = []
+        self._thread = threading.Thread(target=self.__worker__, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def scalar(self, tag, value, step):
+        if isinstance(value, torch.Tensor):
+            value = value.detach()
+        self._queue.put((time.time(), step, tag, value))
+
+    def rate(self, tag, num, step):
+        now = time.perf_counter()
+        last = self._rate_time.get(tag)
+        self._rate_time[tag] = now
+        if last is not None and now > last:
+            self.scalar(tag, num / (now - last), step)
+
+    def __worker__(self):
+        records = []
+        last_write = time.time()
+        while True:
+            try:
+                record = self._queue.get(timeout=self._flush_interval)
+            except queue.Empty:
+                record = None
+
+            if record is not None and not isinstance(record, threading.Event):
+                records.append(record)
+            if len(records) >= self._flush_size or time.time() - last_write >= self._flush_interval or isinstance(record, threading.Event):
+                try:
+                    self.__write__(records)
+                except Exception as error:
+                    self._errors.append(error)
+                records = []
+                last_write = time.time()
+
+            if isinstance(record, threading.Event):
+                record.set()
+                if record is self._close_event:
+                    return
+
+    def __write__(self, records):
+        if len(records) == 0:
+            return
+        for wall_time, step, tag, value in records:
+            value = float(value)
+            self._writer.add_scalar(tag = tag, scalar_value = value, global_step = step, walltime = wall_time)
+            if self._csv_writer is not None:
+                self._csv_writer.writerow([f'{wall_time:.3f}', step, tag, value])
+            else:
+                self._file.write(json.dumps({'wall_time': round(wall_time, 3), 'step': step, 'tag': tag, 'value': value}) + '\n')
+        self._writer.flush()
+        self._file.flush()
+
+    def flush(self):
+        if self._closed:
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait()
+        if len(self._errors) > 0:
+            error = self._errors[0]
+            self._errors = []
+            raise error
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(self._close_event)
+        self._close_event.wait()
+        self._thread.join()
+        self._writer.close()
+        self._file.close()
+        atexit.unregister(self.close)
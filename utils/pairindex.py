@@ -0,0 +1,153 @@
+"""
+Author: maggie
+Date:   2022-06-15
+Place:  Xidian University
+@copyright
+"""
+
+import math
+import torch
+
+class LatentPairIndex:
+    r"""
+        Mixing partner index over the whole projected w set.
+
+        attributes:
+            pair_mode: 'random', 'sameclass', 'diffclass', 'nearest' or 'farthest'
+            knn_mode: 'exact' (blocked matmul top-k table) or 'ivf' (k-means buckets), used by nearest / farthest
+            knn_block_mb: memory budget of one [block,N] distance block, the block rows follow from it and N
+
+        methods:
+            partners(anchor_index, num): [bs, num] partner indices into the w set, O(1) per anchor
+    """
+    def __init__(self, w_set, y_set, pair_mode='random', knn_mode='exact', knn_k=16, ivf_bucket_num=None, knn_block_mb=256) -> None:
+
+        self._pair_mode = pair_mode
+        self._knn_mode = knn_mode
+        self._knn_k = knn_k
+        self._device = torch.device('cuda') if torch.cuda.is_available() else torch.device('cpu')
+
+        if y_set.dim() == 3:                                                                            #   one hot [N,8,10] --> [N]
+            labels = y_set[:, 0, :].argmax(dim=1)
+        elif y_set.dim() == 2:                                                                          #   [N,8] --> [N]
+            labels = y_set[:, 0]
+        else:
+            labels = y_set
+        self._set_num = len(labels)
+        self._block_size = max(1, int(knn_block_mb * 2**20) // (8 * self._set_num))                    #   float32 distances + their top-k / argmin temporaries
+        self._order, self._start, self._count, self._rank = self.__groupindex__(labels.long().cpu())
+        self._labels = labels.long().cpu()
+
+        if pair_mode in ['nearest', 'farthest']:
+            keys = w_set[:, 0, :] if w_set.dim() == 3 else w_set                                        #   [N,8,512] --> [N,512]
+            keys = keys.float().to(self._device)
+            if knn_mode == 'exact':
+                self._knn_table = self.__exactknn__(keys, largest = pair_mode == 'farthest')
+            elif knn_mode == 'ivf':
+                self.__ivfbuckets__(keys, ivf_bucket_num)
+            else:
+                raise Exception('please input valid knn_mode: exact or ivf')
+        elif pair_mode not in ['random', 'sameclass', 'diffclass']:
+            raise Exception('please input valid pair_mode')
+
+    def __groupindex__(self, group_ids, group_num=0):
+        """
+        Sort the set by group id so that every group is a contiguous slice of order[start[g] : start[g]+count[g]],
+        rank[i] is the position of sample i inside its group slice.
+        """
+        order = torch.argsort(group_ids)
+        count = torch.bincount(group_ids, minlength=group_num)
+        start = torch.cumsum(count, dim=0) - count
+        rank = torch.empty_like(order)
+        rank[order] = torch.arange(len(group_ids)) - start[group_ids[order]]
+        return order, start, count, rank
+
+    def __samplegroup__(self, groups, order, start, count):
+        offset = (torch.rand(len(groups)) * count[groups].float()).long()
+        return order[start[groups] + offset]
+
+    def __exactknn__(self, keys, largest):
+        sq_norm = (keys * keys).sum(dim=1)
+        k = min(self._knn_k, self._set_num - 1)
+        knn_table = []
+        for block_start in range(0, self._set_num, self._block_size):
+            block = keys[block_start : block_start + self._block_size]
+            dist = sq_norm[block_start : block_start + self._block_size].unsqueeze(1) - 2. * block @ keys.t() + sq_norm.unsqueeze(0)
+            self_index = torch.arange(block_start, block_start + len(block), device=keys.device)
+            dist[torch.arange(len(block), device=keys.device), self_index] = float('-inf') if largest else float('inf')
+            _, block_knn = torch.topk(dist, k, dim=1, largest=largest)
+            knn_table.append(block_knn.cpu())
+        return torch.cat(knn_table, dim=0)                                                              #   [N,k]
+
+    def __ivfbuckets__(self, keys, bucket_num, iter_num=10):
+        if bucket_num is None:
+            bucket_num = max(1, int(math.sqrt(self._set_num)))
+        centroids = keys[torch.randperm(self._set_num, device=keys.device)[:bucket_num]].clone()
+
+        for _ in range(iter_num):
+            assign = self.__assignbuckets__(keys, centroids)
+            sums = torch.zeros_like(centroids).index_add_(0, assign, keys)
+            sizes = torch.bincount(assign, minlength=len(centroids)).unsqueeze(1)
+            centroids = torch.where(sizes > 0, sums / sizes.clamp(min=1), centroids)
+
+        assign = self.__assignbuckets__(keys, centroids).cpu()
+        self._bucket = assign
+        self._bucket_order, self._bucket_start, self._bucket_count, self._bucket_rank = self.__groupindex__(assign, len(centroids))
+
+        #   the farthest non-empty bucket of every bucket
+        centroid_dist = torch.cdist(centroids, centroids).cpu()
+        centroid_dist[:, self._bucket_count == 0] = float('-inf')
+        self._far_bucket = centroid_dist.argmax(dim=1)
+
+    def __assignbuckets__(self, keys, centroids):
+        assign = []
+        for block_start in range(0, len(keys), self._block_size):
+            block = keys[block_start : block_start + self._block_size]
+            assign.append(torch.cdist(block, centroids).argmin(dim=1))
+        return torch.cat(assign)
+
+    def partners(self, anchor_index, num=1):
+        anchor_index = torch.as_tensor(anchor_index).long().cpu()
+        partner_index = []
+        for _ in range(num):
+            partner_index.append(self.__partner__(anchor_index))
+        return torch.stack(partner_index, dim=1)                                                        #   [bs,num]
+
+    def __partner__(self, anchor_index):
+        if self._pair_mode == 'random':
+            return torch.randint(self._set_num, (len(anchor_index),))
+
+        elif self._pair_mode == 'sameclass':
+            return self.__samplepeer__(anchor_index, self._labels[anchor_index], self._order, self._start, self._count, self._rank)
+
+        elif self._pair_mode == 'diffclass':
+            groups = self._labels[anchor_index]
+            other_num = self._set_num - self._count[groups]
+            if (other_num == 0).any():
+                raise Exception('diffclass pairing needs at least two classes')
+            offset = (torch.rand(len(anchor_index)) * other_num.float()).long()
+            offset = torch.where(offset >= self._start[groups], offset + self._count[groups], offset)     #   skip the anchor class slice
+            return self._order[offset]
+
+        elif self._knn_mode == 'exact':
+            column = torch.randint(self._knn_table.size(1), (len(anchor_index),))
+            return self._knn_table[anchor_index, column]
+
+        else:
+            buckets = self._bucket[anchor_index]
+            if self._pair_mode == 'farthest':
+                buckets = self._far_bucket[buckets]
+                return self.__samplegroup__(buckets, self._bucket_order, self._bucket_start, self._bucket_count)
+            return self.__samplepeer__(anchor_index, buckets, self._bucket_order, self._bucket_start, self._bucket_count, self._bucket_rank)
+
+    def __samplepeer__(self, anchor_index, groups, order, start, count, rank):
+        """
+        A sample of the anchor's own group (class or ivf bucket) other than the anchor, like the exact table which never
+        lists a sample as its own neighbour. An anchor alone in its group gets a random other sample.
+        """
+        peer_num = count[groups] - 1
+        offset = (torch.rand(len(anchor_index)) * peer_num.clamp(min=1).float()).long()
+        offset = torch.where(offset >= rank[anchor_index], offset + 1, offset)                          #   skip the anchor
+        peers = order[start[groups] + offset.clamp(max=count[groups] - 1)]
+        random_others = (anchor_index + 1 + torch.randint(max(1, self._set_num - 1), (len(anchor_index),))) % self._set_num
+        return torch.where(peer_num > 0, peers, random_others)
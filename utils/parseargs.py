@@ -143,6 +143,14 @@ def parse_arguments():
         parser_object.add_argument('--mixed_dataset', help='Projection result file', type=str, metavar='FILE',default = None)            
         # parser_object.add_argument('--generate_seeds', type=Optional[List[int]], help='List of random generate seeds')
         parser_object.add_argument('--generate_seeds', nargs='+', type=int, help='List of random generate seeds',default = None, )
+        parser_object.add_argument('--seed_class_idx', nargs='+', type=int, help='class label of every generate seed, or one label for all of them', default=None)
+        parser_object.add_argument('--gen_precision', help='autocast precision of generator inference', type=str, default='fp32', choices=['fp32','fp16','bf16'])
+        parser_object.add_argument('--gen_channels_last', action='store_true', help='channels_last generator weights for inference')
+        parser_object.add_argument('--gen_precision_tol', help='max abs pixel error against fp32 synthesis before falling back to fp32', type=float, default=0.02)
+        parser_object.add_argument('--gen_calibration_num', help='number of calibration images of the generator precision guard', type=int, default=8)
+        parser_object.add_argument('--gen_compile', action='store_true', help='trace G.synthesis with TorchScript and cache it on disk, eager synthesis is the fallback')
+        parser_object.add_argument('--gen_compile_dir', help='folder of the traced synthesis files, defaults to compiled-synthesis next to the generator pkl', type=str, default=None)
+        parser_object.add_argument('--generate_batch_size', type=int, help='micro batch size of seed generation', default=32)
         parser_object.add_argument('--projected_w_label', help='Projection result file', type=str, metavar='FILE',default = None)
         
         #-------------------------arguments for stylegan2ada interpolation-------------------------
@@ -158,6 +166,21 @@ def parse_arguments():
         parser_object.add_argument('--sample_mode', help='share alpha for projected_w.size(1) or not', type=str, default='betasampler',choices=['uniformsampler', 'uniformsampler2', 'bernoullisampler','bernoullisampler2', 'betasampler', 'dirichletsampler','bernoullisampler3'])
         parser_object.add_argument('--projected_dataset', help = 'The projected w dataset path of target png images to interpolate', type = str, default = None)
         parser_object.add_argument('--mix_img_num', help='number of the mixed images', type=int, default=None)
+        parser_object.add_argument('--projected_index', nargs='+', type=int, help='only interpolate these projected w indices', default=None)
+        parser_object.add_argument('--projected_classes', nargs='+', type=int, help='only interpolate projected w of these classes', default=None)
+        parser_object.add_argument('--pair_mode', help='how rmt picks mixing partners: shuffle inside the batch, or from the whole projected w set (rmt only)', type=str, default='batchshuffle', choices=['batchshuffle','random','sameclass','diffclass','nearest','farthest'])
+        parser_object.add_argument('--knn_mode', help='w-space neighbour index of nearest/farthest pair_mode', type=str, default='exact', choices=['exact','ivf'])
+        parser_object.add_argument('--knn_k', help='partners are drawn from the knn_k nearest/farthest projected w', type=int, default=16)
+        parser_object.add_argument('--ivf_bucket_num', help='number of k-means buckets of the ivf index, defaults to sqrt(N)', type=int, default=None)
+        parser_object.add_argument('--knn_block_mb', help='memory budget in MB of one distance block of the exact knn / ivf assignment, the block rows are derived from it and the set size', type=float, default=256)
+        parser_object.add_argument('--projected_cache_dir', help='folder of the packed projected w set, defaults to the projected_dataset folder', type=str, default=None)
+        parser_object.add_argument('--mix_pool', help='folder of the offline built mixed sample pool, built by interpolate mode or at the start of rmt (rmt only)', type=str, default=None)
+        parser_object.add_argument('--mix_pool_size', help='number of mixed samples in the mix pool, defaults to the projected w set size', type=int, default=None)
+        parser_object.add_argument('--mix_pool_shard_size', help='number of mixed samples per mix pool shard', type=int, default=10000)
+        parser_object.add_argument('--mix_pool_dtype', help='image dtype of the mix pool', type=str, default='uint8', choices=['uint8','float16'])
+        parser_object.add_argument('--mix_pool_in_memory', action='store_true', help='load the mix pool into memory instead of memory mapping it')
+        parser_object.add_argument('--mix_refresh_ratio', help='fraction of the mix pool regenerated every rmt epoch', type=float, default=0.0)
+        parser_object.add_argument('--mix_chunk_size', help='stream interpolate and generate this many samples at a time into npz shards, the shard folder can be passed as --mix_dataset', type=int, default=None)
         parser_object.add_argument('--beta_alpha', help='beta(alpha,alpha)', type=float, default=1)
         parser_object.add_argument('--dirichlet_gama', help='dirichlet(gama, gama)', type=float, default=1)
 
@@ -193,6 +216,35 @@ def parse_arguments():
         parser_object.add_argument('--train_adv_dataset_2', help='train_adv_dataset_2', type=str)      
 
         #-------------------------other arguments-------------------------
+        parser_object.add_argument('--sink_workers', help='writer threads of the asynchronous png/npz sink', type=int, default=4)
+        parser_object.add_argument('--sink_queue_size', help='pending writes of the asynchronous png/npz sink before saving blocks', type=int, default=64)
+        parser_object.add_argument('--sink_shard_size', help='pack generated npz files into shards of this many samples instead of one file per sample', type=int, default=None)
+        parser_object.add_argument('--metrics_format', help='run metrics file written next to the tensorboard event stream', type=str, default='csv', choices=['csv','jsonl'])
+        parser_object.add_argument('--metrics_flush_interval', help='seconds between batched metric writes', type=float, default=10.0)
+        parser_object.add_argument('--train_print_interval', help='print the training loss every n batches, each print synchronizes with the device', type=int, default=1)
+        parser_object.add_argument('--cla_amp', action='store_true', help='train the classifier with automatic mixed precision, fp16 with loss scaling on cuda and bf16 on cpu')
+        parser_object.add_argument('--device_dataset', action='store_true', help='materialize small train / test sets once and serve batches from device memory, pinned host memory if they do not fit')
+        parser_object.add_argument('--device_dataset_budget', help='fraction of the free device memory the resident train / test sets may take', type=float, default=0.5)
+        parser_object.add_argument('--robust_eval_subset', help='whitebox robust evaluation during defense training on a fixed stratified subset of this many test samples, default the whole testset', type=int, default=None)
+        parser_object.add_argument('--robust_eval_every', help='whitebox robust evaluation every n epochs of defense training, the last epoch is always evaluated', type=int, default=1)
+        parser_object.add_argument('--robust_eval_budget', help='instead of --robust_eval_every, evaluate whenever whitebox evaluation time stays within this fraction of the training time', type=float, default=None)
+        parser_object.add_argument('--robust_eval_warm_iter', help='whitebox evaluations during training start bim / pgd from the previous evaluation examples and run this many steps (fast tracking metric, needs --attack_engine torch)', type=int, default=None)
+        parser_object.add_argument('--robust_eval_calibrate_every', help='with --robust_eval_warm_iter, every n-th evaluation is a full-strength attack', type=int, default=5)
+        parser_object.add_argument('--attack_reference', action='store_true', help='whitebox attacks use the trained model itself instead of a shadow copy refreshed with its weights')
+        parser_object.add_argument('--attack_engine', help='adversarial example engine, torch runs fgsm / bim / pgd / cw natively on device tensors', type=str, default='art', choices=['art', 'torch'])
+        parser_object.add_argument('--attack_eps_step', help='step size of bim / pgd, default 0.1', type=float, default=None)
+        parser_object.add_argument('--attack_max_iter', help='iterations of bim / pgd (default 100) and of every cw binary search step (default 10)', type=int, default=None)
+        parser_object.add_argument('--attack_norm', help='norm of fgsm / pgd', type=str, default='inf', choices=['inf', '2'])
+        parser_object.add_argument('--attack_random_init', help='random restarts of fgsm / pgd, 0 starts from the clean input', type=int, default=0)
+        parser_object.add_argument('--attack_batch_size', help='samples per adversarial generation batch, defaults to the engine default (art 32 for fgsm / bim / pgd, torch 256)', type=int, default=None)
+        parser_object.add_argument('--adv_chunk_size', help='generate pixel adversarial examples in chunks of this many samples into a resumable sharded store', type=int, default=None)
+        parser_object.add_argument('--adv_shard_size', help='samples per npy shard of the adversarial store, default one shard', type=int, default=None)
+        parser_object.add_argument('--adv_store_dtype', help='image dtype of saved adversarial sets, uint8 quantizes over the value range of the set, int8delta stores int8 perturbations against the clean images', type=str, default='float32', choices=['float32', 'float16', 'uint8', 'int8delta'])
+        parser_object.add_argument('--cascade_attacks', help='comma separated pixel attacks from cheap to strong, e.g. fgsm,pgd,autoattack: the attack mode evaluates the clean testset under the cascade, each attack only on the survivors of the earlier ones', type=str, default=None)
+        parser_object.add_argument('--ckpt_keep_last', help='keep only the latest n epoch checkpoints of a training run, default keeps all', type=int, default=None)
+        parser_object.add_argument('--ckpt_step_interval', help='also overwrite the resume checkpoint every n training batches, 0 saves it only at epoch ends', type=int, default=0)
+        parser_object.add_argument('--resume', help='result dir of an interrupted training run, the run continues there from its resume-checkpoint.pkl', type=str, default=None)
+        parser_object.add_argument('--ckpt_keep_best', help='also keep the n epoch checkpoints with the best (adversarial) test accuracy', type=int, default=0)
         parser_object.add_argument('--img_size',type=int, default=32)
         parser_object.add_argument('--channels', type=int, default=1)
         parser_object.add_argument("--b1", type=float, default=0.5, help="adam: decay of first order momentum of gradient")    
@@ -239,6 +291,10 @@ def check_arguments(args):
 
 def set_exp_result_dir(args):
 
+    if args.resume is not None:
+        print("resume exp_result_dir:",args.resume)
+        return args.resume
+
     if args.seed == 0:
         save_path = args.save_path                                                                            
     else:
@@ -0,0 +1,41 @@
+"""
+Author: maggie
+Date:   2022-06-15
+Place:  Xidian University
+@copyright
+"""
+
+import click
+import utils.stylegan2ada.dnnlib as dnnlib
+import utils.stylegan2ada.legacy as legacy
+
+#----------------------------------------------------------------------------
+
+@click.command()
+@click.option('--source', help='Input network pickle', required=True, metavar='PATH')
+@click.option('--dest', help='Output slim G_ema folder', required=True, metavar='PATH')
+def export_slim_network(source, dest):
+    """Export the G_ema of a training snapshot pickle as a slim folder (G_ema.json + G_ema.pt).
+
+    The folder can be passed as --gen_network_pkl wherever the pickle was used.
+
+    Example:
+
+    \b
+    python -m utils.stylegan2ada.export_slim \\
+        --source=network-snapshot-005000.pkl \\
+        --dest=network-snapshot-005000-slim
+    """
+    print(f'Loading "{source}"...')
+    with dnnlib.util.open_url(source) as f:
+        G_ema = legacy.load_network_pkl(f)['G_ema']
+    print(f'Saving "{dest}"...')
+    legacy.save_network_slim(G_ema, dest)
+    print('Done.')
+
+#----------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    export_slim_network() # pylint: disable=no-value-for-parameter
+
+#----------------------------------------------------------------------------
@@ -10,6 +10,8 @@ import click
 import pickle
 import re
 import copy
+import os
+import json
 import numpy as np
 import torch
 
@@ -63,6 +65,42 @@ def load_network_pkl(f, force_fp16=False):
                 data[key] = new
     return data
 
+#----------------------------------------------------------------------------
+#   maggie add: slim G_ema-only format, a folder holding G_ema.json (constructor kwargs) and G_ema.pt (state_dict)
+
+def is_slim_network(path):
+    return isinstance(path, str) and os.path.isfile(os.path.join(path, 'G_ema.json'))
+
+def save_network_slim(G_ema, dest):
+    os.makedirs(dest, exist_ok=True)
+    with open(os.path.join(dest, 'G_ema.json'), 'w') as f:
+        json.dump(dict(init_args=list(G_ema.init_args), init_kwargs=G_ema.init_kwargs), f)
+    state_dict = {name: tensor.detach().cpu().contiguous() for name, tensor in G_ema.state_dict().items()}
+    torch.save(state_dict, os.path.join(dest, 'G_ema.pt'))
+
+def load_network_slim(path, device=torch.device('cpu')):
+    from utils.stylegan2ada.training import networks
+    with open(os.path.join(path, 'G_ema.json')) as f:
+        meta = json.load(f)
+    state_path = os.path.join(path, 'G_ema.pt')
+    try:
+        # Build on the meta device and adopt the memory-mapped tensors, no weight init and no copy.
+        with torch.device('meta'):
+            G_ema = networks.Generator(*meta['init_args'], **meta['init_kwargs'])
+        state_dict = torch.load(state_path, map_location='cpu', mmap=True, weights_only=True)
+        G_ema.load_state_dict(state_dict, assign=True)
+    except Exception: # older torch without meta device context / mmap / assign
+        G_ema = networks.Generator(*meta['init_args'], **meta['init_kwargs'])
+        G_ema.load_state_dict(torch.load(state_path, map_location='cpu'))
+    return G_ema.eval().requires_grad_(False).to(device)
+
+def load_generator(network_pkl, device=torch.device('cpu')):
+    """G_ema from a slim folder when available, otherwise from the legacy training snapshot pickle."""
+    if is_slim_network(network_pkl):
+        return load_network_slim(network_pkl, device)
+    with dnnlib.util.open_url(network_pkl) as f:
+        return load_network_pkl(f)['G_ema'].requires_grad_(False).to(device)
+
 #----------------------------------------------------------------------------
 
 class _TFNetworkStub(dnnlib.EasyDict):